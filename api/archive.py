@@ -0,0 +1,229 @@
+import bisect
+import json
+import os
+import uuid
+import zlib
+from datetime import timedelta
+from itertools import groupby
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import ChallengeLog
+
+
+# One entry per (session, block) pair in a day's .idx and .pending files
+INDEX_DTYPE = np.dtype([('session_id', 'S16'), ('offset', '<u8'), ('length', '<u4')])
+
+ARCHIVED_FIELDS = (
+    'id', 'session_id', 'challenge_type', 'challenge_data', 'response_data',
+    'passed', 'time_taken_ms', 'created_at',
+)
+
+
+class ChallengeLogArchive:
+    """
+    Append-only, per-day segment files holding archived challenge logs.
+
+    Each day has up to three files under ``root``:
+
+      YYYY-MM-DD.seg      zlib-compressed blocks of JSON lines, one row per line
+      YYYY-MM-DD.idx      fixed-size (session id, block offset, block length)
+                          records, sorted by session id
+      YYYY-MM-DD.pending  records of blocks appended since the day was last
+                          sealed, in append order
+
+    Rows in a block are sorted by session id, so the logs of one session are
+    usually in a single block and can be read back with one seek and one
+    decompression. Lookups bisect each day's sorted index and scan only its
+    pending records. Only one archiving job should write to a root at a time.
+    """
+
+    def __init__(self, root=None, block_rows=None):
+        config = settings.CHALLENGE_LOG_ARCHIVE
+        self.root = Path(root or config['ROOT'])
+        self.block_rows = block_rows or config['BLOCK_ROWS']
+
+    def days(self):
+        """
+        Return the archived days, oldest first, as YYYY-MM-DD strings.
+        """
+        if not self.root.is_dir():
+            return []
+        paths = [*self.root.glob('*.idx'), *self.root.glob('*.pending')]
+        return sorted({path.stem for path in paths})
+
+    def append(self, day, rows):
+        """
+        Append rows (dicts with ARCHIVED_FIELDS) to the segment of one day.
+
+        The segment is written and synced before the index, so a crash can
+        leave unindexed bytes at the end of a segment but never an index
+        entry pointing at missing data. Index entries are appended to the
+        day's pending records until the day is sealed (see seal), so each
+        append costs the same however much the day already holds.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        rows = sorted(rows, key=lambda row: (str(row['session_id']), row['id']))
+
+        index = []
+        with open(self.root / f"{day}.seg", 'ab') as segment:
+            offset = segment.seek(0, os.SEEK_END)
+            for start in range(0, len(rows), self.block_rows):
+                block_rows = rows[start:start + self.block_rows]
+                block = zlib.compress(b'\n'.join(_encode_row(row) for row in block_rows))
+                segment.write(block)
+
+                for session_id, _ in groupby(block_rows, key=lambda row: row['session_id']):
+                    index.append((_session_bytes(session_id), offset, len(block)))
+                offset += len(block)
+
+            segment.flush()
+            os.fsync(segment.fileno())
+
+        with open(self.root / f"{day}.pending", 'ab') as pending:
+            pending.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+            pending.flush()
+            os.fsync(pending.fileno())
+
+    def seal(self, day):
+        """
+        Merge a day's pending index records into its sorted index.
+
+        The merged index is synced and renamed into place before the pending
+        records are removed, so a crash in between only leaves records that
+        are merged twice, for blocks that lookups read once.
+        """
+        pending_path = self.root / f"{day}.pending"
+        if not pending_path.exists():
+            return
+
+        index_path = self.root / f"{day}.idx"
+        parts = [np.fromfile(pending_path, dtype=INDEX_DTYPE)]
+        if index_path.exists():
+            parts.insert(0, np.fromfile(index_path, dtype=INDEX_DTYPE))
+        index = np.concatenate(parts)
+        index = index[np.argsort(index['session_id'], kind='stable')]
+
+        tmp_path = self.root / f".{day}.idx.tmp"
+        with open(tmp_path, 'wb') as index_file:
+            index_file.write(index.tobytes())
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(tmp_path, index_path)
+        pending_path.unlink()
+
+    def get_session_logs(self, session_id, days=None):
+        """
+        Return the archived logs of one session, oldest first.
+
+        Args:
+            session_id: Session UUID (or its string form)
+            days: Days to search; all archived days when None
+        """
+        key = _session_bytes(session_id)
+        session_str = str(uuid.UUID(bytes=key))
+        # Session ids come out of the index without trailing NUL bytes
+        index_key = key.rstrip(b'\0')
+        logs = {}
+
+        for day in days or self.days():
+            matches = [*self._sealed_records(day, index_key), *self._pending_records(day, key)]
+            if not matches:
+                continue
+
+            with open(self.root / f"{day}.seg", 'rb') as segment:
+                for offset, length in sorted({(int(m['offset']), int(m['length'])) for m in matches}):
+                    segment.seek(offset)
+                    for line in zlib.decompress(segment.read(length)).split(b'\n'):
+                        row = json.loads(line)
+                        if row['session_id'] == session_str:
+                            # A run interrupted between writing and deleting
+                            # archives the same rows twice; keep one copy
+                            logs[row['id']] = row
+
+        return sorted(logs.values(), key=lambda row: (row['created_at'], row['id']))
+
+    def _sealed_records(self, day, index_key):
+        index_path = self.root / f"{day}.idx"
+        if not index_path.exists() or not index_path.stat().st_size:
+            return []
+
+        # Bisected in place, so only the pages it touches are read
+        session_ids = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r')['session_id']
+        start = bisect.bisect_left(session_ids, index_key)
+        end = bisect.bisect_right(session_ids, index_key, lo=start)
+        if start == end:
+            return []
+        return np.fromfile(index_path, dtype=INDEX_DTYPE, count=end - start, offset=start * INDEX_DTYPE.itemsize)
+
+    def _pending_records(self, day, key):
+        pending_path = self.root / f"{day}.pending"
+        if not pending_path.exists():
+            return []
+        pending = np.fromfile(pending_path, dtype=INDEX_DTYPE)
+        return pending[pending['session_id'] == key]
+
+
+def _session_bytes(session_id):
+    if isinstance(session_id, uuid.UUID):
+        return session_id.bytes
+    return uuid.UUID(str(session_id)).bytes
+
+
+def _encode_row(row):
+    row = dict(row, session_id=str(row['session_id']), created_at=row['created_at'].isoformat())
+    return json.dumps(row, separators=(',', ':')).encode()
+
+
+def archive_challenge_logs(older_than_days=None, batch_size=None, archive=None, dry_run=False):
+    """
+    Move challenge logs older than the retention period into the archive.
+
+    Rows are taken oldest first in batches through the created_at index. Each
+    batch is appended to the day segments and then deleted from the table in
+    the same transaction, so the table never loses rows that are not yet on
+    disk. A day's index is sealed once the batches have moved past it, and
+    the last day when the run ends.
+
+    Yields:
+        int: Number of rows archived by each batch
+    """
+    config = settings.CHALLENGE_LOG_ARCHIVE
+    if older_than_days is None:
+        older_than_days = config['RETENTION_DAYS']
+    batch_size = batch_size or config['BATCH_SIZE']
+    archive = archive or ChallengeLogArchive()
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+
+    queryset = ChallengeLog.objects.filter(created_at__lt=cutoff).order_by('created_at', 'id')
+
+    if dry_run:
+        yield queryset.count()
+        return
+
+    unsealed = set()
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.values(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                break
+
+            for day, day_rows in groupby(rows, key=lambda row: row['created_at'].date().isoformat()):
+                archive.append(day, list(day_rows))
+                unsealed.add(day)
+            ChallengeLog.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+        yield len(rows)
+
+        # Rows come oldest first, so earlier days get no more rows in this run
+        last_day = rows[-1]['created_at'].date().isoformat()
+        for day in sorted(unsealed - {last_day}):
+            archive.seal(day)
+        unsealed &= {last_day}
+
+    for day in unsealed:
+        archive.seal(day)
@@ -0,0 +1,252 @@
+import contextlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db.models import BinaryField, ExpressionWrapper, F
+from django.utils import timezone
+
+from api.challenge_logic.behavior import STREAM_FIELDS
+from api.challenge_logic.scoring import ScoringEngine
+from api.codec import decode_payload
+from api.feature_store import log_features
+from api.model_registry import ModelRegistry, get_model, load_models
+from api.models import ChallengeLog
+from api.routers import use_replica
+
+
+# Log fields read by the query; the fingerprint is joined in. Payloads are
+# read undecoded and decoded by the workers.
+LOG_FIELDS = {
+    'id': 'id',
+    'challenge_type': 'challenge_type',
+    'passed': 'passed',
+    'time_taken_ms': 'time_taken_ms',
+    'features': 'features',
+    'feature_version': 'feature_version',
+    'challenge_raw': 'challenge_raw',
+    'response_raw': 'response_raw',
+    'browser': 'session__fingerprint__browser',
+    'os': 'session__fingerprint__os',
+    'headless': 'session__fingerprint__headless',
+    'entropy_score': 'session__fingerprint__entropy_score',
+}
+
+# Fingerprint fields attempts can be grouped by, besides challenge_type
+COHORTS = ('browser', 'os', 'headless', 'entropy')
+
+# Equal-width buckets of the fingerprint entropy score for the 'entropy' cohort
+ENTROPY_BUCKETS = 5
+
+# Counters kept per challenge type and cohort
+COUNTS = ('attempts', 'logged_passed', 'baseline_passed', 'candidate_passed', 'newly_passed', 'newly_failed')
+
+
+class ScorerConfig:
+    """
+    A scorer configuration to replay logs through: the component weights,
+    the pass threshold, and optionally a registered model blended in by
+    ``model_weight`` (see ScoringEngine.apply_model_score).
+    """
+
+    def __init__(self, weights=None, fail_threshold=None, model_version=None, model_weight=None):
+        engine = ScoringEngine()
+        unknown = set(weights or ()) - set(engine.weights)
+        if unknown:
+            raise ValueError(f"Unknown scoring weights: {', '.join(sorted(unknown))}")
+
+        self.weights = {**engine.weights, **(weights or {})}
+        self.fail_threshold = engine.FAIL_THRESHOLD if fail_threshold is None else fail_threshold
+        self.model_version = model_version
+        self.model_weight = settings.MODEL_REGISTRY['MODEL_WEIGHT'] if model_weight is None else model_weight
+
+    @classmethod
+    def current(cls):
+        """
+        The configuration requests are scored with now, including the
+        published live model.
+        """
+        load_models()
+        model = get_model('live')
+        return cls(model_version=model.version if model else None)
+
+    def describe(self):
+        weights = ', '.join(f"{name}={weight:g}" for name, weight in self.weights.items())
+        model = f"model {self.model_version} at weight {self.model_weight:g}" if self.model_version else 'no model'
+        return f"weights {weights}; fail threshold {self.fail_threshold:g}; {model}"
+
+
+_models = {}
+
+
+def _load_model(version):
+    # Loaded once per worker process
+    if version not in _models:
+        _models[version] = ModelRegistry().load(version)
+    return _models[version]
+
+
+def _cohort_keys(rows, cohort):
+    if cohort == 'entropy':
+        keys = []
+        for row in rows:
+            score = row['entropy_score']
+            if score is None:
+                keys.append('unknown')
+                continue
+            bucket = min(max(int(score * ENTROPY_BUCKETS + 1e-9), 0), ENTROPY_BUCKETS - 1)
+            keys.append(f"{bucket / ENTROPY_BUCKETS:.1f}-{(bucket + 1) / ENTROPY_BUCKETS:.1f}")
+        return keys
+    return ['unknown' if row[cohort] is None else str(row[cohort]) for row in rows]
+
+
+def score_chunk(rows, baseline, candidate, cohorts):
+    """
+    Replay a chunk of log rows through two scorer configurations.
+
+    Runs in a worker process. Component scores are computed once per log and
+    weighted for each configuration; stored feature vectors are used where
+    current. Only the challenge score is replayed: the reputation prior, IP
+    risk and replay penalties depend on state at the time of the attempt
+    and are left out of both configurations alike.
+
+    Returns:
+        tuple: ({dimension: {value: counts in COUNTS order}}, number of logs
+        whose features had to be recomputed)
+    """
+    engine = ScoringEngine()
+    challenge_field = ChallengeLog._meta.get_field('challenge_data')
+    features, recomputed = log_features(rows)
+
+    components = np.empty((len(rows), len(engine.weights)))
+    # Interned challenge strings are resolved from the replica when
+    # configured; some challenge scorers print diagnostics for every attempt
+    with use_replica(), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i, row in enumerate(rows):
+            challenge_data = challenge_field.to_python(row['challenge_raw'])
+            response_data = decode_payload(row['response_raw'], stream_columns=STREAM_FIELDS.keys())
+            # Scored with the time the attempt was logged with
+            response_data['time_taken_ms'] = row['time_taken_ms']
+            scores = engine.calculate_component_scores(
+                challenge_data, response_data, response_data.get('behavior_data') or {}, features[i]
+            )
+            components[i] = [scores[name] for name in engine.weights]
+
+    time_taken_ms = [row['time_taken_ms'] for row in rows]
+    entropy_scores = [row['entropy_score'] for row in rows]
+    probabilities = {}
+    passed = []
+    for config in (baseline, candidate):
+        scores = np.clip(components @ np.array([config.weights[name] for name in engine.weights]), 0, 1)
+        if config.model_version:
+            if config.model_version not in probabilities:
+                model = _load_model(config.model_version)
+                probabilities[config.model_version] = model.predict(features, time_taken_ms, entropy_scores)
+            # As ScoringEngine.apply_model_score, for the whole chunk
+            weight = config.model_weight
+            scores = np.clip((1 - weight) * scores + weight * probabilities[config.model_version], 0, 1)
+        passed.append(scores >= config.fail_threshold)
+
+    baseline_passed, candidate_passed = passed
+    flags = np.column_stack((
+        np.ones(len(rows), dtype=bool),
+        [row['passed'] for row in rows],
+        baseline_passed,
+        candidate_passed,
+        candidate_passed & ~baseline_passed,
+        baseline_passed & ~candidate_passed,
+    )).astype(np.int64)
+
+    totals = {}
+    for dimension in ('challenge_type',) + tuple(cohorts):
+        keys = [row['challenge_type'] for row in rows] if dimension == 'challenge_type' else _cohort_keys(rows, dimension)
+        values, groups = np.unique(keys, return_inverse=True)
+        counts = np.zeros((len(values), len(COUNTS)), dtype=np.int64)
+        np.add.at(counts, groups, flags)
+        totals[dimension] = dict(zip(values.tolist(), counts))
+    return totals, len(recomputed)
+
+
+def iter_chunks(chunk_size, days=None, challenge_type=None):
+    """
+    Yield lists of log rows, in id order, streamed from the database.
+    """
+    queryset = ChallengeLog.objects.order_by('id').annotate(
+        challenge_raw=ExpressionWrapper(F('challenge_data'), output_field=BinaryField()),
+        response_raw=ExpressionWrapper(F('response_data'), output_field=BinaryField()),
+    )
+    if days is not None:
+        queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=days))
+    if challenge_type is not None:
+        queryset = queryset.filter(challenge_type=challenge_type)
+
+    chunk = []
+    for row in queryset.values(*LOG_FIELDS.values()).iterator(chunk_size=chunk_size):
+        row = {name: row[field] for name, field in LOG_FIELDS.items()}
+        # Some backends return binary columns as memoryviews, which cannot
+        # be sent to worker processes
+        for name in ('features', 'challenge_raw', 'response_raw'):
+            if row[name] is not None:
+                row[name] = bytes(row[name])
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_backtest(candidate, baseline=None, cohorts=COHORTS, chunk_size=20000, workers=None,
+                 days=None, challenge_type=None):
+    """
+    Replay historical challenge logs through a candidate scorer configuration
+    and compare its pass decisions with a baseline (by default the current
+    configuration, see ScorerConfig.current).
+
+    Chunks are scored in a pool of worker processes, at most two per worker
+    in flight so memory stays bounded; with a single worker they are scored
+    in this process.
+
+    Yields:
+        tuple: (logs replayed so far, logs with recomputed features so far,
+        running totals as {dimension: {value: counts in COUNTS order}}),
+        after each chunk
+    """
+    baseline = baseline or ScorerConfig.current()
+    workers = workers or os.cpu_count()
+    replayed = recomputed = 0
+    totals = {}
+
+    def merge(result):
+        nonlocal replayed, recomputed
+        chunk_totals, chunk_recomputed = result
+        for dimension, groups in chunk_totals.items():
+            merged = totals.setdefault(dimension, {})
+            for value, counts in groups.items():
+                merged[value] = merged.get(value, 0) + counts
+        replayed += int(sum(counts[0] for counts in chunk_totals['challenge_type'].values()))
+        recomputed += chunk_recomputed
+        return replayed, recomputed, totals
+
+    chunks = iter_chunks(chunk_size, days=days, challenge_type=challenge_type)
+    if workers == 1:
+        for chunk in chunks:
+            yield merge(score_chunk(chunk, baseline, candidate, cohorts))
+        return
+
+    # Spawned workers do not inherit the database connection, and set Django
+    # up before the chunks (and this module) are unpickled
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk, baseline, candidate, cohorts))
+            if len(pending) >= 2 * workers:
+                yield merge(pending.popleft().result())
+        while pending:
+            yield merge(pending.popleft().result())
@@ -0,0 +1,196 @@
+import json
+import math
+import re
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+# Event arrays in behavior_data that are decoded into columns, with their fields
+# in the order tracker.js emits them
+STREAM_FIELDS = {
+    'mouse_movements': ('x', 'y', 'timestamp'),
+    'keystroke_timings': ('timestamp',),
+}
+
+_ARRAY_START_RE = re.compile(rb'\s*:\s*\[')
+_WHITESPACE = b' \t\r\n'
+_NUMBER_CHARS = b'0123456789.-'
+_STRUCTURE_CHARS = bytes(c for c in range(256) if c not in b'0123456789.-,')
+
+
+def _reject_constant(name):
+    raise ValueError(f"Invalid number {name}")
+
+
+def _loads(raw):
+    # NaN and Infinity are not JSON, though the stdlib decoder accepts them by default
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw, parse_constant=_reject_constant)
+
+
+class EventStream:
+    """
+    A behavior event array stored as columns in a preallocated float64 buffer.
+
+    The buffer is sized for ``length`` events (when known up front) but never
+    more than ``capacity``; events beyond that are dropped and ``truncated``
+    is set.
+    """
+
+    def __init__(self, fields, capacity, length=None):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.size = 0
+        self.truncated = False
+        rows = capacity if length is None else min(length, capacity)
+        self._data = np.empty((rows, len(self.fields)), dtype=np.float64)
+
+    def __len__(self):
+        return self.size
+
+    def column(self, field):
+        """
+        Return a read-only view of one field for all decoded events.
+        """
+        view = self._data[:self.size, self.fields.index(field)]
+        view.flags.writeable = False
+        return view
+
+    def extend(self, values):
+        """
+        Append rows from a 2-D array with one column per field.
+        """
+        room = len(self._data) - self.size
+        if len(values) > room:
+            values = values[:room]
+            self.truncated = True
+        self._data[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def to_list(self):
+        """
+        Return the events as a list of dicts, as sent by the client.
+        """
+        return [
+            {field: value.item() for field, value in zip(self.fields, row)}
+            for row in self._data[:self.size]
+        ]
+
+    @classmethod
+    def from_columns(cls, columns, fields):
+        """
+        Build a stream from a dict of equal-length columns, as decode_payload
+        returns for ``stream_columns``. Only for payloads this service
+        encoded; client data goes through from_events or decode_event_array.
+        """
+        data = np.column_stack([np.asarray(columns[field], dtype=np.float64) for field in fields])
+        stream = cls(fields, len(data), length=len(data))
+        stream.extend(data)
+        return stream
+
+    @classmethod
+    def from_events(cls, events, fields, capacity):
+        """
+        Build a stream from already-decoded event dicts, skipping malformed
+        events and events with non-finite values.
+        """
+        if not isinstance(events, list):
+            raise ValueError('Expected a list of events')
+        stream = cls(fields, capacity, length=len(events))
+
+        row = 0
+        for event in events:
+            if row == len(stream._data):
+                stream.truncated = True
+                break
+            try:
+                values = [float(event[field]) for field in fields]
+            except (KeyError, TypeError, ValueError):
+                continue
+            # float() accepts "nan" and "inf"
+            if not all(map(math.isfinite, values)):
+                continue
+            stream._data[row] = values
+            row += 1
+        stream.size = row
+        return stream
+
+
+def event_columns(events, fields):
+    """
+    Return one float64 array per field for an EventStream or a list of event dicts.
+    """
+    if isinstance(events, EventStream):
+        return [events.column(field) for field in fields]
+    data = np.array([[event[field] for field in fields] for event in events], dtype=np.float64)
+    data = data.reshape(len(events), len(fields))
+    return [data[:, i] for i in range(len(fields))]
+
+
+def decode_event_array(raw, fields, capacity):
+    """
+    Decode the raw JSON bytes of one event array straight into an EventStream.
+
+    Arrays in the exact shape tracker.js produces (objects with only the given
+    numeric fields, in order) are decoded by numpy without creating a Python
+    object per event. Anything else goes through the regular JSON decoder.
+
+    Raises:
+        ValueError: If ``raw`` is not a JSON array
+    """
+    compact = raw.translate(None, _WHITESPACE)
+    count = compact.count(b'{')
+
+    template = b'{' + b','.join(b'"%s":' % field.encode() for field in fields) + b'}'
+    skeleton = b'[' + b','.join([template] * count) + b']'
+
+    if compact.translate(None, _NUMBER_CHARS) == skeleton:
+        # Only the keys and punctuation are non-numeric, so dropping every
+        # other character leaves "x,y,timestamp,x,y,timestamp,...",
+        # which the JSON decoder validates as an array of numbers
+        numbers = compact.translate(None, _STRUCTURE_CHARS)
+        try:
+            values = np.array(_loads(b'[' + numbers + b']'), dtype=np.float64)
+        except (ValueError, TypeError, OverflowError):
+            values = None
+
+        # Numbers too long for a float64 overflow to infinity
+        if values is not None and values.size == count * len(fields) and np.isfinite(values).all():
+            stream = EventStream(fields, capacity, length=count)
+            stream.extend(values.reshape(count, len(fields)))
+            return stream
+
+    return EventStream.from_events(_loads(raw), fields, capacity)
+
+
+def find_event_arrays(raw):
+    """
+    Locate the event arrays named in STREAM_FIELDS in a raw JSON body.
+
+    Only arrays whose key occurs exactly once in the body are returned, so the
+    caller can splice them out and confirm where they were after parsing.
+
+    Returns:
+        dict: Array name to (start, end) byte offsets of the array, brackets included
+    """
+    spans = {}
+    for name in STREAM_FIELDS:
+        key = b'"%s"' % name.encode()
+        if raw.count(key) != 1:
+            continue
+
+        match = _ARRAY_START_RE.match(raw, raw.find(key) + len(key))
+        if match is None:
+            continue
+
+        start = match.end() - 1
+        end = raw.find(b']', start)
+        if end != -1:
+            spans[name] = (start, end + 1)
+    return spans
@@ -0,0 +1,189 @@
+import numpy as np
+
+from api.challenge_logic.behavior import STREAM_FIELDS, EventStream
+
+
+# Bumped whenever a feature is added, removed, reordered or computed
+# differently, so vectors (and models trained on them) from another version
+# are never mixed with these
+FEATURE_VERSION = 2
+
+# Order of the features in every vector
+FEATURE_NAMES = (
+    'mouse_movements_count',        # mouse events
+    'mouse_moving_steps',           # steps between consecutive events with elapsed time
+    'mouse_speed_mean',             # px/ms over moving steps
+    'mouse_speed_std',
+    'mouse_speed_max',
+    'mouse_interval_mean',          # ms between events, over moving steps
+    'mouse_interval_std',
+    'mouse_angle_change_mean',      # radians between consecutive moving steps
+    'mouse_angle_change_std',
+    'mouse_angle_change_max',
+    'mouse_direction_change_rate',  # angle changes above DIRECTION_CHANGE per moving step
+    'keystroke_count',
+    'keystroke_interval_mean',      # ms between consecutive key events
+    'keystroke_interval_std',
+)
+
+FEATURE_INDEX = {name: index for index, name in enumerate(FEATURE_NAMES)}
+
+# Stored vectors are the raw little-endian float32 values, in FEATURE_NAMES order
+FEATURE_DTYPE = np.dtype('<f4')
+
+# Angle change (radians, about 17 degrees) counted as a change of direction
+DIRECTION_CHANGE = 0.3
+
+
+def stream_columns(behavior_data, name):
+    """
+    Return one float64 array per field of a behavior stream: an EventStream
+    or a list of event dicts (malformed events are skipped). Anything else
+    counts as empty.
+
+    Events with a non-finite value are dropped, whatever the format, so a
+    NaN or infinity can never turn a statistic (and the vector) into NaN.
+    """
+    fields = STREAM_FIELDS[name]
+    events = behavior_data.get(name)
+    if isinstance(events, EventStream):
+        columns = [events.column(field) for field in fields]
+    else:
+        rows = []
+        for event in events if isinstance(events, list) else []:
+            try:
+                rows.append([float(event[field]) for field in fields])
+            except (KeyError, TypeError, ValueError):
+                continue
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), len(fields))
+        columns = [data[:, i] for i in range(len(fields))]
+
+    finite = np.isfinite(columns[0])
+    for column in columns[1:]:
+        finite &= np.isfinite(column)
+    if not finite.all():
+        columns = [column[finite] for column in columns]
+    return columns
+
+
+def _concat(chunks):
+    """
+    Concatenate per-trace arrays into one array, returning it with the index
+    of the trace each value came from.
+    """
+    lengths = np.array([len(chunk) for chunk in chunks], dtype=np.int64)
+    values = np.concatenate(chunks) if chunks else np.empty(0)
+    return values, np.repeat(np.arange(len(chunks)), lengths)
+
+
+def _grouped_stats(values, groups, count):
+    """
+    Per-group count, and mean, population standard deviation and max of each
+    column of ``values`` (one row per value), NaN for empty groups.
+    ``groups`` must be in increasing order.
+    """
+    n = np.bincount(groups, minlength=count)
+    nonempty = n > 0
+    mean, std, maximum = np.full((3, count, values.shape[1]), np.nan)
+    if len(values):
+        # Each group's values are contiguous, so they reduce in one pass
+        starts = (np.cumsum(n) - n)[nonempty]
+        sizes = n[nonempty, None]
+        mean[nonempty] = np.add.reduceat(values, starts) / sizes
+        deviations = values - mean[groups]
+        std[nonempty] = np.sqrt(np.add.reduceat(deviations * deviations, starts) / sizes)
+        maximum[nonempty] = np.maximum.reduceat(values, starts)
+    return n, mean, std, maximum
+
+
+def extract_features_batch(behavior_data_list):
+    """
+    Compute the feature vectors of many behavior traces at once.
+
+    The streams of all traces are concatenated, so each feature is a handful
+    of NumPy operations over the whole batch rather than a loop per event.
+    Statistics over no values (no moving steps, fewer than two key events)
+    are NaN; counts are 0.
+
+    Args:
+        behavior_data_list: behavior_data dicts; anything else counts as empty
+
+    Returns:
+        numpy.ndarray: float32 array of shape (traces, len(FEATURE_NAMES))
+    """
+    count = len(behavior_data_list)
+    mouse = [[], [], []]
+    keystrokes = []
+    for behavior_data in behavior_data_list:
+        if not isinstance(behavior_data, dict):
+            behavior_data = {}
+        for column, values in zip(mouse, stream_columns(behavior_data, 'mouse_movements')):
+            column.append(values)
+        keystrokes.append(stream_columns(behavior_data, 'keystroke_timings')[0])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Mouse: steps between consecutive events of the same trace, keeping
+        # those with elapsed time
+        x, groups = _concat(mouse[0])
+        y, _ = _concat(mouse[1])
+        timestamps, _ = _concat(mouse[2])
+        dt = np.diff(timestamps)
+        moving = (groups[1:] == groups[:-1]) & (dt > 0)
+        dx, dy, dt = np.diff(x)[moving], np.diff(y)[moving], dt[moving]
+        step_groups = groups[1:][moving]
+        steps, step_mean, step_std, step_max = _grouped_stats(
+            np.column_stack((np.hypot(dx, dy) / dt, dt)), step_groups, count
+        )
+
+        # Direction changes between consecutive moving steps of the same trace
+        turn = step_groups[1:] == step_groups[:-1]
+        changes = np.abs(np.diff(np.arctan2(dy, dx)))[turn]
+        changes = np.where(changes > np.pi, 2 * np.pi - changes, changes)
+        turn_groups = step_groups[1:][turn]
+        _, turn_mean, turn_std, turn_max = _grouped_stats(changes[:, None], turn_groups, count)
+        direction_changes = np.bincount(turn_groups[changes > DIRECTION_CHANGE], minlength=count)
+
+        # Keystrokes: intervals between consecutive key events of the same trace
+        key_times, key_groups = _concat(keystrokes)
+        same_trace = key_groups[1:] == key_groups[:-1]
+        _, key_mean, key_std, _ = _grouped_stats(
+            np.diff(key_times)[same_trace, None], key_groups[1:][same_trace], count
+        )
+
+        # In FEATURE_NAMES order
+        return np.column_stack((
+            np.bincount(groups, minlength=count),
+            steps,
+            step_mean[:, 0], step_std[:, 0], step_max[:, 0],
+            step_mean[:, 1], step_std[:, 1],
+            turn_mean[:, 0], turn_std[:, 0], turn_max[:, 0],
+            direction_changes / steps,
+            np.bincount(key_groups, minlength=count),
+            key_mean[:, 0], key_std[:, 0],
+        )).astype(np.float32)
+
+
+def extract_features(behavior_data):
+    """
+    Compute the feature vector of one behavior trace (see extract_features_batch).
+
+    Returns:
+        numpy.ndarray: float32 array of length len(FEATURE_NAMES)
+    """
+    return extract_features_batch([behavior_data])[0]
+
+
+def pack_features(features):
+    """
+    Return a feature vector as the fixed-width bytes stored with challenge logs.
+    """
+    return np.asarray(features, dtype=FEATURE_DTYPE).tobytes()
+
+
+def unpack_features(blobs):
+    """
+    Turn stored feature vectors (see pack_features) back into a float32
+    array of shape (len(blobs), len(FEATURE_NAMES)).
+    """
+    data = np.frombuffer(b''.join(blobs), dtype=FEATURE_DTYPE)
+    return data.reshape(len(blobs), len(FEATURE_NAMES)).astype(np.float32)
@@ -21,9 +21,78 @@ class ChallengeGenerator:
         'semantic-grouping'
     ]
 
+    # Since we don't have actual audio files, we'll use a text-based fallback
+    # In a production environment, you would use real audio files
+    AUDIO_OPTIONS = [
+        {
+            'word': 'apple',
+            'file': 'apple.txt',
+            'options': ['apple', 'orange', 'banana', 'grape'],
+            'description': 'A common red or green fruit with a crisp texture'
+        },
+        {
+            'word': 'seven',
+            'file': 'seven.txt',
+            'options': ['seven', 'eleven', 'three', 'nine'],
+            'description': 'A number between six and eight'
+        },
+        {
+            'word': 'blue',
+            'file': 'blue.txt',
+            'options': ['blue', 'red', 'green', 'yellow'],
+            'description': 'The color of the sky on a clear day'
+        },
+        {
+            'word': 'dog',
+            'file': 'dog.txt',
+            'options': ['dog', 'cat', 'bird', 'fish'],
+            'description': 'A common pet that barks'
+        },
+        {
+            'word': 'piano',
+            'file': 'piano.txt',
+            'options': ['piano', 'guitar', 'drums', 'violin'],
+            'description': 'A musical instrument with black and white keys'
+        },
+        {
+            'word': 'car',
+            'file': 'car.txt',
+            'options': ['car', 'bus', 'train', 'bike'],
+            'description': 'A four-wheeled vehicle for personal transportation'
+        }
+    ]
+
+    # Audio files already known to exist, shared by all instances in a process
+    _prepared_audio_files = set()
+
     def __init__(self):
         self.templates_dir = Path(settings.BASE_DIR) / 'frontend' / 'static' / 'challenges'
 
+    def prepare_corpora(self):
+        """
+        Create every on-disk challenge asset up front instead of on first use.
+        """
+        for audio in self.AUDIO_OPTIONS:
+            self._ensure_audio_file(audio)
+
+    def _ensure_audio_file(self, audio):
+        """
+        Create the text stand-in for an audio clip if it doesn't exist yet.
+        """
+        if audio['file'] in self._prepared_audio_files:
+            return
+
+        audio_file_path = self.templates_dir / 'audio' / audio['file']
+        if not audio_file_path.exists():
+            try:
+                with open(audio_file_path, 'w') as f:
+                    f.write(audio['description'])
+            except Exception as e:
+                print(f"Error creating audio text file: {e}")
+                return
+
+        self._prepared_audio_files.add(audio['file'])
+
     def get_random_challenge(self):
         """
         Returns a random challenge from the available types.
@@ -706,65 +775,16 @@ class ChallengeGenerator:
         """
         Generate a challenge where users identify spoken words or sounds.
         """
-        # Since we don't have actual audio files, we'll use a text-based fallback
-        # In a production environment, you would use real audio files
-        audio_options = [
-            {
-                'word': 'apple',
-                'file': 'apple.txt',
-                'options': ['apple', 'orange', 'banana', 'grape'],
-                'description': 'A common red or green fruit with a crisp texture'
-            },
-            {
-                'word': 'seven',
-                'file': 'seven.txt',
-                'options': ['seven', 'eleven', 'three', 'nine'],
-                'description': 'A number between six and eight'
-            },
-            {
-                'word': 'blue',
-                'file': 'blue.txt',
-                'options': ['blue', 'red', 'green', 'yellow'],
-                'description': 'The color of the sky on a clear day'
-            },
-            {
-                'word': 'dog',
-                'file': 'dog.txt',
-                'options': ['dog', 'cat', 'bird', 'fish'],
-                'description': 'A common pet that barks'
-            },
-            {
-                'word': 'piano',
-                'file': 'piano.txt',
-                'options': ['piano', 'guitar', 'drums', 'violin'],
-                'description': 'A musical instrument with black and white keys'
-            },
-            {
-                'word': 'car',
-                'file': 'car.txt',
-                'options': ['car', 'bus', 'train', 'bike'],
-                'description': 'A four-wheeled vehicle for personal transportation'
-            }
-        ]
-
-        selected_audio = random.choice(audio_options)
+        selected_audio = random.choice(self.AUDIO_OPTIONS)
 
         # Create a text file with the description if it doesn't exist
-        audio_dir = Path(settings.BASE_DIR) / 'frontend' / 'static' / 'challenges' / 'audio'
-        audio_file_path = audio_dir / selected_audio['file']
-
-        if not audio_file_path.exists():
-            try:
-                with open(audio_file_path, 'w') as f:
-                    f.write(selected_audio['description'])
-            except Exception as e:
-                print(f"Error creating audio text file: {e}")
+        self._ensure_audio_file(selected_audio)
 
         challenge_data = {
             'type': 'audio-captcha',
             'entropy': entropy,
             'audio_file': f"/static/challenges/audio/{selected_audio['file']}",
-            'options': selected_audio['options'],
+            'options': list(selected_audio['options']),
             'instruction': "AUDIO SIMULATION: " + selected_audio['description'] + ". Select the word being described:",
             'answer': selected_audio['word']  # This will be removed before sending to client
         }
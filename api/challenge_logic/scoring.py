@@ -2,6 +2,8 @@ import math
 import numpy as np
 from django.conf import settings
 
+from api.challenge_logic.features import FEATURE_INDEX, extract_features
+
 
 class ScoringEngine:
     """
@@ -11,6 +13,9 @@ class ScoringEngine:
     # Threshold for failing a challenge
     FAIL_THRESHOLD = 0.65
 
+    # Passive behavior needed before a session can skip the challenge
+    MIN_PASSIVE_MOUSE_EVENTS = 20
+
     def __init__(self):
         # Weights for different scoring components
         self.weights = {
@@ -19,7 +24,13 @@ class ScoringEngine:
             'response_time': 0.3
         }
 
-    def calculate_trust_score(self, challenge_data, response_data, behavior_data):
+        # Weights for the passive (pre-challenge) score
+        self.passive_weights = {
+            'fingerprint': 0.4,
+            'entropy': 0.6
+        }
+
+    def calculate_trust_score(self, challenge_data, response_data, behavior_data, features=None):
         """
         Calculate a trust score based on challenge response and behavior.
 
@@ -27,13 +38,27 @@ class ScoringEngine:
             challenge_data: The original challenge data with answers
             response_data: The user's response to the challenge
             behavior_data: Tracking data about user behavior during the challenge
+            features: behavior_data's feature vector, if the caller already
+                extracted it (see api.challenge_logic.features)
 
         Returns:
             float: A trust score between 0 and 1
         """
+        components = self.calculate_component_scores(challenge_data, response_data, behavior_data, features)
+        return self.combine_component_scores(components)
+
+    def calculate_component_scores(self, challenge_data, response_data, behavior_data, features=None):
+        """
+        Calculate the individual scores weighted into the trust score (see
+        calculate_trust_score). They do not depend on the weights, so
+        callers comparing weightings can compute them once.
+
+        Returns:
+            dict: Component name (the keys of ``weights``) to a score between 0 and 1
+        """
         # Calculate individual component scores
         correctness_score = self._calculate_correctness_score(challenge_data, response_data)
-        entropy_score = self._calculate_entropy_score(behavior_data)
+        entropy_score = self._calculate_entropy_score(behavior_data, features)
 
         # Get time_taken_ms from response_data or use a default value
         time_taken_ms = response_data.get('time_taken_ms')
@@ -50,12 +75,18 @@ class ScoringEngine:
 
         response_time_score = self._calculate_response_time_score(time_taken_ms, challenge_data['type'])
 
+        return {
+            'correctness': correctness_score,
+            'entropy': entropy_score,
+            'response_time': response_time_score,
+        }
+
+    def combine_component_scores(self, components):
+        """
+        Weight component scores (see calculate_component_scores) into a trust score.
+        """
         # Calculate weighted total score
-        total_score = (
-            correctness_score * self.weights['correctness'] +
-            entropy_score * self.weights['entropy'] +
-            response_time_score * self.weights['response_time']
-        )
+        total_score = sum(components[name] * weight for name, weight in self.weights.items())
 
         # Normalize to 0-1 range
         normalized_score = max(0, min(1, total_score))
@@ -268,7 +299,7 @@ class ScoringEngine:
         print(f"Semantic grouping score: {score} ({correct_groupings}/{total_items} correct)")
         return score
 
-    def _calculate_entropy_score(self, behavior_data):
+    def _calculate_entropy_score(self, behavior_data, features=None):
         """
         Calculate entropy score based on user behavior data.
 
@@ -277,15 +308,15 @@ class ScoringEngine:
         if not behavior_data or 'mouse_movements' not in behavior_data:
             return 0.5  # Default score if no data
 
-        mouse_movements = behavior_data.get('mouse_movements', [])
-        keystroke_timings = behavior_data.get('keystroke_timings', [])
+        if features is None:
+            features = extract_features(behavior_data)
 
         # Calculate mouse movement entropy
-        mouse_entropy = self._calculate_mouse_entropy(mouse_movements)
+        mouse_entropy = self._calculate_mouse_entropy(features)
 
         # Calculate keystroke timing entropy if available
-        if keystroke_timings:
-            keystroke_entropy = self._calculate_keystroke_entropy(keystroke_timings)
+        if features[FEATURE_INDEX['keystroke_count']]:
+            keystroke_entropy = self._calculate_keystroke_entropy(features)
             # Combine both entropy scores
             entropy_score = 0.7 * mouse_entropy + 0.3 * keystroke_entropy
         else:
@@ -293,60 +324,25 @@ class ScoringEngine:
 
         return entropy_score
 
-    def _calculate_mouse_entropy(self, mouse_movements):
+    def _calculate_mouse_entropy(self, features):
         """
-        Calculate entropy from mouse movement patterns.
+        Calculate entropy from the mouse features of a behavior trace.
 
         Bot-like movements tend to be too regular or too straight.
         """
-        if len(mouse_movements) < 5:
+        if features[FEATURE_INDEX['mouse_movements_count']] < 5:
             return 0.5  # Not enough data
 
-        # Extract movement vectors (dx, dy)
-        vectors = []
-        for i in range(1, len(mouse_movements)):
-            prev = mouse_movements[i-1]
-            curr = mouse_movements[i]
-
-            dx = curr['x'] - prev['x']
-            dy = curr['y'] - prev['y']
-            dt = curr['timestamp'] - prev['timestamp']
-
-            if dt > 0:  # Avoid division by zero
-                vectors.append({
-                    'dx': dx,
-                    'dy': dy,
-                    'speed': math.sqrt(dx**2 + dy**2) / dt,
-                    'dt': dt
-                })
-
-        if not vectors:
+        # Only steps with elapsed time count
+        if not features[FEATURE_INDEX['mouse_moving_steps']]:
             return 0.5
 
-        # Calculate statistics on movement vectors
-        speeds = [v['speed'] for v in vectors]
-        time_diffs = [v['dt'] for v in vectors]
-
-        # Calculate variance in speed and timing
-        speed_variance = np.var(speeds) if len(speeds) > 1 else 0
-        timing_variance = np.var(time_diffs) if len(time_diffs) > 1 else 0
-
-        # Calculate direction changes
-        direction_changes = 0
-        for i in range(1, len(vectors)):
-            prev_angle = math.atan2(vectors[i-1]['dy'], vectors[i-1]['dx'])
-            curr_angle = math.atan2(vectors[i]['dy'], vectors[i]['dx'])
-
-            # Calculate angle difference
-            angle_diff = abs(curr_angle - prev_angle)
-            if angle_diff > math.pi:
-                angle_diff = 2 * math.pi - angle_diff
+        # Variance in speed and timing
+        speed_variance = float(features[FEATURE_INDEX['mouse_speed_std']]) ** 2
+        timing_variance = float(features[FEATURE_INDEX['mouse_interval_std']]) ** 2
 
-            # Count significant direction changes
-            if angle_diff > 0.3:  # About 17 degrees
-                direction_changes += 1
-
-        direction_change_rate = direction_changes / len(vectors) if vectors else 0
+        # Rate of significant direction changes
+        direction_change_rate = float(features[FEATURE_INDEX['mouse_direction_change_rate']])
 
         # Combine metrics into entropy score
         # Higher variance and moderate direction changes are more human-like
@@ -365,28 +361,22 @@ class ScoringEngine:
         # Combine scores
         entropy_score = 0.4 * speed_score + 0.3 * timing_score + 0.3 * direction_score
 
-        return entropy_score
+        return float(entropy_score)
 
-    def _calculate_keystroke_entropy(self, keystroke_timings):
+    def _calculate_keystroke_entropy(self, features):
         """
-        Calculate entropy from keystroke timing patterns.
+        Calculate entropy from the keystroke features of a behavior trace.
         """
-        if len(keystroke_timings) < 3:
+        if features[FEATURE_INDEX['keystroke_count']] < 3:
             return 0.5  # Not enough data
 
-        # Calculate inter-key intervals
-        intervals = []
-        for i in range(1, len(keystroke_timings)):
-            interval = keystroke_timings[i]['timestamp'] - keystroke_timings[i-1]['timestamp']
-            intervals.append(interval)
-
-        # Calculate variance in timing
-        timing_variance = np.var(intervals) if len(intervals) > 1 else 0
+        # Variance in inter-key intervals
+        timing_variance = float(features[FEATURE_INDEX['keystroke_interval_std']]) ** 2
 
         # Normalize (higher variance is more human-like, up to a point)
         entropy_score = min(1.0, timing_variance / 50000)
 
-        return entropy_score
+        return float(entropy_score)
 
     def _calculate_response_time_score(self, time_taken_ms, challenge_type):
         """
@@ -435,8 +425,127 @@ class ScoringEngine:
             else:
                 return 0.3
 
+    def calculate_passive_score(self, session_metadata, behavior_data):
+        """
+        Calculate a trust score from passive signals only, before any challenge.
+
+        Args:
+            session_metadata: Cached session metadata with fingerprint fields
+            behavior_data: Tracking data collected on the page so far
+
+        Returns:
+            float: A trust score between 0 and 1, or None if there is not
+            enough passive behavior to judge the session
+        """
+        mouse_movements = (behavior_data or {}).get('mouse_movements') or []
+        if len(mouse_movements) < self.MIN_PASSIVE_MOUSE_EVENTS:
+            return None
+
+        # Headless browsers never pass without a challenge
+        if session_metadata.get('headless') is not False:
+            return 0.0
+
+        fingerprint_score = session_metadata.get('entropy_score')
+        if fingerprint_score is None:
+            fingerprint_score = 0.5
+        fingerprint_score = max(0, min(1, fingerprint_score))
+
+        entropy_score = self._calculate_entropy_score(behavior_data)
+
+        total_score = (
+            fingerprint_score * self.passive_weights['fingerprint'] +
+            entropy_score * self.passive_weights['entropy']
+        )
+        return self.apply_ip_risk(max(0, min(1, total_score)), session_metadata.get('ip_risk'))
+
+    def apply_reputation_prior(self, trust_score, reputation):
+        """
+        Blend a trust score with the fingerprint's mean score from earlier sessions.
+
+        Args:
+            trust_score: Score of the current challenge
+            reputation: The fingerprint's aggregates (see api.reputation), or None
+
+        Returns:
+            float: The adjusted trust score; unchanged for fingerprints with
+            fewer than MIN_ATTEMPTS attempts
+        """
+        config = settings.FINGERPRINT_REPUTATION
+        if not reputation or reputation['attempts'] < config['MIN_ATTEMPTS']:
+            return trust_score
+
+        weight = config['PRIOR_WEIGHT']
+        return max(0, min(1, (1 - weight) * trust_score + weight * reputation['mean_score']))
+
+    def apply_model_score(self, trust_score, human_probability):
+        """
+        Blend a trust score with a trained model's probability that the
+        attempt is human (see api.model_registry).
+
+        Returns:
+            float: The trust score with MODEL_REGISTRY['MODEL_WEIGHT'] of it
+            replaced by the model's probability
+        """
+        weight = settings.MODEL_REGISTRY['MODEL_WEIGHT']
+        return max(0, min(1, (1 - weight) * trust_score + weight * float(human_probability)))
+
+    def apply_ip_risk(self, trust_score, ip_risk):
+        """
+        Lower a trust score for sessions from risky networks (see api.ip_reputation).
+
+        Returns:
+            float: The trust score less up to IP_REPUTATION['RISK_WEIGHT']
+        """
+        if not ip_risk:
+            return trust_score
+        return max(0, min(1, trust_score - settings.IP_REPUTATION['RISK_WEIGHT'] * ip_risk))
+
+    def apply_replay_penalty(self, trust_score, replayed):
+        """
+        Lower a trust score when the behavior trace repeats an earlier one (see api.replay).
+        """
+        if not replayed:
+            return trust_score
+        return max(0, trust_score - settings.REPLAY_DETECTION['PENALTY'])
+
+    def apply_similarity_penalty(self, trust_score, similar_paths):
+        """
+        Lower a trust score when many recent mouse paths were near-duplicates
+        of this one (see api.similarity).
+        """
+        config = settings.TRAJECTORY_SIMILARITY
+        if similar_paths < config['MIN_SIMILAR']:
+            return trust_score
+        return max(0, trust_score - config['PENALTY'])
+
+    def adjust_trust_score(self, challenge_score, reputation=None, ip_risk=None, replayed=False, similar_paths=0):
+        """
+        Turn a challenge score into the session's trust score: the
+        fingerprint's reputation prior, then the IP risk, replay and
+        similarity penalties above.
+        """
+        trust_score = self.apply_reputation_prior(challenge_score, reputation)
+        trust_score = self.apply_ip_risk(trust_score, ip_risk)
+        trust_score = self.apply_replay_penalty(trust_score, replayed)
+        return self.apply_similarity_penalty(trust_score, similar_paths)
+
+    def is_frictionless_pass(self, passive_score):
+        """
+        Determine if a passive score is confident enough to skip the challenge.
+        """
+        return passive_score is not None and passive_score >= settings.FRICTIONLESS_PASS_THRESHOLD
+
     def is_challenge_passed(self, trust_score):
         """
         Determine if a challenge is passed based on the trust score.
         """
         return trust_score >= self.FAIL_THRESHOLD
+
+    def are_challenges_passed(self, trust_scores):
+        """
+        Vectorized form of is_challenge_passed for many trust scores at once.
+
+        Returns:
+            numpy.ndarray: Boolean pass decisions in the same order as the input
+        """
+        return np.asarray(trust_scores, dtype=float) >= self.FAIL_THRESHOLD
@@ -0,0 +1,371 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseChallengeStore:
+    """
+    Stores short-lived challenge state that must be shared by all workers.
+
+    Values are JSON documents. ``consume`` returns a value and removes it in a
+    single atomic step, so a challenge can only ever be submitted once.
+    """
+
+    def set(self, key, value, timeout):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        """
+        Return a dict of the keys that are present to their values.
+        """
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def consume(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def take_token(self, key, rate, capacity, cost=1):
+        """
+        Take ``cost`` tokens from the token bucket stored under ``key``.
+
+        The bucket refills at ``rate`` tokens per second up to ``capacity``.
+
+        Returns:
+            bool: True if the tokens were available, False if over the limit
+        """
+        raise NotImplementedError
+
+    def bloom_add(self, key, offsets, timeout, check_keys=()):
+        """
+        Set ``offsets`` in the bit array stored under ``key`` (a Bloom filter
+        insert) and report whether the item was already there.
+
+        The key expires ``timeout`` seconds after the last insert. Filters
+        named in ``check_keys`` (older generations) are only tested.
+
+        Returns:
+            bool: True if every offset was already set in ``key`` or in one
+            of ``check_keys``
+        """
+        raise NotImplementedError
+
+    def list_push(self, keys, value, max_length, timeout):
+        """
+        Push ``value`` onto the front of the list under each of ``keys``,
+        keeping the newest ``max_length`` items. Each list expires ``timeout``
+        seconds after the last push.
+        """
+        raise NotImplementedError
+
+    def list_get_many(self, keys):
+        """
+        Return a dict of the keys that hold a list to their items, newest first.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LocalChallengeStore(BaseChallengeStore):
+    """
+    Process-local store for tests and single-process development servers.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = {}
+        self._buckets = {}
+        self._bitsets = {}
+        self._lists = {}
+        self._lock = threading.Lock()
+
+    def set(self, key, value, timeout):
+        payload = json.dumps(value)
+        expires_at = time.monotonic() + timeout
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.max_entries:
+                self._cull(self._data)
+            self._data[key] = (payload, expires_at)
+
+    def get(self, key):
+        with self._lock:
+            payload = self._get_live(key)
+        return None if payload is None else json.loads(payload)
+
+    def consume(self, key):
+        with self._lock:
+            payload = self._get_live(key)
+            self._data.pop(key, None)
+        return None if payload is None else json.loads(payload)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def take_token(self, key, rate, capacity, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _, _ = self._buckets.pop(key, (capacity, now, rate, capacity))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if len(self._buckets) >= self.max_entries:
+                self._cull_buckets(now)
+            self._buckets[key] = (tokens, now, rate, capacity)
+        return allowed
+
+    def bloom_add(self, key, offsets, timeout, check_keys=()):
+        now = time.monotonic()
+        with self._lock:
+            # Only a few generations are live at a time
+            self._bitsets = {k: v for k, v in self._bitsets.items() if v[1] > now}
+
+            seen = False
+            for check_key in check_keys:
+                bits = self._bitsets.get(check_key, (bytearray(),))[0]
+                if all(self._test_bit(bits, offset) for offset in offsets):
+                    seen = True
+                    break
+
+            bits = self._bitsets.get(key, (bytearray(),))[0]
+            was_set = True
+            for offset in offsets:
+                byte, mask = offset >> 3, 0x80 >> (offset & 7)
+                if byte >= len(bits):
+                    bits.extend(bytes(byte + 1 - len(bits)))
+                if not bits[byte] & mask:
+                    was_set = False
+                    bits[byte] |= mask
+            self._bitsets[key] = (bits, now + timeout)
+        return seen or was_set
+
+    def list_push(self, keys, value, max_length, timeout):
+        payload = json.dumps(value)
+        expires_at = time.monotonic() + timeout
+        with self._lock:
+            for key in keys:
+                items = self._get_live(key, self._lists) or []
+                self._lists.pop(key, None)
+                if len(self._lists) >= self.max_entries:
+                    self._cull(self._lists)
+                self._lists[key] = ([payload, *items[:max_length - 1]], expires_at)
+
+    def list_get_many(self, keys):
+        with self._lock:
+            lists = {key: self._get_live(key, self._lists) for key in keys}
+        return {key: [json.loads(item) for item in items] for key, items in lists.items() if items}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._buckets.clear()
+            self._bitsets.clear()
+            self._lists.clear()
+
+    @staticmethod
+    def _test_bit(bits, offset):
+        byte = offset >> 3
+        return byte < len(bits) and bool(bits[byte] & (0x80 >> (offset & 7)))
+
+    def _get_live(self, key, entries=None):
+        entries = self._data if entries is None else entries
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.monotonic():
+            del entries[key]
+            return None
+        return payload
+
+    def _cull(self, entries):
+        now = time.monotonic()
+        for key in [k for k, (_, expires_at) in entries.items() if expires_at <= now]:
+            del entries[key]
+        # Still full: drop the oldest entries (dicts keep insertion order)
+        while len(entries) >= self.max_entries:
+            del entries[next(iter(entries))]
+
+    def _cull_buckets(self, now):
+        # Buckets that have refilled completely carry no state
+        self._buckets = {
+            key: (tokens, updated_at, rate, capacity)
+            for key, (tokens, updated_at, rate, capacity) in self._buckets.items()
+            if tokens + (now - updated_at) * rate < capacity
+        }
+        while len(self._buckets) >= self.max_entries:
+            del self._buckets[next(iter(self._buckets))]
+
+
+class RedisChallengeStore(BaseChallengeStore):
+    """
+    Redis-backed store shared by every worker process.
+
+    All instances in a process share one connection pool. Consumption uses a
+    Lua script (GET + DEL in one server-side step), which also works on Redis
+    versions that predate GETDEL.
+    """
+
+    CONSUME_SCRIPT = """
+    local value = redis.call('GET', KEYS[1])
+    if value then
+        redis.call('DEL', KEYS[1])
+    end
+    return value
+    """
+
+    TOKEN_BUCKET_SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return allowed
+    """
+
+    # KEYS: filter to insert into, then older filters to test.
+    # ARGV: timeout, then the bit offsets.
+    BLOOM_ADD_SCRIPT = """
+    local seen = 0
+    for k = 2, #KEYS do
+        local found = 1
+        for i = 2, #ARGV do
+            if redis.call('GETBIT', KEYS[k], ARGV[i]) == 0 then
+                found = 0
+                break
+            end
+        end
+        if found == 1 then
+            seen = 1
+            break
+        end
+    end
+    local was_set = 1
+    for i = 2, #ARGV do
+        if redis.call('SETBIT', KEYS[1], ARGV[i], 1) == 0 then
+            was_set = 0
+        end
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    return math.max(seen, was_set)
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None,
+                 key_prefix='humanauth:', max_connections=50, socket_timeout=1.0):
+        import redis
+
+        self.key_prefix = key_prefix
+        self._pool = redis.ConnectionPool(
+            host=host, port=port, db=db, password=password,
+            max_connections=max_connections, socket_timeout=socket_timeout,
+        )
+        self._client = redis.Redis(connection_pool=self._pool)
+        self._consume = self._client.register_script(self.CONSUME_SCRIPT)
+        self._token_bucket = self._client.register_script(self.TOKEN_BUCKET_SCRIPT)
+        self._bloom_add = self._client.register_script(self.BLOOM_ADD_SCRIPT)
+
+    def _key(self, key):
+        return f"{self.key_prefix}{key}"
+
+    def set(self, key, value, timeout):
+        self._client.set(self._key(key), json.dumps(value), ex=int(timeout))
+
+    def get(self, key):
+        payload = self._client.get(self._key(key))
+        return None if payload is None else json.loads(payload)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        payloads = self._client.mget([self._key(key) for key in keys])
+        return {key: json.loads(payload) for key, payload in zip(keys, payloads) if payload is not None}
+
+    def consume(self, key):
+        payload = self._consume(keys=[self._key(key)])
+        return None if payload is None else json.loads(payload)
+
+    def delete(self, key):
+        self._client.delete(self._key(key))
+
+    def take_token(self, key, rate, capacity, cost=1):
+        allowed = self._token_bucket(
+            keys=[self._key(key)], args=[rate, capacity, time.time(), cost]
+        )
+        return bool(allowed)
+
+    def bloom_add(self, key, offsets, timeout, check_keys=()):
+        seen = self._bloom_add(
+            keys=[self._key(key), *(self._key(check_key) for check_key in check_keys)],
+            args=[int(timeout), *offsets],
+        )
+        return bool(seen)
+
+    def list_push(self, keys, value, max_length, timeout):
+        payload = json.dumps(value)
+        pipeline = self._client.pipeline(transaction=False)
+        for key in keys:
+            key = self._key(key)
+            pipeline.lpush(key, payload)
+            pipeline.ltrim(key, 0, max_length - 1)
+            pipeline.expire(key, int(timeout))
+        pipeline.execute()
+
+    def list_get_many(self, keys):
+        keys = list(keys)
+        pipeline = self._client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.lrange(self._key(key), 0, -1)
+        return {
+            key: [json.loads(item) for item in items]
+            for key, items in zip(keys, pipeline.execute()) if items
+        }
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f"{self.key_prefix}*", count=1000))
+        if keys:
+            self._client.delete(*keys)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_challenge_store():
+    """
+    Return the process-wide challenge store configured by ``CHALLENGE_STORE``.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = settings.CHALLENGE_STORE
+                backend = import_string(config['BACKEND'])
+                _store = backend(**config.get('OPTIONS', {}))
+    return _store
@@ -0,0 +1,108 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from api.models import ChallengeLog, FingerprintReputation, UserSession
+
+
+def _expired_sessions(now):
+    """
+    Return (label, queryset) for each kind of session that can be deleted.
+    """
+    config = settings.SESSION_CLEANUP
+    has_logs = Exists(ChallengeLog.objects.filter(session=OuterRef('pk')))
+    return [
+        # Never scored: the challenge and cached metadata expired long ago
+        ('unscored sessions', UserSession.objects.filter(
+            trust_score__isnull=True, created_at__lt=now - timedelta(hours=config['UNSCORED_HOURS'])
+        ).filter(~has_logs)),
+        # Scored, and their challenge logs have been archived
+        ('scored sessions', UserSession.objects.filter(
+            trust_score__isnull=False, created_at__lt=now - timedelta(days=config['SCORED_DAYS'])
+        ).filter(~has_logs)),
+    ]
+
+
+def _session_batches(queryset, batch_size):
+    """
+    Yield lists of session ids, oldest first, with keyset pagination on
+    (created_at, id) so rows skipped by a batch are never scanned again.
+    """
+    queryset = queryset.order_by('created_at', 'id')
+    after = Q()
+    while True:
+        keys = list(queryset.filter(after).values_list('created_at', 'id')[:batch_size])
+        if not keys:
+            return
+        yield [session_id for _, session_id in keys]
+        created_at, session_id = keys[-1]
+        after = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=session_id)
+
+
+def _reputation_batches(cutoff, batch_size):
+    """
+    Yield querysets of stale reputation rows, one primary key range at a time.
+    """
+    last_key = None
+    while True:
+        keys = FingerprintReputation.objects.order_by('pk').values_list('pk', flat=True)
+        if last_key is not None:
+            keys = keys.filter(pk__gt=last_key)
+        keys = list(keys[:batch_size])
+        if not keys:
+            return
+        yield FingerprintReputation.objects.filter(pk__gte=keys[0], pk__lte=keys[-1], last_seen__lt=cutoff)
+        last_key = keys[-1]
+
+
+def cleanup_sessions(batch_size=None, sleep_seconds=None, dry_run=False):
+    """
+    Delete expired sessions, with their fingerprints, and the reputation
+    aggregates of fingerprints not seen for ``REPUTATION_DAYS``.
+
+    Rows are deleted in short transactions of at most ``batch_size`` rows,
+    selected by primary key, with a pause of ``sleep_seconds`` after each
+    batch that deleted rows, so the job holds no long locks and gives
+    replicas time to catch up while running next to production traffic.
+    Each session transaction first locks the batch's sessions that still
+    match the expiry conditions, then deletes those and their fingerprints,
+    so a session scored or given a challenge log since its batch was
+    selected is left alone. Reputation aggregates are deleted by a single
+    DELETE that checks ``last_seen`` itself.
+
+    Yields:
+        tuple: (label, rows deleted) for each batch, or for each kind of row
+        with ``dry_run``, which only counts
+    """
+    config = settings.SESSION_CLEANUP
+    batch_size = batch_size or config['BATCH_SIZE']
+    sleep_seconds = config['SLEEP_SECONDS'] if sleep_seconds is None else sleep_seconds
+    now = timezone.now()
+    reputation_cutoff = now - timedelta(days=config['REPUTATION_DAYS'])
+
+    if dry_run:
+        for label, queryset in _expired_sessions(now):
+            yield label, queryset.count()
+        yield 'reputation aggregates', FingerprintReputation.objects.filter(last_seen__lt=reputation_cutoff).count()
+        return
+
+    for label, queryset in _expired_sessions(now):
+        for session_ids in _session_batches(queryset, batch_size):
+            # QuerySet.delete() selects the rows and their cascades before
+            # deleting them; the lock keeps the sessions expired until then
+            with transaction.atomic():
+                expired = list(queryset.filter(id__in=session_ids).select_for_update().values_list('id', flat=True))
+                _, deleted = UserSession.objects.filter(id__in=expired).delete()
+            yield label, deleted.get(UserSession._meta.label, 0)
+            if deleted:
+                time.sleep(sleep_seconds)
+
+    for queryset in _reputation_batches(reputation_cutoff, batch_size):
+        deleted, _ = queryset.delete()
+        yield 'reputation aggregates', deleted
+        if deleted:
+            time.sleep(sleep_seconds)
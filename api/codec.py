@@ -0,0 +1,219 @@
+import hashlib
+import json
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from api.challenge_logic.behavior import EventStream
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+
+FORMAT_VERSION = 1
+
+# Second header byte: how the packed JSON that follows is compressed
+COMPRESSION_NONE = b'n'
+COMPRESSION_ZLIB = b'z'
+COMPRESSION_ZSTD = b's'
+
+# Lists of at least this many flat numeric objects are stored as columns
+MIN_STREAM_EVENTS = 4
+
+# Integral values up to this size survive the float64 round trip exactly
+_MAX_EXACT_INT = 2 ** 53
+
+
+def content_hash(text):
+    """
+    Return the key a string is stored under in the ChallengeContent table.
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def encode_payload(value, intern=None):
+    """
+    Encode a JSON payload into the compact storage format.
+
+    Event arrays (EventStreams, or lists of objects with the same numeric
+    fields) become one column per field, delta-encoded when integral.
+    When ``intern`` is given, strings of at least ``CONTENT_MIN_LENGTH``
+    characters are replaced by their content hash and passed to
+    ``intern(hash, text)`` to be stored once in a side table.
+
+    Returns:
+        bytes: Two header bytes (format version, compression) and the body
+    """
+    config = settings.CHALLENGE_LOG_CODEC
+    body = _dumps(_pack(value, intern, config['CONTENT_MIN_LENGTH']))
+
+    compression = COMPRESSION_NONE
+    if len(body) >= config['MIN_COMPRESS_BYTES']:
+        compression, body = _compress(body, config['COMPRESSION'])
+    return bytes([FORMAT_VERSION]) + compression + body
+
+
+def decode_payload(raw, resolve=None, stream_columns=()):
+    """
+    Decode a payload written by encode_payload.
+
+    Args:
+        raw: Encoded bytes
+        resolve: Callable taking a set of content hashes and returning a
+            dict of hash to text, for payloads encoded with ``intern``
+        stream_columns: Keys whose columnar event arrays are returned as a
+            dict of field name to numpy array instead of a list of event dicts
+    """
+    raw = bytes(raw)
+    if raw[0] != FORMAT_VERSION:
+        raise ValueError(f"Unknown payload format version: {raw[0]}")
+
+    compression, body = raw[1:2], raw[2:]
+    if compression == COMPRESSION_ZLIB:
+        body = zlib.decompress(body)
+    elif compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured("Decoding this payload requires the zstandard package")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compression != COMPRESSION_NONE:
+        raise ValueError(f"Unknown payload compression: {compression!r}")
+
+    packed = json.loads(body) if orjson is None else orjson.loads(body)
+
+    refs = set()
+    _collect_refs(packed, refs)
+    contents = resolve(refs) if refs else {}
+    return _unpack(packed, contents, stream_columns)
+
+
+def _dumps(value):
+    if orjson is None:
+        return json.dumps(value, separators=(',', ':')).encode()
+    return orjson.dumps(value)
+
+
+def _compress(body, compression):
+    if compression == 'none':
+        return COMPRESSION_NONE, body
+    if compression == 'zlib':
+        return COMPRESSION_ZLIB, zlib.compress(body)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImproperlyConfigured("CHALLENGE_LOG_CODEC COMPRESSION 'zstd' requires the zstandard package")
+        return COMPRESSION_ZSTD, zstandard.ZstdCompressor().compress(body)
+    raise ImproperlyConfigured(f"Unknown CHALLENGE_LOG_CODEC COMPRESSION: {compression!r}")
+
+
+def _stream_fields(value):
+    """
+    Return the field names when value is a list of flat numeric objects, else None.
+    """
+    if len(value) < MIN_STREAM_EVENTS or not isinstance(value[0], dict) or not value[0]:
+        return None
+
+    fields = tuple(value[0])
+    for event in value:
+        if not isinstance(event, dict) or tuple(event) != fields:
+            return None
+        for item in event.values():
+            # bool is an int subclass but must keep its type
+            if type(item) not in (int, float) or abs(item) >= _MAX_EXACT_INT:
+                return None
+    return fields
+
+
+def _pack_columns(fields, columns):
+    packed = []
+    for column in columns:
+        column = np.asarray(column, dtype=np.float64)
+        # Only integral values that survive the int64 cast exactly, as for lists
+        # (see _stream_fields); NaN fails the comparison
+        if len(column) and np.abs(column).max() < _MAX_EXACT_INT and np.array_equal(column, np.trunc(column)):
+            # Store the first value and the differences; consecutive events
+            # are close together so the numbers are short and repetitive
+            packed.append({'delta': np.diff(column.astype(np.int64), prepend=0).tolist()})
+        else:
+            packed.append({'values': column.tolist()})
+    return {'$stream': {'fields': list(fields), 'columns': packed}}
+
+
+def _pack(value, intern, min_length):
+    if isinstance(value, EventStream):
+        return _pack_columns(value.fields, [value.column(field) for field in value.fields])
+
+    if isinstance(value, dict):
+        packed = {key: _pack(item, intern, min_length) for key, item in value.items()}
+        if len(packed) == 1 and next(iter(packed)).startswith('$'):
+            # Keep client data that looks like one of our markers unambiguous
+            return {'$dict': packed}
+        return packed
+
+    if isinstance(value, list):
+        fields = _stream_fields(value)
+        if fields is not None:
+            return _pack_columns(fields, [[event[field] for event in value] for field in fields])
+        return [_pack(item, intern, min_length) for item in value]
+
+    if isinstance(value, str) and intern is not None and len(value) >= min_length:
+        key = content_hash(value)
+        intern(key, value)
+        return {'$ref': key}
+
+    return value
+
+
+def _collect_refs(value, refs):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            marker, inner = next(iter(value.items()))
+            if marker == '$ref':
+                refs.add(inner)
+                return
+            if marker == '$stream':
+                return
+            if marker == '$dict':
+                value = inner
+        for item in value.values():
+            _collect_refs(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_refs(item, refs)
+
+
+def _unpack(value, contents, stream_columns, as_columns=False):
+    if isinstance(value, list):
+        return [_unpack(item, contents, stream_columns) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    if len(value) == 1:
+        marker, inner = next(iter(value.items()))
+        if marker == '$ref':
+            return contents[inner]
+        if marker == '$dict':
+            value = inner
+        elif marker == '$stream':
+            columns = []
+            for column in inner['columns']:
+                if 'delta' in column:
+                    columns.append(np.cumsum(np.asarray(column['delta'], dtype=np.int64)))
+                else:
+                    columns.append(np.asarray(column['values'], dtype=np.float64))
+            if as_columns:
+                return dict(zip(inner['fields'], columns))
+            return [dict(zip(inner['fields'], row)) for row in zip(*[column.tolist() for column in columns])]
+
+    return {
+        key: _unpack(item, contents, stream_columns, key in stream_columns)
+        for key, item in value.items()
+    }
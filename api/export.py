@@ -0,0 +1,205 @@
+import json
+import os
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import BinaryField, ExpressionWrapper, F
+from django.utils import timezone
+
+from api.codec import decode_payload
+from api.models import ChallengeLog
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = feather = pq = None
+
+
+WATERMARK_FILE = '_watermark.json'
+
+EXPORTED_FIELDS = {
+    'id': 'id',
+    'session_id': 'session_id',
+    'challenge_type': 'challenge_type',
+    'passed': 'passed',
+    'time_taken_ms': 'time_taken_ms',
+    'created_at': 'created_at',
+    'challenge_data': 'challenge_data',
+    'response_data': 'response_raw',
+    'trust_score': 'session__trust_score',
+    'fingerprint_id': 'session__fingerprint_id',
+    'ip_address': 'session__ip_address',
+    'browser': 'session__fingerprint__browser',
+    'os': 'session__fingerprint__os',
+    'headless': 'session__fingerprint__headless',
+    'entropy_score': 'session__fingerprint__entropy_score',
+}
+
+# Behavior streams exported as one list column per field
+STREAM_COLUMNS = {
+    'mouse_x': ('mouse_movements', 'x'),
+    'mouse_y': ('mouse_movements', 'y'),
+    'mouse_timestamp': ('mouse_movements', 'timestamp'),
+    'keystroke_timestamp': ('keystroke_timings', 'timestamp'),
+}
+STREAMS = {stream for stream, _ in STREAM_COLUMNS.values()}
+
+
+def _schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('session_id', pa.string()),
+        ('passed', pa.bool_()),
+        ('time_taken_ms', pa.int32()),
+        ('created_at', pa.timestamp('us', tz='UTC')),
+        ('trust_score', pa.float64()),
+        ('fingerprint_id', pa.string()),
+        ('ip_address', pa.string()),
+        ('browser', pa.string()),
+        ('os', pa.string()),
+        ('headless', pa.bool_()),
+        ('entropy_score', pa.float64()),
+        ('challenge_data', pa.string()),
+        ('response_data', pa.string()),
+        *[(name, pa.list_(pa.float64())) for name in STREAM_COLUMNS],
+    ])
+
+
+class ChallengeLogExporter:
+    """
+    Incrementally exports challenge logs, joined with their session and
+    fingerprint, into columnar files partitioned by day and challenge type:
+
+      <root>/date=YYYY-MM-DD/challenge_type=<type>/part-<first id>-<last id>.parquet
+
+    The highest exported id is kept in ``<root>/_watermark.json``; each run
+    continues after it with keyset pagination, one batch in memory at a time.
+    Logs younger than ``settle_seconds`` are left for the next run, so rows
+    whose insert has not committed yet are not skipped over.
+    """
+
+    def __init__(self, root=None, batch_size=None, settle_seconds=None, file_format='parquet'):
+        if pa is None:
+            raise ImportError("Exporting challenge logs requires the pyarrow package")
+
+        config = settings.CHALLENGE_LOG_EXPORT
+        self.root = Path(root or config['ROOT'])
+        self.batch_size = batch_size or config['BATCH_SIZE']
+        self.settle_seconds = config['SETTLE_SECONDS'] if settle_seconds is None else settle_seconds
+        self.compression = config['COMPRESSION']
+        self.file_format = file_format
+
+    def read_watermark(self):
+        path = self.root / WATERMARK_FILE
+        if not path.exists():
+            return 0
+        return json.loads(path.read_text())['last_id']
+
+    def write_watermark(self, last_id):
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / WATERMARK_FILE
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'last_id': last_id, 'exported_at': timezone.now().isoformat()}))
+        os.replace(tmp_path, path)
+
+    def _upper_bound(self):
+        """
+        Return the id of the newest log old enough to export, or None.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.settle_seconds)
+        return (
+            ChallengeLog.objects.filter(created_at__lt=cutoff)
+            .order_by('-created_at').values_list('id', flat=True).first()
+        )
+
+    def export(self):
+        """
+        Export every settled log after the watermark.
+
+        Yields:
+            tuple: (rows, files written) for each batch
+        """
+        last_id = self.read_watermark()
+        until_id = self._upper_bound()
+        if until_id is None:
+            return
+
+        # response_data is read undecoded, so the behavior streams can be
+        # decoded straight into columns instead of one dict per event
+        queryset = (
+            ChallengeLog.objects.filter(id__lte=until_id).order_by('id')
+            .annotate(response_raw=ExpressionWrapper(F('response_data'), output_field=BinaryField()))
+            .values(*EXPORTED_FIELDS.values())
+        )
+        while True:
+            rows = list(queryset.filter(id__gt=last_id)[:self.batch_size])
+            if not rows:
+                return
+
+            files = self._write_batch(rows)
+            last_id = rows[-1]['id']
+            self.write_watermark(last_id)
+            yield len(rows), files
+
+    def _write_batch(self, rows):
+        partitions = defaultdict(lambda: defaultdict(list))
+        for row in rows:
+            columns = partitions[(row['created_at'].date().isoformat(), row['challenge_type'])]
+            for name, field in EXPORTED_FIELDS.items():
+                if name not in ('challenge_type', 'response_data'):
+                    columns[name].append(row[field])
+            columns['session_id'][-1] = str(row['session_id'])
+            columns['challenge_data'][-1] = json.dumps(row['challenge_data'])
+
+            response_data = decode_payload(row['response_raw'], stream_columns=STREAMS)
+            behavior_data = response_data.pop('behavior_data', None) or {}
+            columns['response_data'].append(json.dumps(response_data))
+
+            for name, (stream, field) in STREAM_COLUMNS.items():
+                events = behavior_data.get(stream) or []
+                if isinstance(events, dict):
+                    values = events.get(field, ())
+                else:
+                    # Too short or irregular to have been stored as columns
+                    values = [event.get(field) for event in events if isinstance(event, dict)]
+                columns[name].append(np.asarray(values, dtype=np.float64))
+
+        first_id, last_id = rows[0]['id'], rows[-1]['id']
+        suffix = 'parquet' if self.file_format == 'parquet' else 'arrow'
+        files = []
+        for (day, challenge_type), columns in partitions.items():
+            directory = self.root / f"date={day}" / f"challenge_type={challenge_type}"
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"part-{first_id}-{last_id}.{suffix}"
+
+            for name in STREAM_COLUMNS:
+                columns[name] = _list_array(columns[name])
+            table = pa.table(columns, schema=_schema())
+
+            # Write next to the final name and rename, so readers never see
+            # half-written files and a re-run after a crash replaces them
+            tmp_path = path.with_suffix('.tmp')
+            if self.file_format == 'parquet':
+                pq.write_table(table, tmp_path, compression=self.compression)
+            else:
+                feather.write_feather(table, tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+            files.append(path)
+
+        return files
+
+
+def _list_array(arrays):
+    """
+    Build an Arrow list<double> column from one numpy array per row.
+    """
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int32)
+    np.cumsum([len(values) for values in arrays], out=offsets[1:])
+    values = np.concatenate(arrays) if arrays else np.empty(0)
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.array(values, type=pa.float64()))
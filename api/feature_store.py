@@ -0,0 +1,112 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import BinaryField, Case, F, Q, Value, When
+
+from api.challenge_logic.behavior import STREAM_FIELDS, EventStream
+from api.challenge_logic.features import (
+    FEATURE_NAMES, FEATURE_VERSION, extract_features_batch, pack_features, unpack_features,
+)
+from api.codec import decode_payload
+from api.models import ChallengeLog
+
+
+# Logs whose stored feature vector is missing or from another extractor version
+STALE = ~Q(feature_version=FEATURE_VERSION) | Q(features__isnull=True)
+
+
+def stale_response_raw():
+    """
+    Annotation with a log's undecoded response_data when its feature vector
+    must be recomputed, and NULL otherwise, so queries over many logs only
+    transfer the payloads they need.
+    """
+    return Case(
+        When(STALE, then=F('response_data')),
+        default=Value(None),
+        output_field=BinaryField(),
+    )
+
+
+def log_features(rows):
+    """
+    Return the feature vectors of log rows with ``features``,
+    ``feature_version`` and ``response_raw`` (see stale_response_raw) values.
+
+    Stored vectors of the current version are used as they are; the others
+    are extracted from the behavior data in one batch.
+
+    Returns:
+        tuple: (float32 array with one vector per row, list of (row index,
+        vector) for the vectors that were recomputed)
+    """
+    fresh = np.array([
+        row['feature_version'] == FEATURE_VERSION and row['features'] is not None for row in rows
+    ], dtype=bool)
+    stale = np.flatnonzero(~fresh)
+
+    behavior_data_list = []
+    for index in stale:
+        response_data = decode_payload(rows[index]['response_raw'], stream_columns=STREAM_FIELDS.keys())
+        behavior_data = response_data.get('behavior_data')
+        if isinstance(behavior_data, dict):
+            # Streams stored column-wise are decoded as dicts of columns
+            for name, fields in STREAM_FIELDS.items():
+                if isinstance(behavior_data.get(name), dict):
+                    behavior_data[name] = EventStream.from_columns(behavior_data[name], fields)
+        behavior_data_list.append(behavior_data)
+
+    features = np.empty((len(rows), len(FEATURE_NAMES)), dtype=np.float32)
+    features[fresh] = unpack_features([bytes(row['features']) for row, is_fresh in zip(rows, fresh) if is_fresh])
+    if len(stale):
+        features[stale] = extract_features_batch(behavior_data_list)
+    return features, [(index, features[index]) for index in stale]
+
+
+def save_features(vectors):
+    """
+    Store feature vectors of the current extractor version for logs.
+
+    Args:
+        vectors: (log id, feature vector) pairs
+    """
+    logs = [
+        ChallengeLog(id=log_id, features=pack_features(features), feature_version=FEATURE_VERSION)
+        for log_id, features in vectors
+    ]
+    ChallengeLog.objects.bulk_update(logs, ['features', 'feature_version'], batch_size=500)
+
+
+def backfill_features(batch_size=None, sleep_seconds=None):
+    """
+    Compute and store the feature vectors of logs that have none, or one from
+    another extractor version, oldest first.
+
+    Batches are selected by id and paused ``sleep_seconds`` apart, so the job
+    can run next to production traffic.
+
+    Yields:
+        int: Number of logs updated by each batch
+    """
+    config = settings.FEATURE_BACKFILL
+    batch_size = batch_size or config['BATCH_SIZE']
+    sleep_seconds = config['SLEEP_SECONDS'] if sleep_seconds is None else sleep_seconds
+
+    queryset = (
+        ChallengeLog.objects.filter(STALE).order_by('id')
+        .annotate(response_raw=stale_response_raw())
+        .values('id', 'features', 'feature_version', 'response_raw')
+    )
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            return
+
+        _, recomputed = log_features(rows)
+        save_features((rows[index]['id'], features) for index, features in recomputed)
+        yield len(recomputed)
+
+        last_id = rows[-1]['id']
+        time.sleep(sleep_seconds)
@@ -0,0 +1,245 @@
+import bisect
+import heapq
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+MAGIC = b'HAIPREP1'
+# Magic, IPv4 interval count, IPv6 interval count
+HEADER = struct.Struct('=8sII')
+# Arrays after the header: (format, address family, interval column)
+ARRAYS = (('Q', 6, 0), ('Q', 6, 1), ('d', 6, 2), ('I', 4, 0), ('I', 4, 1), ('d', 4, 2))
+
+_IPV4 = struct.Struct('>I')
+_IPV6_PREFIX = struct.Struct('>Q')
+_IPV4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+
+
+def _parse_line(line):
+    """
+    Return (network version, first address, last address, risk) for a source line, or None.
+    """
+    line = line.split('#', 1)[0].strip()
+    if not line:
+        return None
+
+    parts = [part.strip() for part in line.split(',')]
+    risk = float(parts[1]) if len(parts) > 1 and parts[1] else 1.0
+    if not 0 <= risk <= 1:
+        raise ValueError(f"Risk must be between 0 and 1: {line!r}")
+
+    if '-' in parts[0]:
+        first, last = (ipaddress.ip_address(part.strip()) for part in parts[0].split('-', 1))
+        if first.version != last.version or first > last:
+            raise ValueError(f"Invalid address range: {line!r}")
+    else:
+        network = ipaddress.ip_network(parts[0], strict=False)
+        first, last = network.network_address, network.broadcast_address
+
+    if first.version == 4:
+        return 4, int(first), int(last), risk
+    # IPv6 is indexed by /64 prefix
+    return 6, int(first) >> 64, int(last) >> 64, risk
+
+
+def _flatten(ranges):
+    """
+    Turn possibly overlapping (start, end, risk) ranges into sorted,
+    non-overlapping intervals, keeping the highest risk where ranges overlap.
+    """
+    boundaries = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+    ranges = sorted(ranges)
+
+    intervals = []
+    active = []  # heap of (-risk, end)
+    next_range = 0
+    for left, right in zip(boundaries, boundaries[1:]):
+        while next_range < len(ranges) and ranges[next_range][0] <= left:
+            start, end, risk = ranges[next_range]
+            heapq.heappush(active, (-risk, end))
+            next_range += 1
+        while active and active[0][1] < left:
+            heapq.heappop(active)
+        if not active:
+            continue
+
+        risk = -active[0][0]
+        if intervals and intervals[-1][1] == left - 1 and intervals[-1][2] == risk:
+            intervals[-1] = (intervals[-1][0], right - 1, risk)
+        else:
+            intervals.append((left, right - 1, risk))
+    return intervals
+
+
+def build_index(sources, index_path):
+    """
+    Compile range source files into the binary index at ``index_path``.
+
+    Source files (``.txt`` or ``.csv``) list one range per line, optionally
+    followed by a risk between 0 and 1 (default 1.0) and a label; blank
+    lines and ``#`` comments are ignored:
+
+        203.0.113.0/24, 0.9, hosting
+        198.51.100.10-198.51.100.20, 0.5
+        2001:db8::/32, 0.8, vpn
+
+    Ranges become sorted, non-overlapping intervals (overlaps keep the
+    highest risk) stored as flat arrays, so workers can map the file and
+    binary-search it in place. IPv6 is indexed at /64 granularity.
+
+    The file is written next to the destination and renamed over it, so
+    workers reloading at the same time see either the old or the new index.
+
+    Returns:
+        tuple: Number of IPv4 and IPv6 intervals written
+    """
+    ranges = {4: [], 6: []}
+    for path in _source_files(sources):
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    parsed = _parse_line(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{number}: {e}") from None
+                if parsed is not None:
+                    version, first, last, risk = parsed
+                    ranges[version].append((first, last, risk))
+
+    intervals = {4: _flatten(ranges[4]), 6: _flatten(ranges[6])}
+
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(intervals[4]), len(intervals[6])))
+        # Every array starts on an 8-byte boundary (the IPv4 start and end
+        # arrays together are a whole number of words), as cast() needs
+        for fmt, family, column in ARRAYS:
+            # Native byte order: the arrays are read back with memoryview.cast()
+            values = [interval[column] for interval in intervals[family]]
+            f.write(struct.pack(f"={len(values)}{fmt}", *values))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+    return len(intervals[4]), len(intervals[6])
+
+
+def _source_files(sources):
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            yield from sorted(path for path in source.iterdir() if path.suffix in ('.txt', '.csv'))
+        elif source.exists():
+            yield source
+
+
+class IPReputationIndex:
+    """
+    Read-only view of a compiled index file, mapped into memory.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, n4, n6 = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an IP reputation index")
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        arrays = []
+        for fmt, family, _ in ARRAYS:
+            count = n4 if family == 4 else n6
+            size = struct.calcsize(fmt) * count
+            arrays.append(view[offset:offset + size].cast(fmt))
+            offset += size
+        self._v6_starts, self._v6_ends, self._v6_risks, self._v4_starts, self._v4_ends, self._v4_risks = arrays
+
+    def __len__(self):
+        return len(self._v4_starts) + len(self._v6_starts)
+
+    def lookup(self, ip_address):
+        """
+        Return the risk of an address in [0, 1]; 0.0 when it is in no range
+        or is not a valid address.
+        """
+        try:
+            if ':' in ip_address:
+                packed = socket.inet_pton(socket.AF_INET6, ip_address)
+                if packed[:12] != _IPV4_MAPPED:
+                    return self._find(self._v6_starts, self._v6_ends, self._v6_risks,
+                                      _IPV6_PREFIX.unpack_from(packed)[0])
+                packed = packed[12:]
+            else:
+                packed = socket.inet_pton(socket.AF_INET, ip_address)
+        except (OSError, TypeError):
+            return 0.0
+        return self._find(self._v4_starts, self._v4_ends, self._v4_risks, _IPV4.unpack(packed)[0])
+
+    @staticmethod
+    def _find(starts, ends, risks, key):
+        position = bisect.bisect_right(starts, key) - 1
+        if position >= 0 and key <= ends[position]:
+            return risks[position]
+        return 0.0
+
+
+_index = None
+_next_check_at = float('-inf')
+_reload_lock = threading.Lock()
+
+
+def get_ip_index():
+    """
+    Return the index configured by ``IP_REPUTATION['INDEX_PATH']``, or None
+    if it has not been built.
+
+    At most every ``RELOAD_INTERVAL`` seconds the file is checked, and a
+    rebuilt index is mapped and swapped in; lookups already running keep
+    using the previous mapping.
+    """
+    global _index, _next_check_at
+
+    if time.monotonic() < _next_check_at:
+        return _index
+
+    with _reload_lock:
+        if time.monotonic() < _next_check_at:
+            return _index
+        config = settings.IP_REPUTATION
+        try:
+            stat = os.stat(config['INDEX_PATH'])
+        except OSError:
+            _index = None
+        else:
+            if _index is None or _index.identity != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                _index = IPReputationIndex(config['INDEX_PATH'])
+        _next_check_at = time.monotonic() + config['RELOAD_INTERVAL']
+    return _index
+
+
+def reload_ip_index():
+    """
+    Re-check the index file on the next lookup.
+    """
+    global _next_check_at
+    _next_check_at = float('-inf')
+
+
+def get_ip_risk(ip_address):
+    """
+    Return the risk of an IP address in [0, 1]; 0.0 when no index is built.
+    """
+    index = get_ip_index()
+    return index.lookup(ip_address) if index is not None else 0.0
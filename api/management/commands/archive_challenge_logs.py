@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.archive import ChallengeLogArchive, archive_challenge_logs
+
+
+class Command(BaseCommand):
+    help = 'Move challenge logs older than the retention period into compressed per-day segment files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Archive logs older than this many days (default: CHALLENGE_LOG_ARCHIVE RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows moved per transaction (default: CHALLENGE_LOG_ARCHIVE BATCH_SIZE)')
+        parser.add_argument('--root', default=None,
+                            help='Archive directory (default: CHALLENGE_LOG_ARCHIVE ROOT)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rows that would be archived')
+
+    def handle(self, *args, **options):
+        archive = ChallengeLogArchive(root=options['root'])
+        batches = archive_challenge_logs(
+            older_than_days=options['older_than_days'],
+            batch_size=options['batch_size'],
+            archive=archive,
+            dry_run=options['dry_run'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f"{next(batches)} challenge logs would be archived to {archive.root}")
+            return
+
+        start = time.perf_counter()
+        total = 0
+        for count in batches:
+            total += count
+            self.stdout.write(f"Archived {total} challenge logs...")
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total} challenge logs to {archive.root} in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        ))
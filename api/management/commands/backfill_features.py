@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.feature_store import backfill_features
+
+
+class Command(BaseCommand):
+    help = 'Compute and store behavior feature vectors for challenge logs without current ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Logs per batch (default: FEATURE_BACKFILL BATCH_SIZE)')
+        parser.add_argument('--sleep', type=float, default=None,
+                            help='Seconds to pause between batches (default: FEATURE_BACKFILL SLEEP_SECONDS)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total = 0
+        for count in backfill_features(batch_size=options['batch_size'], sleep_seconds=options['sleep']):
+            total += count
+            self.stdout.write(f"Backfilled {total} logs...")
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {total} logs in {elapsed:.1f}s ({rate:.0f} logs/s)"
+        ))
@@ -0,0 +1,123 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.backtest import COHORTS, COUNTS, ScorerConfig, run_backtest
+from api.model_registry import ALIASES, ModelRegistry
+from api.routers import use_replica
+
+
+class Command(BaseCommand):
+    help = ('Replay historical challenge logs through a scorer configuration and report pass rate '
+            'changes per challenge type and fingerprint cohort')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weight', action='append', default=[], metavar='NAME=VALUE',
+                            help='Scoring component weight to change (correctness, entropy, response_time); '
+                                 'may be repeated')
+        parser.add_argument('--fail-threshold', type=float, default=None,
+                            help='Trust score needed to pass (default: ScoringEngine.FAIL_THRESHOLD)')
+        parser.add_argument('--model', default=None,
+                            help="Registered model version, 'live', 'shadow' or 'none' to score with "
+                                 "(default: the live model, if any)")
+        parser.add_argument('--model-weight', type=float, default=None,
+                            help='Weight of the model in the score (default: MODEL_REGISTRY MODEL_WEIGHT)')
+        parser.add_argument('--cohort', action='append', choices=COHORTS, default=None,
+                            help='Fingerprint field to group attempts by; may be repeated (default: all)')
+        parser.add_argument('--days', type=int, default=None,
+                            help='Only replay logs from the last DAYS days (default: all)')
+        parser.add_argument('--challenge-type', default=None,
+                            help='Only replay logs of this challenge type')
+        parser.add_argument('--chunk-size', type=int, default=20000,
+                            help='Logs per chunk sent to a worker')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: CPU count; 1 scores in this process)')
+
+    def handle(self, *args, **options):
+        baseline = ScorerConfig.current()
+        try:
+            candidate = ScorerConfig(
+                weights=self._parse_weights(options['weight']),
+                fail_threshold=options['fail_threshold'],
+                model_version=self._model_version(options['model'], baseline.model_version),
+                model_weight=options['model_weight'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Baseline:  {baseline.describe()}")
+        self.stdout.write(f"Candidate: {candidate.describe()}")
+
+        start = time.perf_counter()
+        replayed, recomputed, totals = 0, 0, {}
+        # Historical reads go to the replica when one is configured
+        with use_replica():
+            for replayed, recomputed, totals in run_backtest(
+                candidate, baseline, cohorts=options['cohort'] or COHORTS,
+                chunk_size=options['chunk_size'], workers=options['workers'],
+                days=options['days'], challenge_type=options['challenge_type'],
+            ):
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"  {replayed} logs replayed ({replayed / elapsed * 3600:,.0f}/hour)")
+
+        if not replayed:
+            self.stdout.write("No challenge logs to replay")
+            return
+
+        overall = sum(totals['challenge_type'].values())
+        for dimension, groups in totals.items():
+            self._write_table(dimension, groups, overall)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {replayed} challenge logs in {elapsed:.1f}s ({replayed / elapsed * 3600:,.0f}/hour)"
+        ))
+        if recomputed:
+            self.stdout.write(
+                f"{recomputed} logs had no current feature vector; "
+                "run backfill_features to speed up later backtests"
+            )
+
+    def _parse_weights(self, values):
+        weights = {}
+        for value in values:
+            name, _, weight = value.partition('=')
+            try:
+                weights[name] = float(weight)
+            except ValueError:
+                raise CommandError(f"Expected NAME=VALUE, got {value!r}")
+        return weights
+
+    def _model_version(self, model, live_version):
+        if model is None:
+            return live_version
+        if model == 'none':
+            return None
+        registry = ModelRegistry()
+        if model in ALIASES:
+            version = registry.alias(model)
+            if version is None:
+                raise CommandError(f"No model is published as {model}")
+            return version
+        if model not in registry.versions():
+            raise CommandError(f"Unknown model version {model!r}")
+        return model
+
+    def _write_table(self, dimension, groups, overall):
+        index = {name: i for i, name in enumerate(COUNTS)}
+        self.stdout.write('')
+        self.stdout.write(
+            f"{dimension:<20} {'attempts':>10} {'logged':>8} {'baseline':>9} {'candidate':>10} "
+            f"{'delta':>8} {'+passed':>8} {'-passed':>8}"
+        )
+        rows = sorted(groups.items(), key=lambda item: -item[1][index['attempts']])
+        for value, counts in rows + [('(all)', overall)]:
+            attempts = counts[index['attempts']]
+            logged, baseline, candidate = (
+                counts[index[name]] / attempts for name in ('logged_passed', 'baseline_passed', 'candidate_passed')
+            )
+            self.stdout.write(
+                f"{value[:20]:<20} {attempts:>10} {logged:>8.2%} {baseline:>9.2%} {candidate:>10.2%} "
+                f"{(candidate - baseline) * 100:>+7.2f}pp {counts[index['newly_passed']]:>8} "
+                f"{counts[index['newly_failed']]:>8}"
+            )
@@ -0,0 +1,59 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.challenge_store import LocalChallengeStore
+from api.routers import use_replica
+from api.similarity import TrajectoryIndex, build_trajectory_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the near-duplicate mouse path index from recent challenge logs, or report on past logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help='Logs from the last this many hours (default: TRAJECTORY_SIMILARITY WINDOW_SECONDS)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows read per query')
+        parser.add_argument('--report', action='store_true',
+                            help='Build a private index instead of the shared one, and report the logs '
+                                 'that had MIN_SIMILAR or more similar paths when submitted')
+
+    def handle(self, *args, **options):
+        config = settings.TRAJECTORY_SIMILARITY
+        hours = options['hours'] or config['WINDOW_SECONDS'] / 3600
+        since = timezone.now() - timedelta(hours=hours)
+
+        if options['report']:
+            # Sized so replaying many hours does not evict live buckets
+            index = TrajectoryIndex(store=LocalChallengeStore(max_entries=1000000))
+        else:
+            index = TrajectoryIndex()
+
+        start = time.perf_counter()
+        total = 0
+        counts = Counter()
+        # Analytics reads go to the replica when one is configured
+        with use_replica():
+            for rows, added in build_trajectory_index(index, since, options['batch_size'], options['report']):
+                total += rows
+                counts.update({log_id: similar for log_id, similar in added if similar})
+                self.stdout.write(f"Indexed {total} challenge logs...")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed the mouse paths of {total} challenge logs from the last {hours:g} hours in {elapsed:.1f}s"
+        ))
+
+        if options['report']:
+            flagged = [(log_id, similar) for log_id, similar in counts.items() if similar >= config['MIN_SIMILAR']]
+            self.stdout.write(
+                f"{len(flagged)} logs had {config['MIN_SIMILAR']} or more similar paths in the preceding "
+                f"{config['WINDOW_SECONDS'] // 60} minutes"
+            )
+            for log_id, similar in sorted(flagged, key=lambda item: -item[1])[:20]:
+                self.stdout.write(f"  log {log_id}: {similar} similar paths")
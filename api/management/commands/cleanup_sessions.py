@@ -0,0 +1,45 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from api.cleanup import cleanup_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions and stale fingerprint reputation in small, throttled batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows deleted per transaction (default: SESSION_CLEANUP BATCH_SIZE)')
+        parser.add_argument('--sleep', type=float, default=None,
+                            help='Seconds to pause between batches (default: SESSION_CLEANUP SLEEP_SECONDS)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rows that would be deleted')
+
+    def handle(self, *args, **options):
+        batches = cleanup_sessions(
+            batch_size=options['batch_size'],
+            sleep_seconds=options['sleep'],
+            dry_run=options['dry_run'],
+        )
+
+        if options['dry_run']:
+            for label, count in batches:
+                self.stdout.write(f"{count} {label} would be deleted")
+            return
+
+        start = time.perf_counter()
+        totals = Counter()
+        for label, count in batches:
+            totals[label] += count
+            if count:
+                self.stdout.write(f"Deleted {totals[label]} {label}...")
+
+        elapsed = time.perf_counter() - start
+        total = sum(totals.values())
+        rate = total / elapsed if elapsed else 0
+        summary = ', '.join(f"{count} {label}" for label, count in totals.items()) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {summary} in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        ))
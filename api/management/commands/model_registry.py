@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.model_registry import ALIASES, ModelRegistry
+
+
+class Command(BaseCommand):
+    help = 'List registered trust score models, or publish a version as the live or shadow model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--publish', metavar='VERSION', default=None,
+                            help='Version to publish under --alias')
+        parser.add_argument('--alias', choices=ALIASES, default='live',
+                            help='Alias to publish the version as (default: live)')
+        parser.add_argument('--unpublish', choices=ALIASES, default=None,
+                            help='Remove an alias; without a live model, scores come from the heuristic alone')
+
+    def handle(self, *args, **options):
+        registry = ModelRegistry()
+
+        if options['publish']:
+            try:
+                registry.publish(options['alias'], options['publish'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Published {options['publish']} as {options['alias']}"))
+            return
+
+        if options['unpublish']:
+            registry.publish(options['unpublish'], None)
+            self.stdout.write(self.style.SUCCESS(f"Removed the {options['unpublish']} model"))
+            return
+
+        published = {registry.alias(alias): alias for alias in ALIASES}
+        versions = registry.versions()
+        if not versions:
+            self.stdout.write(f"No models registered in {registry.root}")
+        for version in versions:
+            metadata = registry.metadata(version)
+            metrics = ', '.join(f"{name}={value:.4g}" for name, value in metadata.get('metrics', {}).items())
+            alias = f" [{published[version]}]" if version in published else ''
+            self.stdout.write(
+                f"{version}{alias}  {metadata.get('mode', '-')}, {metadata.get('training_rows', '-')} rows, "
+                f"features v{metadata['feature_version']}  {metrics}"
+            )
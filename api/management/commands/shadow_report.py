@@ -0,0 +1,38 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.shadow import read_shadow_logs
+
+
+class Command(BaseCommand):
+    help = 'Compare shadow model scores with the live scorer, from the shadow comparison logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', action='append', dest='days',
+                            help='Only read this day (YYYY-MM-DD); may be repeated')
+        parser.add_argument('--root', default=None,
+                            help='Log directory (default: MODEL_REGISTRY SHADOW_LOG_ROOT)')
+
+    def handle(self, *args, **options):
+        logs = read_shadow_logs(root=options['root'], days=options['days'])
+        if not logs:
+            self.stdout.write("No shadow comparisons logged")
+            return
+
+        for (live_version, shadow_version), records in sorted(logs.items()):
+            agree = np.mean(records['live_passed'] == records['shadow_passed'])
+            delta = records['shadow_score'] - records['live_score']
+            self.stdout.write(f"live {live_version} vs shadow {shadow_version}: {len(records)} attempts")
+            self.stdout.write(
+                f"  pass rate {records['live_passed'].mean():.2%} live, {records['shadow_passed'].mean():.2%} shadow; "
+                f"decisions agree on {agree:.2%}"
+            )
+            self.stdout.write(
+                f"  score delta mean {delta.mean():+.4f}, mean absolute {np.abs(delta).mean():.4f}"
+            )
+            for name in ('live', 'shadow'):
+                latency = records[f'{name}_us']
+                self.stdout.write(
+                    f"  {name} model latency p50 {np.percentile(latency, 50):.0f} us, "
+                    f"p99 {np.percentile(latency, 99):.0f} us"
+                )
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import ChallengeLogArchive
+
+
+class Command(BaseCommand):
+    help = 'Print the archived challenge logs of a session as JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('session_id')
+        parser.add_argument('--day', action='append', dest='days',
+                            help='Only search this day (YYYY-MM-DD); may be repeated')
+        parser.add_argument('--root', default=None,
+                            help='Archive directory (default: CHALLENGE_LOG_ARCHIVE ROOT)')
+
+    def handle(self, *args, **options):
+        try:
+            logs = ChallengeLogArchive(root=options['root']).get_session_logs(
+                options['session_id'], days=options['days']
+            )
+        except ValueError:
+            raise CommandError(f"Invalid session id: {options['session_id']}")
+
+        for log in logs:
+            self.stdout.write(json.dumps(log))
@@ -0,0 +1,21 @@
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def increment(name, amount=1):
+    """
+    Increment a process-local counter.
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def get_counters():
+    """
+    Return a snapshot of all process-local counters.
+    """
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,175 @@
+import io
+import ipaddress
+import math
+import re
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from api import metrics
+from api.challenge_logic.behavior import find_event_arrays
+from api.challenge_store import get_challenge_store
+from api.session_cache import get_cached_session_metadata
+from api.utils import get_client_ip
+
+
+def _content_length(request):
+    try:
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return 0
+
+
+class RequestBudgetMiddleware:
+    """
+    Rejects oversized request bodies with a 413 before they are parsed.
+    Runs after AdmissionControlMiddleware, so only admitted requests have
+    their body read.
+
+    Budgets are configured per URL name in ``REQUEST_BUDGETS``. The body is
+    read in chunks and reading stops as soon as ``MAX_BODY_BYTES`` is
+    exceeded. ``MAX_STREAM_EVENTS`` then caps the number of events in each
+    behavior_data stream, counted on the raw bytes.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        budget = settings.REQUEST_BUDGETS.get(match.url_name) if match else None
+        if budget is None:
+            return None
+
+        max_bytes = budget['MAX_BODY_BYTES']
+        if _content_length(request) > max_bytes:
+            return self._reject(match.url_name, 'body_bytes')
+
+        body = self._read_body(request, max_bytes)
+        if body is None:
+            return self._reject(match.url_name, 'body_bytes')
+
+        max_events = budget.get('MAX_STREAM_EVENTS')
+        if max_events is not None:
+            for start, end in find_event_arrays(body).values():
+                if body.count(b'{', start, end) > max_events:
+                    return self._reject(match.url_name, 'stream_events')
+
+        return None
+
+    def _read_body(self, request, max_bytes):
+        if hasattr(request, '_body'):
+            return request._body if len(request._body) <= max_bytes else None
+
+        chunks = []
+        size = 0
+        while True:
+            chunk = request.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                return None
+            chunks.append(chunk)
+
+        # Hand the buffered body on to the parsers as if it was never read
+        request._body = b''.join(chunks)
+        request._stream = io.BytesIO(request._body)
+        return request._body
+
+    def _reject(self, url_name, reason):
+        metrics.increment('request_budget_rejected')
+        metrics.increment(f"request_budget_rejected_{url_name}_{reason}")
+        return JsonResponse({'error': 'Request entity too large'}, status=413)
+
+
+class AdmissionControlMiddleware:
+    """
+    Rejects over-limit traffic to the challenge endpoints before any ORM work.
+
+    Each request takes a token from a bucket per client IP, per client subnet
+    and, when it can be determined without touching the database, per
+    fingerprint. Buckets live in the shared challenge store so the limits hold
+    across worker processes.
+    """
+
+    FINGERPRINT_ID_RE = re.compile(rb'"fingerprint_id"\s*:\s*"((?:[^"\\]|\\.){1,128})"')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = settings.ADMISSION_CONTROL
+        if not config['ENABLED']:
+            return None
+
+        match = request.resolver_match
+        if match is None or match.url_name not in config['ENDPOINTS']:
+            return None
+
+        store = get_challenge_store()
+        for bucket, (rate, capacity) in self._buckets(request, match.url_name, config):
+            if not store.take_token(f"admission_{bucket}", rate, capacity):
+                metrics.increment('admission_rejected')
+                metrics.increment(f"admission_rejected_{bucket.split(':', 1)[0]}")
+                response = JsonResponse({'error': 'Too many requests'}, status=429)
+                response['Retry-After'] = str(math.ceil(1 / rate))
+                return response
+
+        return None
+
+    def _buckets(self, request, url_name, config):
+        ip_address = get_client_ip(request)
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except (TypeError, ValueError):
+            ip = None
+
+        if ip is not None:
+            yield f"ip:{ip}", config['IP_RATE']
+
+            prefix = config['IPV4_SUBNET_PREFIX'] if ip.version == 4 else config['IPV6_SUBNET_PREFIX']
+            subnet = ipaddress.ip_network(f"{ip}/{prefix}", strict=False)
+            yield f"subnet:{subnet}", config['SUBNET_RATE']
+        else:
+            # Requests without a usable address share one bucket rather than
+            # going unlimited
+            yield "ip:unknown", config['IP_RATE']
+
+        fingerprint_id = self._fingerprint_id(request, url_name)
+        if fingerprint_id:
+            yield f"fingerprint:{fingerprint_id}", config['FINGERPRINT_RATE']
+
+    def _fingerprint_id(self, request, url_name):
+        # init-session carries the fingerprint in its JSON body; pick it out
+        # with a regex rather than parsing a body that may hold behavior_data
+        if url_name == 'init-session':
+            if request.content_type != 'application/json':
+                return None
+            # Bodies over budget are rejected by RequestBudgetMiddleware next;
+            # never buffer them here
+            budget = settings.REQUEST_BUDGETS.get(url_name)
+            if budget is not None and _content_length(request) > budget['MAX_BODY_BYTES']:
+                return None
+            match = self.FINGERPRINT_ID_RE.search(request.body)
+            return match.group(1).decode(errors='replace') if match else None
+
+        # get-challenge only has the session id; resolve it from the store and
+        # never fall back to the database here. Submits are bounded by the
+        # number of challenges handed out, so they are only limited per IP.
+        if url_name == 'get-challenge':
+            session_id = request.GET.get('session_id')
+            if not session_id:
+                return None
+            metadata = get_cached_session_metadata(session_id)
+            return metadata['fingerprint_id'] if metadata else None
+
+        return None
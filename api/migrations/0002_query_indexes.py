@@ -0,0 +1,37 @@
+# Generated by Django 4.2.10 on 2026-10-19 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='challengelog',
+            index=models.Index(fields=['created_at'], name='challengelog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challengelog',
+            index=models.Index(fields=['challenge_type', 'created_at'], name='challengelog_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challengelog',
+            index=models.Index(condition=models.Q(('passed', False)), fields=['created_at'], name='challengelog_failed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['fingerprint_id', 'created_at'], name='session_fingerprint_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['ip_address', 'created_at'], name='session_ip_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(condition=models.Q(('trust_score__isnull', True)), fields=['created_at'], name='session_unscored_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+import api.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChallengeContent',
+            fields=[
+                ('hash', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+            ],
+        ),
+        # Filled in by 0004, then renamed over the JSON columns by 0005
+        migrations.AddField(
+            model_name='challengelog',
+            name='challenge_payload',
+            field=api.models.fields.CompactJSONField(intern_strings=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='challengelog',
+            name='response_payload',
+            field=api.models.fields.CompactJSONField(null=True),
+        ),
+    ]
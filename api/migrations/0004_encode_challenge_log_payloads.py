@@ -0,0 +1,49 @@
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 2000
+
+
+def encode_existing_payloads(apps, schema_editor):
+    """
+    Re-encode the JSON payloads of existing challenge logs, in id order
+    batches of one transaction each. Logs already re-encoded by an earlier,
+    interrupted run are skipped.
+    """
+    ChallengeLog = apps.get_model('api', 'ChallengeLog')
+    queryset = ChallengeLog.objects.filter(response_payload__isnull=True).order_by('id')
+
+    last_id = 0
+    while True:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            rows = list(
+                queryset.filter(id__gt=last_id).values_list('id', 'challenge_data', 'response_data')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+
+            ChallengeLog.objects.bulk_update(
+                [
+                    ChallengeLog(id=log_id, challenge_payload=challenge_data, response_payload=response_data)
+                    for log_id, challenge_data, response_data in rows
+                ],
+                ['challenge_payload', 'response_payload'],
+            )
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    # Committed batch by batch, so a large table is not rewritten in one
+    # transaction and an interrupted run resumes where it stopped
+    atomic = False
+
+    dependencies = [
+        ('api', '0003_compact_challenge_log_payloads'),
+    ]
+
+    operations = [
+        # Reversing leaves the JSON columns as they were; 0003 then drops
+        # the encoded copies
+        migrations.RunPython(encode_existing_payloads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+import api.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_encode_challenge_log_payloads'),
+    ]
+
+    operations = [
+        # One-way: the JSON columns are dropped now that their rows are
+        # re-encoded, so unapplying stops here before any schema change
+        migrations.RunPython(migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='challengelog',
+            name='challenge_data',
+        ),
+        migrations.RemoveField(
+            model_name='challengelog',
+            name='response_data',
+        ),
+        migrations.RenameField(
+            model_name='challengelog',
+            old_name='challenge_payload',
+            new_name='challenge_data',
+        ),
+        migrations.RenameField(
+            model_name='challengelog',
+            old_name='response_payload',
+            new_name='response_data',
+        ),
+        migrations.AlterField(
+            model_name='challengelog',
+            name='challenge_data',
+            field=api.models.fields.CompactJSONField(intern_strings=True),
+        ),
+        migrations.AlterField(
+            model_name='challengelog',
+            name='response_data',
+            field=api.models.fields.CompactJSONField(),
+        ),
+    ]
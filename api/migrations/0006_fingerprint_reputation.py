@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-19 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_drop_json_challenge_log_payloads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FingerprintReputation',
+            fields=[
+                ('fingerprint_id', models.CharField(max_length=128, primary_key=True, serialize=False)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('passes', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0.0)),
+                ('last_seen', models.DateTimeField()),
+            ],
+        ),
+    ]
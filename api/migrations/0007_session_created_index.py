@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-19 05:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_fingerprint_reputation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(fields=['created_at'], name='session_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-19 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_session_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengelog',
+            name='feature_version',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='challengelog',
+            name='features',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import secrets
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from api.challenge_logic.features import FEATURE_NAMES, FEATURE_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+# Model inputs, in order: the challenge time, the fingerprint entropy and the
+# shared behavior features
+MODEL_COLUMNS = ('time_taken_ms', 'entropy_score') + FEATURE_NAMES
+
+# Names a version can be published under
+ALIASES = ('live', 'shadow')
+
+# joblib, pandas and the scikit-learn pipelines are imported when a model is
+# registered or loaded, so workers without a published model never pay for
+# them at start-up
+
+
+def model_inputs(features, time_taken_ms, entropy_scores):
+    """
+    Build the model input frame for attempts being scored, in MODEL_COLUMNS order.
+
+    Args:
+        features: Behavior feature vectors, shape (attempts, len(FEATURE_NAMES))
+        time_taken_ms: Challenge time of each attempt
+        entropy_scores: Fingerprint entropy of each attempt; None when unknown
+    """
+    values = np.empty((len(features), len(MODEL_COLUMNS)), dtype=np.float64)
+    values[:, 0] = time_taken_ms
+    values[:, 1] = [np.nan if score is None else score for score in entropy_scores]
+    values[:, 2:] = features
+    import pandas as pd
+
+    return pd.DataFrame(values, columns=MODEL_COLUMNS)
+
+
+class RegisteredModel:
+    """
+    A loaded model version. Immutable once loaded, so it can be shared by
+    threads and swapped out without locking.
+    """
+
+    def __init__(self, version, metadata, pipeline):
+        self.version = version
+        self.metadata = metadata
+        self.pipeline = pipeline
+        self.feature_columns = list(metadata['feature_columns'])
+
+    def predict(self, features, time_taken_ms, entropy_scores):
+        """
+        Return the probability that each attempt is human (see model_inputs).
+        """
+        frame = model_inputs(features, time_taken_ms, entropy_scores)
+        return self.pipeline.predict_proba(frame[self.feature_columns])[:, 1]
+
+
+class ModelRegistry:
+    """
+    Versioned trust score models in a directory:
+
+      <root>/versions/<version>/model.joblib     the fitted pipeline
+      <root>/versions/<version>/metadata.json    feature version, columns, metrics...
+      <root>/<alias>                             name of the version published as
+                                                 'live' or 'shadow'
+
+    Versions are written to a temporary directory and renamed into place,
+    and aliases are replaced with a rename, so readers in other processes
+    never see a partial version or alias.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.MODEL_REGISTRY['ROOT'])
+
+    def _version_dir(self, version):
+        return self.root / 'versions' / version
+
+    def register(self, pipeline, feature_columns, **metadata):
+        """
+        Store a fitted pipeline as a new version.
+
+        Args:
+            pipeline: Fitted scikit-learn estimator with predict_proba
+            feature_columns: MODEL_COLUMNS it was trained on, in order
+            **metadata: Anything else worth keeping (dataset, metrics...)
+
+        Returns:
+            str: The new version's name, sortable by creation time
+        """
+        import joblib
+
+        created_at = datetime.now(timezone.utc)
+        version = f"{created_at:%Y%m%d-%H%M%S}-{secrets.token_hex(3)}"
+        metadata = {
+            **metadata,
+            'version': version,
+            'created_at': created_at.isoformat(),
+            'feature_version': FEATURE_VERSION,
+            'feature_columns': list(feature_columns),
+        }
+
+        versions = self.root / 'versions'
+        versions.mkdir(parents=True, exist_ok=True)
+        tmp_dir = versions / f".{version}.tmp"
+        tmp_dir.mkdir()
+        try:
+            joblib.dump(pipeline, tmp_dir / 'model.joblib')
+            (tmp_dir / 'metadata.json').write_text(json.dumps(metadata, indent=2))
+            os.replace(tmp_dir, self._version_dir(version))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return version
+
+    def versions(self):
+        """
+        Return the registered versions, oldest first.
+        """
+        versions = self.root / 'versions'
+        if not versions.is_dir():
+            return []
+        return sorted(path.name for path in versions.iterdir() if not path.name.startswith('.'))
+
+    def metadata(self, version):
+        return json.loads((self._version_dir(version) / 'metadata.json').read_text())
+
+    def load(self, version):
+        """
+        Load a version.
+
+        Raises:
+            ValueError: If it was trained on another feature extractor version
+        """
+        metadata = self.metadata(version)
+        if metadata['feature_version'] != FEATURE_VERSION:
+            raise ValueError(
+                f"Model {version} has feature version {metadata['feature_version']}, expected {FEATURE_VERSION}"
+            )
+        import joblib
+
+        pipeline = joblib.load(self._version_dir(version) / 'model.joblib')
+
+        # Requests are scored one at a time, where starting a thread pool
+        # would cost more than it saves
+        classifier = pipeline[-1] if hasattr(pipeline, 'steps') else pipeline
+        if getattr(classifier, 'n_jobs', None) not in (None, 1):
+            classifier.n_jobs = 1
+        return RegisteredModel(version, metadata, pipeline)
+
+    def alias(self, alias):
+        """
+        Return the version published as ``alias``, or None.
+        """
+        try:
+            return (self.root / alias).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, alias, version):
+        """
+        Point ``alias`` at a version, or remove it when ``version`` is None.
+        Workers pick the change up within ``RELOAD_INTERVAL`` seconds.
+        """
+        if alias not in ALIASES:
+            raise ValueError(f"Unknown alias {alias!r}")
+        path = self.root / alias
+        if version is None:
+            path.unlink(missing_ok=True)
+            return
+        if not (self._version_dir(version) / 'metadata.json').is_file():
+            raise ValueError(f"Unknown model version {version!r}")
+
+        tmp_path = self.root / f".{alias}.{os.getpid()}.tmp"
+        tmp_path.write_text(version)
+        os.replace(tmp_path, path)
+
+
+_models = dict.fromkeys(ALIASES)
+_next_check_at = dict.fromkeys(ALIASES, float('-inf'))
+_check_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+
+def _reload(alias):
+    # One load at a time, so an older version never replaces a newer one
+    with _reload_lock:
+        try:
+            registry = ModelRegistry()
+            version = registry.alias(alias)
+            current = _models[alias]
+            if version is None:
+                _models[alias] = None
+            elif current is None or current.version != version:
+                try:
+                    _models[alias] = registry.load(version)
+                    logger.info("Loaded %s model %s", alias, version)
+                except Exception:
+                    logger.exception("Could not load %s model %s", alias, version)
+        finally:
+            _next_check_at[alias] = time.monotonic() + settings.MODEL_REGISTRY['RELOAD_INTERVAL']
+
+
+def get_model(alias):
+    """
+    Return the model published as ``alias`` ('live' or 'shadow'), or None.
+
+    Only reads the loaded model, so requests never wait on the registry. At
+    most every ``RELOAD_INTERVAL`` seconds a loader thread re-reads the
+    alias and loads a newly published version, which is swapped in once
+    loaded; until then the previous model keeps scoring. A version that
+    fails to load is logged and skipped.
+    """
+    if time.monotonic() >= _next_check_at[alias] and _check_lock.acquire(blocking=False):
+        try:
+            if time.monotonic() >= _next_check_at[alias]:
+                # Until the loader is done, so only one is started
+                _next_check_at[alias] = float('inf')
+                threading.Thread(target=_reload, args=(alias,), name=f'model-loader-{alias}', daemon=True).start()
+        finally:
+            _check_lock.release()
+    return _models[alias]
+
+
+def load_models():
+    """
+    Re-read the aliases and load newly published versions now, in this
+    thread; for start-up and commands, where waiting is fine.
+    """
+    for alias in ALIASES:
+        _reload(alias)
+
+
+def reload_models():
+    """
+    Re-read the aliases, in the background, on the next get_model() call.
+    """
+    for alias in ALIASES:
+        _next_check_at[alias] = float('-inf')
+
+
+def apply_live_model(scoring_engine, trust_score, features, time_taken_ms, entropy_score):
+    """
+    Blend the live model's human probability into a challenge score (see
+    ScoringEngine.apply_model_score). Without a live model, or if it fails,
+    the score is returned unchanged.
+
+    Returns:
+        tuple: (challenge score, live model version or None, seconds spent
+        in the model)
+    """
+    model = get_model('live')
+    if model is None:
+        return trust_score, None, 0.0
+
+    start = time.perf_counter()
+    try:
+        probability = model.predict(features[None], [time_taken_ms], [entropy_score])[0]
+    except Exception:
+        logger.exception("Live model %s failed", model.version)
+        return trust_score, None, 0.0
+    return scoring_engine.apply_model_score(trust_score, probability), model.version, time.perf_counter() - start
@@ -1,5 +1,7 @@
 from .user_session import UserSession
 from .challenge_log import ChallengeLog
 from .fingerprint import Fingerprint
+from .challenge_content import ChallengeContent
+from .fingerprint_reputation import FingerprintReputation
 
-__all__ = ['UserSession', 'ChallengeLog', 'Fingerprint']
\ No newline at end of file
+__all__ = ['UserSession', 'ChallengeLog', 'Fingerprint', 'ChallengeContent', 'FingerprintReputation']
\ No newline at end of file
@@ -0,0 +1,13 @@
+from django.db import models
+
+
+class ChallengeContent(models.Model):
+    """
+    Static challenge text (corpus samples, instructions) stored once and
+    referenced by content hash from ChallengeLog.challenge_data.
+    """
+    hash = models.CharField(max_length=32, primary_key=True)
+    content = models.TextField()
+
+    def __str__(self):
+        return f"{self.hash} - {self.content[:40]}"
@@ -1,4 +1,5 @@
 from django.db import models
+from .fields import CompactJSONField
 from .user_session import UserSession
 
 
@@ -8,11 +9,31 @@ class ChallengeLog(models.Model):
     """
     session = models.ForeignKey(UserSession, on_delete=models.CASCADE, related_name='challenge_logs')
     challenge_type = models.CharField(max_length=64)
-    challenge_data = models.JSONField()
-    response_data = models.JSONField()
+    # Stored in the compact encoding of api.codec; challenge text is kept
+    # once in ChallengeContent
+    challenge_data = CompactJSONField(intern_strings=True)
+    response_data = CompactJSONField()
     passed = models.BooleanField()
     time_taken_ms = models.IntegerField()
+    # Behavior feature vector computed when the attempt was scored (see
+    # api.challenge_logic.features.pack_features) and the extractor version
+    # that computed it; null for logs from before features were stored
+    features = models.BinaryField(null=True)
+    feature_version = models.PositiveSmallIntegerField(null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Time-range scans: analytics windows, archival and dataset exports
+            models.Index(fields=['created_at'], name='challengelog_created_idx'),
+            # Per challenge type analytics over a time range
+            models.Index(fields=['challenge_type', 'created_at'], name='challengelog_type_created_idx'),
+            # Failed attempts are the minority that investigations look at
+            models.Index(
+                fields=['created_at'], name='challengelog_failed_idx',
+                condition=models.Q(passed=False)
+            ),
+        ]
+
     def __str__(self):
         return f"{self.challenge_type} - {'Passed' if self.passed else 'Failed'} - {self.time_taken_ms}ms"
@@ -0,0 +1,108 @@
+import base64
+import threading
+
+from django.db import models, transaction
+
+from api.codec import decode_payload, encode_payload
+from .challenge_content import ChallengeContent
+
+
+class _ContentCache:
+    """
+    Process-local cache of ChallengeContent rows known to be committed.
+
+    Content is immutable for a given hash, so entries never go stale; the
+    cache is simply emptied when it reaches ``max_entries``.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._contents = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, hashes):
+        return {key: self._contents[key] for key in hashes if key in self._contents}
+
+    def update(self, contents):
+        with self._lock:
+            if len(self._contents) + len(contents) > self.max_entries:
+                self._contents.clear()
+            self._contents.update(contents)
+
+
+_content_cache = _ContentCache()
+
+
+def _store_contents(contents):
+    """
+    Insert ChallengeContent rows that are not known to exist yet.
+    """
+    known = _content_cache.get_many(contents)
+    missing = {key: text for key, text in contents.items() if key not in known}
+    if not missing:
+        return
+
+    # INSERT ... ON CONFLICT DO NOTHING: concurrent writers may store the same content
+    ChallengeContent.objects.bulk_create(
+        [ChallengeContent(hash=key, content=text) for key, text in missing.items()],
+        ignore_conflicts=True,
+    )
+    # Only trust the rows once they are committed; a rollback would remove them
+    transaction.on_commit(lambda: _content_cache.update(missing))
+
+
+def _resolve_contents(hashes):
+    contents = _content_cache.get_many(hashes)
+    missing = hashes.difference(contents)
+    if missing:
+        loaded = dict(ChallengeContent.objects.filter(hash__in=missing).values_list('hash', 'content'))
+        _content_cache.update(loaded)
+        contents.update(loaded)
+    return contents
+
+
+class CompactJSONField(models.BinaryField):
+    """
+    Stores a JSON payload in the compact binary format of api.codec.
+
+    Reads return the decoded Python value. With ``intern_strings`` long
+    strings are deduplicated into the ChallengeContent table. The column
+    cannot be filtered on.
+    """
+
+    def __init__(self, *args, intern_strings=False, **kwargs):
+        self.intern_strings = intern_strings
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.intern_strings:
+            kwargs['intern_strings'] = True
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return decode_payload(value, _resolve_contents)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            value = base64.b64decode(value.encode('ascii'))
+        if isinstance(value, (bytes, memoryview)):
+            return decode_payload(value, _resolve_contents)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, memoryview)):
+            return value
+
+        if not self.intern_strings:
+            return encode_payload(value)
+
+        contents = {}
+        encoded = encode_payload(value, intern=contents.__setitem__)
+        _store_contents(contents)
+        return encoded
+
+    def value_to_string(self, obj):
+        return base64.b64encode(self.get_prep_value(self.value_from_object(obj))).decode('ascii')
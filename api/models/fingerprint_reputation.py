@@ -0,0 +1,48 @@
+from django.db import connections, models, router
+from django.utils import timezone
+
+
+class FingerprintReputationManager(models.Manager):
+    def record_attempt(self, fingerprint_id, trust_score, passed):
+        """
+        Add one challenge attempt to a fingerprint's aggregates.
+
+        A single INSERT ... ON CONFLICT DO UPDATE, so concurrent submits for
+        the same fingerprint never lose an increment.
+        """
+        connection = connections[router.db_for_write(self.model)]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (fingerprint_id, attempts, passes, score_sum, last_seen)
+                VALUES (%s, 1, %s, %s, %s)
+                ON CONFLICT (fingerprint_id) DO UPDATE SET
+                    attempts = {table}.attempts + 1,
+                    passes = {table}.passes + excluded.passes,
+                    score_sum = {table}.score_sum + excluded.score_sum,
+                    last_seen = excluded.last_seen
+                """,
+                [fingerprint_id, int(passed), float(trust_score),
+                 connection.ops.adapt_datetimefield_value(timezone.now())],
+            )
+
+
+class FingerprintReputation(models.Model):
+    """
+    Running challenge history of a browser fingerprint across sessions.
+    """
+    fingerprint_id = models.CharField(max_length=128, primary_key=True)
+    attempts = models.PositiveIntegerField(default=0)
+    passes = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0.0)
+    last_seen = models.DateTimeField()
+
+    objects = FingerprintReputationManager()
+
+    @property
+    def mean_score(self):
+        return self.score_sum / self.attempts if self.attempts else None
+
+    def __str__(self):
+        return f"Reputation {self.fingerprint_id} - {self.passes}/{self.attempts} passed"
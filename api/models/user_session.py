@@ -12,5 +12,19 @@ class UserSession(models.Model):
     trust_score = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Session history for a fingerprint or an IP, most recent first
+            models.Index(fields=['fingerprint_id', 'created_at'], name='session_fingerprint_idx'),
+            models.Index(fields=['ip_address', 'created_at'], name='session_ip_idx'),
+            # Expiry: sessions oldest first, and (smaller) the sessions that
+            # never got a trust score, which expire much sooner
+            models.Index(fields=['created_at'], name='session_created_idx'),
+            models.Index(
+                fields=['created_at'], name='session_unscored_idx',
+                condition=models.Q(trust_score__isnull=True)
+            ),
+        ]
+
     def __str__(self):
         return f"Session {self.id} - Trust: {self.trust_score or 'N/A'}"
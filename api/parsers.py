@@ -0,0 +1,101 @@
+import io
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from api.challenge_logic.behavior import (
+    STREAM_FIELDS, EventStream, decode_event_array, find_event_arrays
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """
+    Parses JSON request bodies with orjson when it is installed.
+
+    Falls back to the standard library parser when orjson is unavailable or
+    the request uses a charset other than UTF-8.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class BehaviorJSONParser(FastJSONParser):
+    """
+    Parses submit-challenge bodies, decoding behavior_data event arrays
+    straight into EventStream columns instead of lists of dicts.
+
+    The event arrays are cut out of the raw body and replaced by placeholders
+    before the rest of the document is parsed. If the placeholders do not end
+    up inside behavior_data the whole body is parsed normally instead.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        raw = stream.read()
+        spans = find_event_arrays(raw)
+
+        data = None
+        if spans:
+            data = self._parse_spliced(raw, spans, media_type, parser_context)
+        if data is None:
+            data = super().parse(io.BytesIO(raw), media_type, parser_context)
+
+        # Arrays that could not be located in the raw body arrive as lists
+        self._convert_event_lists(data)
+        return data
+
+    def _convert_event_lists(self, data):
+        behavior_data = data.get('behavior_data') if isinstance(data, dict) else None
+        if not isinstance(behavior_data, dict):
+            return
+        for name, fields in STREAM_FIELDS.items():
+            if isinstance(behavior_data.get(name), list):
+                behavior_data[name] = EventStream.from_events(
+                    behavior_data[name], fields, settings.BEHAVIOR_STREAM_MAX_EVENTS
+                )
+
+    def _parse_spliced(self, raw, spans, media_type, parser_context):
+        # Placeholders are JSON strings that start with an escaped NUL
+        marker = b'\\u0000event-stream:'
+        if marker in raw:
+            return None
+
+        # Splice from the end so earlier offsets stay valid
+        spliced = raw
+        for name, (start, end) in sorted(spans.items(), key=lambda item: -item[1][0]):
+            spliced = spliced[:start] + b'"' + marker + name.encode() + b'"' + spliced[end:]
+
+        try:
+            data = super().parse(io.BytesIO(spliced), media_type, parser_context)
+        except ParseError:
+            return None
+
+        behavior_data = data.get('behavior_data') if isinstance(data, dict) else None
+        if not isinstance(behavior_data, dict):
+            return None
+        if any(behavior_data.get(name) != f"\x00event-stream:{name}" for name in spans):
+            return None
+
+        for name, (start, end) in spans.items():
+            try:
+                behavior_data[name] = decode_event_array(
+                    raw[start:end], STREAM_FIELDS[name], settings.BEHAVIOR_STREAM_MAX_EVENTS
+                )
+            except ValueError as exc:
+                raise ParseError(f"Invalid {name} - {exc}")
+        return data
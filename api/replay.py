@@ -0,0 +1,76 @@
+import hashlib
+import time
+
+import numpy as np
+from django.conf import settings
+
+from api.challenge_logic.behavior import STREAM_FIELDS, event_columns
+from api.challenge_store import get_challenge_store
+
+
+def trace_digest(behavior_data):
+    """
+    Return a hash of the mouse and keystroke traces in behavior_data, or None
+    if there are too few mouse events for a replay to be meaningful.
+
+    Positions and timestamps are taken relative to the first event and
+    rounded, so a recording replayed at another time or page offset hashes
+    the same.
+    """
+    if not isinstance(behavior_data, dict):
+        return None
+
+    digest = hashlib.blake2b(digest_size=16)
+    for name, fields in STREAM_FIELDS.items():
+        events = behavior_data.get(name) or []
+        if name == 'mouse_movements' and len(events) < settings.REPLAY_DETECTION['MIN_MOUSE_EVENTS']:
+            return None
+        try:
+            columns = event_columns(events, fields)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        digest.update(name.encode())
+        for column in columns:
+            if len(column):
+                digest.update(np.rint(column - column[0]).astype(np.int64).tobytes())
+    return digest.digest()
+
+
+def _bit_offsets(digest, num_bits, num_hashes):
+    # Double hashing: offsets h1 + i * h2 behave like independent hashes
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+def check_and_record_trace(behavior_data, now=None):
+    """
+    Record a submitted behavior trace and report whether it was seen before.
+
+    Traces go into a Bloom filter in the challenge store, rotated every
+    ``WINDOW_SECONDS / GENERATIONS``; a trace counts as a replay if it is in
+    the current filter or one of the ``GENERATIONS - 1`` before it. Memory is
+    ``BITS / 8`` bytes per generation whatever the traffic, at the cost of a
+    false positive rate that grows with the number of traces per window.
+
+    Returns:
+        bool: True if the trace is (probably) a replay; False for new traces
+        and traces too short to tell
+    """
+    config = settings.REPLAY_DETECTION
+    if not config['ENABLED']:
+        return False
+
+    digest = trace_digest(behavior_data)
+    if digest is None:
+        return False
+
+    slot_seconds = config['WINDOW_SECONDS'] / config['GENERATIONS']
+    generation = int((time.time() if now is None else now) // slot_seconds)
+    return get_challenge_store().bloom_add(
+        f"replay_bloom_{generation}",
+        _bit_offsets(digest, config['BITS'], config['HASHES']),
+        timeout=config['WINDOW_SECONDS'] + slot_seconds,
+        check_keys=[f"replay_bloom_{generation - age}" for age in range(1, config['GENERATIONS'])],
+    )
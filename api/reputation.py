@@ -0,0 +1,90 @@
+import threading
+import time
+
+from django.conf import settings
+
+from api.models import FingerprintReputation
+
+
+class _TTLCache:
+    """
+    Small process-local cache whose entries expire after a fixed time.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return (hit, value); misses and expired entries return (False, None).
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def set(self, key, value, ttl, max_entries):
+        with self._lock:
+            if len(self._entries) >= max_entries:
+                now = time.monotonic()
+                self._entries = {k: e for k, e in self._entries.items() if e[0] > now}
+                while len(self._entries) >= max_entries:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _TTLCache()
+
+
+def get_reputation(fingerprint_id):
+    """
+    Return a fingerprint's challenge history, or None if it has none.
+
+    Served from an in-process cache for ``FINGERPRINT_REPUTATION['CACHE_TTL']``
+    seconds, so other workers' updates show up within that time.
+
+    Returns:
+        dict: attempts, passes, mean_score and last_seen (ISO 8601), JSON-safe
+    """
+    hit, reputation = _cache.get(fingerprint_id)
+    if hit:
+        return reputation
+
+    row = (
+        FingerprintReputation.objects.filter(fingerprint_id=fingerprint_id)
+        .values('attempts', 'passes', 'score_sum', 'last_seen').first()
+    )
+    reputation = None
+    if row is not None and row['attempts']:
+        reputation = {
+            'attempts': row['attempts'],
+            'passes': row['passes'],
+            'mean_score': row['score_sum'] / row['attempts'],
+            'last_seen': row['last_seen'].isoformat(),
+        }
+
+    config = settings.FINGERPRINT_REPUTATION
+    # Unknown fingerprints are cached too, they are the common case
+    _cache.set(fingerprint_id, reputation, config['CACHE_TTL'], config['CACHE_MAX_ENTRIES'])
+    return reputation
+
+
+def record_attempt(fingerprint_id, trust_score, passed):
+    """
+    Add a challenge attempt to a fingerprint's reputation.
+    """
+    FingerprintReputation.objects.record_attempt(fingerprint_id, trust_score, passed)
+    _cache.delete(fingerprint_id)
+
+
+def clear_reputation_cache():
+    _cache.clear()
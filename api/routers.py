@@ -0,0 +1,71 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from api.challenge_store import get_challenge_store
+
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def _pin_key(session_id):
+    return f"db_pin_{session_id}"
+
+
+def pin_session(session_id):
+    """
+    Send reads about a session to the primary for a while after it was written.
+
+    The pin lasts ``DATABASE_REPLICA['PIN_SECONDS']``, which should cover the
+    replica's replication lag, and is kept in the shared challenge store so
+    every worker honours it.
+    """
+    config = settings.DATABASE_REPLICA
+    if config['ALIAS'] and config['PIN_SECONDS'] > 0:
+        get_challenge_store().set(_pin_key(session_id), True, timeout=config['PIN_SECONDS'])
+
+
+@contextmanager
+def use_replica(session_ids=()):
+    """
+    Route the reads made inside the block to the read replica.
+
+    Reads stay on the primary when no replica is configured, or when any of
+    ``session_ids`` was written within the pin window.
+    """
+    config = settings.DATABASE_REPLICA
+    enabled = bool(config['ALIAS'])
+    if enabled and session_ids and config['PIN_SECONDS'] > 0:
+        enabled = not get_challenge_store().get_many(_pin_key(session_id) for session_id in session_ids)
+
+    token = _replica_reads.set(enabled)
+    try:
+        yield enabled
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads made inside ``use_replica()`` to the replica alias named in
+    ``DATABASE_REPLICA``, and everything else to the primary (``default``).
+
+    Writes and migrations always go to the primary; the replica gets its
+    schema and data through replication.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return settings.DATABASE_REPLICA['ALIAS']
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
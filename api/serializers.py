@@ -1,7 +1,46 @@
+from django.conf import settings
 from rest_framework import serializers
+from api.challenge_logic.behavior import STREAM_FIELDS, EventStream
 from api.models import UserSession, ChallengeLog, Fingerprint
 
 
+class JSONObjectField(serializers.Field):
+    """
+    A JSON object that the request parser has already decoded.
+
+    Unlike JSONField this does not re-encode the whole value to validate it.
+    """
+    default_error_messages = {
+        'invalid': 'Expected a JSON object.'
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, dict):
+            self.fail('invalid')
+        return data
+
+    def to_representation(self, value):
+        return value
+
+
+class BehaviorDataField(JSONObjectField):
+    """
+    A behavior_data object whose event streams (see STREAM_FIELDS) are each
+    missing, a list of events, or an EventStream decoded by the request parser.
+    """
+    default_error_messages = {
+        'invalid': 'Expected a JSON object.',
+        'invalid_stream': 'Expected a list of events for {name}.',
+    }
+
+    def to_internal_value(self, data):
+        data = super().to_internal_value(data)
+        for name in STREAM_FIELDS:
+            if name in data and not isinstance(data[name], (list, EventStream)):
+                self.fail('invalid_stream', name=name)
+        return data
+
+
 class FingerprintSerializer(serializers.ModelSerializer):
     class Meta:
         model = Fingerprint
@@ -11,13 +50,15 @@ class FingerprintSerializer(serializers.ModelSerializer):
 
 class UserSessionSerializer(serializers.ModelSerializer):
     fingerprint = FingerprintSerializer(required=False)
+    behavior_data = BehaviorDataField(required=False, write_only=True)
 
     class Meta:
         model = UserSession
-        fields = ['id', 'fingerprint_id', 'ip_address', 'trust_score', 'created_at', 'fingerprint']
+        fields = ['id', 'fingerprint_id', 'ip_address', 'trust_score', 'created_at', 'fingerprint', 'behavior_data']
         read_only_fields = ['id', 'created_at', 'trust_score']
 
     def create(self, validated_data):
+        validated_data.pop('behavior_data', None)
         fingerprint_data = validated_data.pop('fingerprint', None)
         session = UserSession.objects.create(**validated_data)
 
@@ -41,6 +82,19 @@ class TrustScoreSerializer(serializers.Serializer):
     passed = serializers.BooleanField(read_only=True)
 
 
+class BatchTrustScoreRequestSerializer(serializers.Serializer):
+    session_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.BATCH_TRUST_SCORE_MAX_SESSIONS
+    )
+
+
+class SessionCheckSerializer(serializers.Serializer):
+    session_id = serializers.UUIDField()
+    behavior_data = BehaviorDataField()
+
+
 class ChallengeRequestSerializer(serializers.Serializer):
     session_id = serializers.UUIDField()
 
@@ -48,6 +102,6 @@ class ChallengeRequestSerializer(serializers.Serializer):
 class ChallengeResponseSerializer(serializers.Serializer):
     session_id = serializers.UUIDField()
     challenge_type = serializers.CharField()
-    response_data = serializers.JSONField()
-    behavior_data = serializers.JSONField()
+    response_data = JSONObjectField()
+    behavior_data = BehaviorDataField()
     time_taken_ms = serializers.IntegerField(required=False)
@@ -0,0 +1,99 @@
+from django.conf import settings
+
+from api.challenge_store import get_challenge_store
+from api.ip_reputation import get_ip_risk
+from api.models import UserSession
+from api.reputation import get_reputation
+
+
+def _cache_key(session_id):
+    return f"session_meta_{session_id}"
+
+
+def _passive_check_key(session_id):
+    return f"passive_check_{session_id}"
+
+
+def _build_metadata(session_id, fingerprint_id, ip_address, headless=None, entropy_score=None):
+    return {
+        'id': str(session_id),
+        'fingerprint_id': fingerprint_id,
+        'ip_address': ip_address,
+        'headless': headless,
+        'entropy_score': entropy_score,
+        # Snapshot of the fingerprint's history, so scoring the submit needs no query
+        'reputation': get_reputation(fingerprint_id),
+        # ip_address is the client address from trusted proxy hops only (see
+        # api.utils.get_client_ip), never the client-supplied first hop
+        'ip_risk': get_ip_risk(ip_address),
+    }
+
+
+def cache_session(session):
+    """
+    Cache the metadata the challenge endpoints need for a freshly created session.
+
+    Returns:
+        dict: The cached metadata
+    """
+    headless = entropy_score = None
+    # Only use the fingerprint if it is already loaded, never query for it here
+    if UserSession.fingerprint.is_cached(session):
+        headless = session.fingerprint.headless
+        entropy_score = session.fingerprint.entropy_score
+
+    metadata = _build_metadata(
+        session.id, session.fingerprint_id, session.ip_address, headless, entropy_score
+    )
+    store = get_challenge_store()
+    store.set(_cache_key(session.id), metadata, timeout=settings.SESSION_METADATA_TIMEOUT)
+    # A new session gets a single chance to pass on passive behavior
+    store.set(_passive_check_key(session.id), True, timeout=settings.SESSION_METADATA_TIMEOUT)
+    return metadata
+
+
+def consume_passive_check(session_id):
+    """
+    Use up the session's passive check (see cache_session).
+
+    Returns:
+        bool: True the first time for a session, False afterwards and once
+        the check has expired
+    """
+    return get_challenge_store().consume(_passive_check_key(session_id)) is not None
+
+
+def get_cached_session_metadata(session_id):
+    """
+    Look up session metadata in the store only, never touching the database.
+
+    Returns:
+        dict: The session metadata, or None on a cache miss
+    """
+    return get_challenge_store().get(_cache_key(session_id))
+
+
+def get_session_metadata(session_id):
+    """
+    Look up session metadata, falling back to the database on a cache miss.
+
+    Returns:
+        dict: The session metadata, or None if the session does not exist
+    """
+    store = get_challenge_store()
+    metadata = store.get(_cache_key(session_id))
+    if metadata is not None:
+        return metadata
+
+    row = UserSession.objects.filter(id=session_id).values(
+        'id', 'fingerprint_id', 'ip_address', 'fingerprint__headless', 'fingerprint__entropy_score'
+    ).first()
+    if row is None:
+        return None
+
+    metadata = _build_metadata(
+        row['id'], row['fingerprint_id'], row['ip_address'],
+        row['fingerprint__headless'], row['fingerprint__entropy_score']
+    )
+    store.set(_cache_key(session_id), metadata, timeout=settings.SESSION_METADATA_TIMEOUT)
+    return metadata
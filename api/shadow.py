@@ -0,0 +1,174 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from api import metrics
+from api.challenge_logic.scoring import ScoringEngine
+from api.model_registry import get_model
+
+logger = logging.getLogger(__name__)
+
+
+# One fixed-width record per shadow-scored attempt
+SHADOW_RECORD = np.dtype([
+    ('time', '<f8'),           # seconds since the epoch
+    ('log_id', '<i8'),         # ChallengeLog id, to join with the attempt offline
+    ('live_score', '<f4'),     # trust score the live scorer gave
+    ('shadow_score', '<f4'),   # trust score with the shadow model instead
+    ('live_passed', '?'),
+    ('shadow_passed', '?'),
+    ('live_us', '<u4'),        # microseconds in the live model (0 without one)
+    ('shadow_us', '<u4'),      # microseconds in the shadow model
+])
+
+# Attempts written to the log in one append
+WRITE_BATCH = 256
+
+
+class ShadowScorer:
+    """
+    Scores submitted attempts with the 'shadow' model in a background thread,
+    off the response path, and logs how it compares to the live scorer.
+
+    Attempts are handed over through a bounded queue; when the thread falls
+    behind, new attempts are dropped (and counted as ``shadow_dropped``)
+    rather than slowing requests down or growing memory. Records are
+    appended to ``SHADOW_LOG_ROOT/<day>/<live version>__<shadow version>.<pid>.bin``,
+    one file per process so appends never interleave.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, log_id, heuristic_score, live_score, live_passed, live_version, live_seconds,
+               adjustments, features, time_taken_ms, entropy_score):
+        """
+        Queue an attempt for shadow scoring; a no-op without a shadow model.
+
+        Args:
+            log_id: The attempt's ChallengeLog id
+            heuristic_score: Challenge score of the heuristic alone
+            live_score: Trust score the live scorer gave
+            live_passed: Whether the attempt passed
+            live_version: Version of the live model, or None for the heuristic
+            live_seconds: Time spent in the live model
+            adjustments: Arguments of ScoringEngine.adjust_trust_score the
+                live score was adjusted with, applied to the shadow score alike
+            features, time_taken_ms, entropy_score: The model inputs
+        """
+        if get_model('shadow') is None:
+            return
+        self._ensure_thread()
+        job = (time.time(), log_id, heuristic_score, live_score, live_passed, live_version, live_seconds,
+               adjustments, features, time_taken_ms, entropy_score)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            metrics.increment('shadow_dropped')
+
+    def join(self):
+        """
+        Wait until every queued attempt has been scored and logged.
+        """
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork: each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=settings.MODEL_REGISTRY['SHADOW_QUEUE_SIZE'])
+                threading.Thread(target=self._run, args=(self._queue,), name='shadow-scorer', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self, jobs):
+        while True:
+            batch = [jobs.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._score(batch)
+            except Exception:
+                logger.exception("Shadow scoring failed")
+            finally:
+                for _ in batch:
+                    jobs.task_done()
+
+    def _score(self, batch):
+        model = get_model('shadow')
+        if model is None:
+            return
+
+        scoring_engine = ScoringEngine()
+        records = np.zeros(len(batch), dtype=SHADOW_RECORD)
+        files = {}
+        for i, (submitted_at, log_id, heuristic_score, live_score, live_passed, live_version, live_seconds,
+                adjustments, features, time_taken_ms, entropy_score) in enumerate(batch):
+            # Scored one at a time, as the live scorer does, so latencies compare
+            start = time.perf_counter()
+            probability = model.predict(features[None], [time_taken_ms], [entropy_score])[0]
+            shadow_seconds = time.perf_counter() - start
+            shadow_score = scoring_engine.adjust_trust_score(
+                scoring_engine.apply_model_score(heuristic_score, probability), **adjustments
+            )
+
+            records[i] = (
+                submitted_at, log_id, live_score, shadow_score,
+                live_passed, scoring_engine.is_challenge_passed(shadow_score),
+                min(live_seconds * 1e6, 2**32 - 1), min(shadow_seconds * 1e6, 2**32 - 1),
+            )
+            day = datetime.fromtimestamp(submitted_at, timezone.utc).date().isoformat()
+            name = f"{live_version or 'heuristic'}__{model.version}.{os.getpid()}.bin"
+            files.setdefault((day, name), []).append(i)
+
+        root = Path(settings.MODEL_REGISTRY['SHADOW_LOG_ROOT'])
+        for (day, name), rows in files.items():
+            (root / day).mkdir(parents=True, exist_ok=True)
+            with open(root / day / name, 'ab') as f:
+                f.write(records[rows].tobytes())
+
+
+_shadow_scorer = ShadowScorer()
+
+
+def get_shadow_scorer():
+    return _shadow_scorer
+
+
+def read_shadow_logs(root=None, days=None):
+    """
+    Read shadow comparison logs.
+
+    Args:
+        root: Log directory (default: ``MODEL_REGISTRY['SHADOW_LOG_ROOT']``)
+        days: YYYY-MM-DD days to read (default: all)
+
+    Returns:
+        dict: (live version, shadow version) to an array of SHADOW_RECORD,
+        merged across days and processes
+    """
+    root = Path(root or settings.MODEL_REGISTRY['SHADOW_LOG_ROOT'])
+    records = {}
+    for path in sorted(root.glob('*/*.bin')):
+        if days is not None and path.parent.name not in days:
+            continue
+        live_version, shadow_version = path.name.split('.', 1)[0].split('__')
+        # Ignore a partial record at the end of a file still being written
+        data = path.read_bytes()
+        data = data[:len(data) - len(data) % SHADOW_RECORD.itemsize]
+        records.setdefault((live_version, shadow_version), []).append(np.frombuffer(data, dtype=SHADOW_RECORD))
+    return {versions: np.concatenate(arrays) for versions, arrays in records.items()}
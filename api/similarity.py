@@ -0,0 +1,224 @@
+import math
+import secrets
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import BinaryField, ExpressionWrapper, F
+
+from api.challenge_logic.behavior import EventStream, event_columns
+from api.challenge_store import get_challenge_store
+from api.codec import decode_payload
+from api.models import ChallengeLog
+
+
+SIGNATURE_BITS = 256
+
+# Mouse paths are resampled to this many points, evenly spaced along the path
+RESAMPLE_POINTS = 33
+# Moving-average width applied first, so sample-level jitter does not change
+# the path's length or shape much
+SMOOTHING_WINDOW = 5
+
+# Weights of the feature groups a path is described by
+CHORD_WEIGHT = 1.0   # overall direction and straightness of the move
+SHAPE_WEIGHT = 3.0   # deviation from the straight line, along the path
+TIMING_WEIGHT = 1.0  # deviation from constant speed, along the path
+
+# Random hyperplanes of the SimHash; fixed seed so every worker (and every
+# offline build) computes the same signatures
+_HYPERPLANES = np.random.default_rng(20240917).standard_normal((SIGNATURE_BITS, 2 + 3 * RESAMPLE_POINTS))
+
+
+def _mouse_columns(mouse_movements):
+    """
+    Return (x, y, timestamp) arrays for an EventStream, a list of event
+    dicts, or the dict of columns decode_payload returns for ``stream_columns``.
+    """
+    fields = ('x', 'y', 'timestamp')
+    if isinstance(mouse_movements, dict):
+        return [mouse_movements[field] for field in fields]
+    if isinstance(mouse_movements, (EventStream, list)):
+        return event_columns(mouse_movements, fields)
+    raise TypeError('Expected mouse movements')
+
+
+def path_signature(mouse_movements):
+    """
+    Return a 256-bit SimHash of a mouse path, or None if the path is too
+    short to compare.
+
+    The path is smoothed and resampled by distance travelled, so sampling
+    rate and page offset do not matter, then described by its overall
+    direction, its deviation from a straight line and its speed profile.
+    Each signature bit is the side of a random hyperplane the description
+    falls on, so paths that differ by small jitter differ in few bits.
+    """
+    try:
+        x, y, timestamps = (np.asarray(column, dtype=np.float64) for column in _mouse_columns(mouse_movements))
+    except (KeyError, TypeError, ValueError):
+        return None
+    min_events = max(settings.TRAJECTORY_SIMILARITY['MIN_MOUSE_EVENTS'], SMOOTHING_WINDOW)
+    if len(x) < min_events or not len(x) == len(y) == len(timestamps):
+        return None
+
+    kernel = np.full(SMOOTHING_WINDOW, 1 / SMOOTHING_WINDOW)
+    x, y, timestamps = (np.convolve(column, kernel, mode='valid') for column in (x, y, timestamps))
+
+    distance = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    length = distance[-1]
+    if not length > 0:
+        return None
+    points = np.linspace(0, length, RESAMPLE_POINTS)
+    progress = np.linspace(0, 1, RESAMPLE_POINTS)
+
+    # Positions relative to the start, in units of path length
+    px = (np.interp(points, distance, x) - x[0]) / length
+    py = (np.interp(points, distance, y) - y[0]) / length
+    elapsed = np.interp(points, distance, timestamps) - timestamps[0]
+    timing = elapsed / elapsed[-1] - progress if elapsed[-1] > 0 else np.zeros(RESAMPLE_POINTS)
+
+    # Scale the two chord values up to weigh as much as a whole profile
+    scale = np.sqrt(RESAMPLE_POINTS)
+    features = np.concatenate((
+        CHORD_WEIGHT * scale * np.array([px[-1], py[-1]]),
+        SHAPE_WEIGHT * scale * (px - progress * px[-1]),
+        SHAPE_WEIGHT * scale * (py - progress * py[-1]),
+        TIMING_WEIGHT * scale * timing,
+    ))
+    bits = _HYPERPLANES @ features > 0
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class TrajectoryIndex:
+    """
+    Locality-sensitive index of recent mouse path signatures, kept in the
+    challenge store.
+
+    The lowest ``BANDS`` bands of ``BAND_BITS`` bits of a signature each
+    pick a bucket list to store it in, so signatures that differ in fewer
+    than ``BANDS`` of those bits always share a bucket. Buckets are per
+    ``SLOT_SECONDS`` time slot and hold at most ``MAX_BUCKET`` signatures,
+    which bounds memory whatever the traffic; a query reads the buckets of
+    the slots covering ``WINDOW_SECONDS`` and compares the candidates'
+    whole signatures by Hamming distance.
+    """
+
+    def __init__(self, store=None):
+        config = settings.TRAJECTORY_SIMILARITY
+        self.store = store or get_challenge_store()
+        self.bands = config['BANDS']
+        self.band_bits = config['BAND_BITS']
+        self.slot_seconds = config['SLOT_SECONDS']
+        self.slots = math.ceil(config['WINDOW_SECONDS'] / self.slot_seconds)
+        self.max_bucket = config['MAX_BUCKET']
+        self.max_distance = config['MAX_DISTANCE']
+
+    def _band_values(self, signature):
+        mask = (1 << self.band_bits) - 1
+        return [(signature >> (band * self.band_bits)) & mask for band in range(self.bands)]
+
+    def _keys(self, signature, slots):
+        return [
+            f"lsh_{slot}_{band}_{value}"
+            for slot in slots
+            for band, value in enumerate(self._band_values(signature))
+        ]
+
+    def _slot(self, timestamp):
+        return int((time.time() if timestamp is None else timestamp) // self.slot_seconds)
+
+    def add(self, signature, timestamp=None):
+        """
+        Add a signature observed at ``timestamp`` (seconds since the epoch, default now).
+        """
+        # A random token in the low bits tells apart the copies of one trace
+        # found through several bands
+        entry = signature << 32 | secrets.randbits(32)
+        self.store.list_push(
+            self._keys(signature, [self._slot(timestamp)]), entry,
+            max_length=self.max_bucket, timeout=(self.slots + 1) * self.slot_seconds,
+        )
+
+    def count_similar(self, signature, timestamp=None):
+        """
+        Return how many signatures within ``MAX_DISTANCE`` bits of
+        ``signature`` were added in the window before ``timestamp``.
+
+        The count is approximate: buckets drop their oldest entries when
+        full, and unrelated paths can be that close by chance.
+        """
+        current = self._slot(timestamp)
+        buckets = self.store.list_get_many(self._keys(signature, range(current - self.slots + 1, current + 1)))
+
+        matches = set()
+        for entries in buckets.values():
+            for entry in entries:
+                if (signature ^ (entry >> 32)).bit_count() <= self.max_distance:
+                    matches.add(entry)
+        return len(matches)
+
+
+def record_trajectory(behavior_data, timestamp=None):
+    """
+    Count the recent mouse paths similar to the one in behavior_data, then add it.
+
+    Returns:
+        int: Number of similar paths in the last ``WINDOW_SECONDS``; 0 when
+        the path is too short to compare
+    """
+    if not settings.TRAJECTORY_SIMILARITY['ENABLED'] or not isinstance(behavior_data, dict):
+        return 0
+
+    signature = path_signature(behavior_data.get('mouse_movements'))
+    if signature is None:
+        return 0
+
+    index = TrajectoryIndex()
+    similar = index.count_similar(signature, timestamp)
+    index.add(signature, timestamp)
+    return similar
+
+
+def build_trajectory_index(index, since, batch_size=5000, count=False):
+    """
+    Add the mouse paths of challenge logs created after ``since`` to
+    ``index``, oldest first, as if they had just been submitted.
+
+    With ``count``, each path's similar-path count is taken (as of the log's
+    creation) before it is added.
+
+    Yields:
+        tuple: (logs read, list of (log id, similar count or None) for the
+        logs with a comparable path) for each batch
+    """
+    # response_data is read undecoded, so the mouse path can be decoded
+    # straight into columns
+    queryset = (
+        ChallengeLog.objects.filter(created_at__gt=since).order_by('id')
+        .annotate(response_raw=ExpressionWrapper(F('response_data'), output_field=BinaryField()))
+        .values('id', 'created_at', 'response_raw')
+    )
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            return
+
+        added = []
+        for row in rows:
+            response_data = decode_payload(row['response_raw'], stream_columns={'mouse_movements'})
+            behavior_data = response_data.get('behavior_data')
+            if not isinstance(behavior_data, dict):
+                continue
+            signature = path_signature(behavior_data.get('mouse_movements'))
+            if signature is None:
+                continue
+
+            timestamp = row['created_at'].timestamp()
+            similar = index.count_similar(signature, timestamp) if count else None
+            index.add(signature, timestamp)
+            added.append((row['id'], similar))
+
+        last_id = rows[-1]['id']
+        yield len(rows), added
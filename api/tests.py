@@ -1,3 +1,1477 @@
+import contextlib
+import importlib
+import io
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+import warnings
+from datetime import timedelta
+from unittest import mock, skipIf
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from api.archive import INDEX_DTYPE, ChallengeLogArchive, archive_challenge_logs
+from api.backtest import COUNTS, ScorerConfig, run_backtest
+from api import cleanup
+from api.cleanup import cleanup_sessions
+from api.export import ChallengeLogExporter, pa
+from api.feature_store import backfill_features, save_features
+from api.ip_reputation import build_index, get_ip_index, get_ip_risk, reload_ip_index
+from api.codec import decode_payload, encode_payload
+from api.challenge_logic.behavior import EventStream, decode_event_array
+from api.challenge_logic.features import (
+    FEATURE_NAMES, FEATURE_VERSION, extract_features, extract_features_batch, pack_features, unpack_features,
+)
+from api.challenge_logic.scoring import ScoringEngine
+from api import metrics
+from api.challenge_store import LocalChallengeStore, get_challenge_store
+from api.middleware import AdmissionControlMiddleware
+from api.model_registry import MODEL_COLUMNS, ModelRegistry, get_model, load_models, reload_models
+from api.models import ChallengeContent, ChallengeLog, Fingerprint, FingerprintReputation, UserSession
+from api.parsers import BehaviorJSONParser
+from api.replay import check_and_record_trace
+from api.reputation import clear_reputation_cache, get_reputation, record_attempt
+from api.routers import PrimaryReplicaRouter, use_replica
+from api.session_cache import get_session_metadata
+from api.shadow import get_shadow_scorer, read_shadow_logs
+from api.similarity import TrajectoryIndex, build_trajectory_index, path_signature
+
+
+def _selects(queries):
+    return [q['sql'] for q in queries if q['sql'].lstrip().upper().startswith('SELECT')]
+
+
+class ChallengeFlowTestCase(TestCase):
+    def setUp(self):
+        get_challenge_store().clear()
+        clear_reputation_cache()
+        self.client = APIClient()
+
+    def _init_session(self):
+        response = self.client.post('/api/init-session/', {
+            'fingerprint_id': 'test-fingerprint-123',
+            'fingerprint': {
+                'browser': 'Chrome',
+                'os': 'Windows',
+                'headless': False,
+                'entropy_score': 0.85,
+            },
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['session_id']
+
+    def _submit(self, session_id, challenge_type):
+        return self.client.post('/api/submit-challenge/', {
+            'session_id': str(session_id),
+            'challenge_type': challenge_type,
+            'response_data': {},
+            'behavior_data': {'mouse_movements': [], 'keystroke_timings': []},
+            'time_taken_ms': 5000,
+        }, format='json')
+
+
+class SessionCacheTests(ChallengeFlowTestCase):
+    def test_get_challenge_does_not_query_database(self):
+        session_id = self._init_session()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/get-challenge/', {'session_id': session_id})
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_submit_challenge_does_not_select(self):
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._submit(session_id, challenge['type'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_selects(ctx.captured_queries), [])
+        self.assertEqual(ChallengeLog.objects.filter(session_id=session_id).count(), 1)
+        self.assertEqual(
+            UserSession.objects.get(id=session_id).trust_score, response.data['trust_score']
+        )
+
+    def test_cache_miss_falls_back_to_database(self):
+        session_id = self._init_session()
+        get_challenge_store().clear()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/get-challenge/', {'session_id': session_id})
+        self.assertEqual(response.status_code, 200)
+
+        # The fallback repopulates the cache for the next request
+        with self.assertNumQueries(0):
+            self.client.get('/api/get-challenge/', {'session_id': session_id})
+
+    def test_unknown_session_returns_404(self):
+        response = self.client.get(
+            '/api/get-challenge/', {'session_id': '550e8400-e29b-41d4-a716-446655440000'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ChallengeStoreTests(ChallengeFlowTestCase):
+    def test_consume_returns_value_once(self):
+        store = LocalChallengeStore()
+        store.set('challenge_x', {'type': 'drag-align'}, timeout=60)
+
+        self.assertEqual(store.consume('challenge_x'), {'type': 'drag-align'})
+        self.assertIsNone(store.consume('challenge_x'))
+
+    def test_expired_values_are_not_returned(self):
+        store = LocalChallengeStore()
+        store.set('challenge_x', {'type': 'drag-align'}, timeout=-1)
+
+        self.assertIsNone(store.get('challenge_x'))
+
+    def test_full_store_evicts_oldest_entry(self):
+        store = LocalChallengeStore(max_entries=2)
+        for key in ('a', 'b', 'c'):
+            store.set(key, key, timeout=60)
+
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.get('c'), 'c')
+
+    def test_bloom_add_reports_items_seen_in_any_generation(self):
+        store = LocalChallengeStore()
+
+        self.assertFalse(store.bloom_add('bloom_2', [3, 77], timeout=60, check_keys=['bloom_1']))
+        self.assertTrue(store.bloom_add('bloom_2', [3, 77], timeout=60, check_keys=['bloom_1']))
+        self.assertFalse(store.bloom_add('bloom_3', [3, 78], timeout=60, check_keys=['bloom_2']))
+        self.assertTrue(store.bloom_add('bloom_4', [77, 3], timeout=60, check_keys=['bloom_3', 'bloom_2']))
+
+    def test_challenge_cannot_be_submitted_twice(self):
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+
+        self.assertEqual(self._submit(session_id, challenge['type']).status_code, 200)
+        self.assertEqual(self._submit(session_id, challenge['type']).status_code, 400)
+
+
+class BatchTrustScoreTests(ChallengeFlowTestCase):
+    def test_batch_returns_scores_in_one_query(self):
+        scored_id = self._init_session()
+        unscored_id = self._init_session()
+        UserSession.objects.filter(id=scored_id).update(trust_score=0.9)
+        missing_id = '550e8400-e29b-41d4-a716-446655440000'
+
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/trust-scores/', {
+                'session_ids': [str(scored_id), str(unscored_id), missing_id, str(scored_id)],
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = {str(r['session_id']): r for r in response.data['results']}
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(results[str(scored_id)]['trust_score'], 0.9)
+        self.assertTrue(results[str(scored_id)]['passed'])
+        self.assertEqual(results[str(unscored_id)]['trust_score'], 0.5)
+        self.assertFalse(results[str(unscored_id)]['passed'])
+        self.assertEqual([str(i) for i in response.data['not_found']], [missing_id])
+
+    def test_batch_rejects_too_many_ids(self):
+        ids = ['550e8400-e29b-41d4-a716-446655440000'] * (settings.BATCH_TRUST_SCORE_MAX_SESSIONS + 1)
+
+        response = self.client.post('/api/trust-scores/', {'session_ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class AdmissionControlTests(ChallengeFlowTestCase):
+    def _limits(self, **overrides):
+        config = dict(settings.ADMISSION_CONTROL)
+        config.update(overrides)
+        return self.settings(ADMISSION_CONTROL=config)
+
+    def test_over_limit_ip_is_rejected_before_orm_work(self):
+        with self._limits(IP_RATE=(0.001, 1)):
+            self.assertEqual(self.client.get('/api/get-challenge/').status_code, 400)
+
+            with self.assertNumQueries(0):
+                response = self.client.get(
+                    '/api/get-challenge/', {'session_id': '550e8400-e29b-41d4-a716-446655440000'}
+                )
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_fingerprint_limit_applies_across_ips(self):
+        with self._limits(FINGERPRINT_RATE=(0.001, 1)):
+            self._init_session()
+            response = self.client.post('/api/init-session/', {
+                'fingerprint_id': 'test-fingerprint-123',
+            }, format='json', REMOTE_ADDR='10.1.2.3')
+
+        self.assertEqual(response.status_code, 429)
+
+    def test_spoofed_forwarded_for_hops_share_the_client_limit(self):
+        with self._limits(IP_RATE=(0.001, 1)), self.settings(TRUSTED_PROXY_COUNT=1):
+            statuses = [
+                self.client.get('/api/get-challenge/', HTTP_X_FORWARDED_FOR=spoofed, REMOTE_ADDR='10.0.0.1').status_code
+                for spoofed in ('198.51.100.1, 203.0.113.7', '198.51.100.2, 203.0.113.7', 'not-an-ip, 203.0.113.7')
+            ]
+            # Another client behind the same proxy has its own bucket
+            other = self.client.get('/api/get-challenge/', HTTP_X_FORWARDED_FOR='203.0.113.8', REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(statuses, [400, 429, 429])
+        self.assertEqual(other.status_code, 400)
+
+    def test_unparseable_client_addresses_are_still_limited(self):
+        with self._limits(IP_RATE=(0.001, 1)), self.settings(TRUSTED_PROXY_COUNT=1):
+            statuses = [
+                self.client.get('/api/get-challenge/', HTTP_X_FORWARDED_FOR=spoofed, REMOTE_ADDR='').status_code
+                for spoofed in ('garbage', 'more garbage')
+            ]
+
+        self.assertEqual(statuses, [400, 429])
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        with self._limits(IP_RATE=(0.001, 1)):
+            statuses = [
+                self.client.get('/api/get-challenge/', HTTP_X_FORWARDED_FOR=spoofed).status_code
+                for spoofed in ('198.51.100.1', '198.51.100.2')
+            ]
+
+        self.assertEqual(statuses, [400, 429])
+
+    def test_other_endpoints_are_not_limited(self):
+        with self._limits(IP_RATE=(0.001, 1)):
+            for _ in range(3):
+                response = self.client.post('/api/trust-scores/', {'session_ids': []}, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+class FastJSONTests(ChallengeFlowTestCase):
+    def test_submit_rejects_non_object_behavior_data(self):
+        session_id = self._init_session()
+        response = self.client.post('/api/submit-challenge/', {
+            'session_id': str(session_id),
+            'challenge_type': 'drag-align',
+            'response_data': {},
+            'behavior_data': [1, 2, 3],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('behavior_data', response.data)
+
+    def test_malformed_json_is_a_parse_error(self):
+        response = self.client.post(
+            '/api/submit-challenge/', data=b'{"session_id":', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class BehaviorStreamTests(TestCase):
+    MOUSE_FIELDS = ('x', 'y', 'timestamp')
+
+    def _parse(self, body):
+        return BehaviorJSONParser().parse(io.BytesIO(json.dumps(body).encode()))
+
+    def test_tracker_arrays_are_decoded_into_columns(self):
+        raw = b'[{"x": 1, "y": 2, "timestamp": 3}, {"x":-4.5,"y":5,"timestamp":6}]'
+
+        stream = decode_event_array(raw, self.MOUSE_FIELDS, capacity=10)
+
+        self.assertEqual(list(stream.column('x')), [1.0, -4.5])
+        self.assertEqual(list(stream.column('timestamp')), [3.0, 6.0])
+
+    def test_other_shapes_fall_back_to_json_decoding(self):
+        raw = b'[{"timestamp": 3, "x": 1, "y": 2}, {"x": null, "y": 1, "timestamp": 2}]'
+
+        stream = decode_event_array(raw, self.MOUSE_FIELDS, capacity=10)
+
+        # Reordered keys still decode; events with invalid values are dropped
+        self.assertEqual(stream.to_list(), [{'x': 1.0, 'y': 2.0, 'timestamp': 3.0}])
+
+    def test_non_finite_values_are_rejected(self):
+        for token in (b'NaN', b'Infinity', b'-Infinity'):
+            raw = b'[{"x": 1, "y": 2, "timestamp": 3}, {"x": %s, "y": 5, "timestamp": 6}]' % token
+            with self.assertRaises(ValueError):
+                decode_event_array(raw, self.MOUSE_FIELDS, capacity=10)
+
+        # float() accepts these strings; the events are dropped like other invalid ones
+        raw = b'[{"x": 1, "y": 2, "timestamp": 3}, {"x": "nan", "y": 5, "timestamp": 6}, {"x": 7, "y": "-inf", "timestamp": 8}]'
+        stream = decode_event_array(raw, self.MOUSE_FIELDS, capacity=10)
+        self.assertEqual(stream.to_list(), [{'x': 1.0, 'y': 2.0, 'timestamp': 3.0}])
+
+    def test_non_finite_values_do_not_raise_bot_scores(self):
+        def behavior(poison):
+            mouse = [{'x': i * 10, 'y': i * 10, 'timestamp': i * 16} for i in range(30)]
+            keystrokes = [{'timestamp': i * 100} for i in range(5)]
+            mouse[5]['x'] = keystrokes[2]['timestamp'] = poison
+            return {'mouse_movements': mouse, 'keystroke_timings': keystrokes}
+
+        with self.assertRaises(ParseError):
+            self._parse({'behavior_data': behavior(float('nan'))})
+
+        straight = ScoringEngine()._calculate_entropy_score(self._parse({'behavior_data': behavior(50)})['behavior_data'])
+        poisoned = ScoringEngine()._calculate_entropy_score(self._parse({'behavior_data': behavior('NaN')})['behavior_data'])
+        # The poisoned events are dropped rather than maxing out the variances
+        self.assertLess(straight, 0.2)
+        self.assertLess(poisoned, 0.2)
+
+    def test_streams_are_capped(self):
+        raw = json.dumps([{'timestamp': i} for i in range(5)]).encode()
+
+        stream = decode_event_array(raw, ('timestamp',), capacity=3)
+
+        self.assertEqual(len(stream), 3)
+        self.assertTrue(stream.truncated)
+
+    def test_parser_replaces_event_arrays_with_streams(self):
+        data = self._parse({
+            'session_id': '550e8400-e29b-41d4-a716-446655440000',
+            'response_data': {'note': 'mouse_movements'},
+            'behavior_data': {
+                'mouse_movements': [{'x': 1, 'y': 2, 'timestamp': 3}],
+                'keystroke_timings': [{'timestamp': 4}],
+                'total_tracking_time_ms': 5000,
+            },
+        })
+
+        behavior_data = data['behavior_data']
+        self.assertIsInstance(behavior_data['mouse_movements'], EventStream)
+        self.assertEqual(list(behavior_data['keystroke_timings'].column('timestamp')), [4.0])
+        self.assertEqual(behavior_data['total_tracking_time_ms'], 5000)
+        self.assertEqual(data['response_data'], {'note': 'mouse_movements'})
+
+    def test_parser_ignores_arrays_outside_behavior_data(self):
+        data = self._parse({
+            'response_data': {'mouse_movements': [{'x': 1, 'y': 2, 'timestamp': 3}]},
+            'behavior_data': {},
+        })
+
+        self.assertEqual(data['response_data']['mouse_movements'], [{'x': 1, 'y': 2, 'timestamp': 3}])
+
+
+class FeatureExtractionTests(TestCase):
+    MOUSE_FIELDS = ('x', 'y', 'timestamp')
+    MOUSE = [
+        {'x': 0, 'y': 0, 'timestamp': 0},
+        {'x': 3, 'y': 4, 'timestamp': 10},
+        {'x': 3, 'y': 4, 'timestamp': 10},  # no elapsed time: not a step
+        {'x': 6, 'y': 8, 'timestamp': 20},
+        {'x': 6, 'y': 14, 'timestamp': 30},
+    ]
+    KEYSTROKES = [{'timestamp': 0}, {'timestamp': 100}, {'timestamp': 300}]
+
+    # Golden vector, in FEATURE_NAMES order; a change here needs a new FEATURE_VERSION
+    EXPECTED = [
+        5, 3,                                            # events, moving steps
+        1.6 / 3, np.sqrt(0.02 / 9), 0.6,                 # speed mean, std, max
+        10, 0,                                           # interval mean, std
+        np.arctan(3 / 4) / 2, np.arctan(3 / 4) / 2, np.arctan(3 / 4),  # angle change mean, std, max
+        1 / 3,                                           # direction change rate
+        3, 150, 50,                                      # keystrokes, interval mean, std
+    ]
+
+    def test_golden_vector(self):
+        self.assertEqual(len(FEATURE_NAMES), len(self.EXPECTED))
+        features = extract_features({'mouse_movements': self.MOUSE, 'keystroke_timings': self.KEYSTROKES})
+
+        self.assertEqual(features.dtype, np.float32)
+        np.testing.assert_allclose(features, self.EXPECTED, rtol=1e-6, atol=1e-6)
+
+    def test_batch_matches_single_traces_in_any_stream_format(self):
+        streams = {
+            'mouse_movements': EventStream.from_events(self.MOUSE, self.MOUSE_FIELDS, capacity=10),
+            'keystroke_timings': EventStream.from_columns({'timestamp': np.array([0.0, 100.0, 300.0])}, ('timestamp',)),
+        }
+        traces = [
+            {'mouse_movements': self.MOUSE, 'keystroke_timings': self.KEYSTROKES},
+            {'mouse_movements': self.MOUSE[:2]},
+            None,
+            streams,
+        ]
+
+        batch = extract_features_batch(traces)
+
+        for trace, row in zip(traces, batch):
+            np.testing.assert_array_equal(extract_features(trace), row)
+        np.testing.assert_array_equal(batch[3], batch[0])
+        # Statistics over nothing are NaN, counts 0
+        empty = dict(zip(FEATURE_NAMES, batch[2]))
+        self.assertEqual(empty['mouse_movements_count'], 0)
+        self.assertTrue(np.isnan(empty['mouse_speed_mean']))
+        self.assertTrue(np.isnan(dict(zip(FEATURE_NAMES, batch[1]))['mouse_angle_change_mean']))
+
+    def test_non_finite_events_are_dropped_in_any_stream_format(self):
+        mouse = self.MOUSE[:3] + [
+            {'x': float('nan'), 'y': 1, 'timestamp': 15},
+            {'x': 1, 'y': 'inf', 'timestamp': 16},
+        ] + self.MOUSE[3:]
+        keystrokes = self.KEYSTROKES[:1] + [{'timestamp': 'nan'}] + self.KEYSTROKES[1:]
+
+        def columns(events, fields):
+            return {field: np.array([float(event[field]) for event in events]) for field in fields}
+
+        stream = EventStream(self.MOUSE_FIELDS, capacity=10)
+        stream.extend(np.column_stack(list(columns(mouse, self.MOUSE_FIELDS).values())))
+        # Stored logs decode to columns, which the feature store turns into streams
+        traces = [
+            {'mouse_movements': mouse, 'keystroke_timings': keystrokes},
+            {'mouse_movements': stream,
+             'keystroke_timings': EventStream.from_columns(columns(keystrokes, ('timestamp',)), ('timestamp',))},
+            {'mouse_movements': EventStream.from_columns(columns(mouse, self.MOUSE_FIELDS), self.MOUSE_FIELDS),
+             'keystroke_timings': keystrokes},
+        ]
+
+        # The golden vector, as if the non-finite events had never been sent
+        for features in extract_features_batch(traces):
+            np.testing.assert_allclose(features, self.EXPECTED, rtol=1e-6, atol=1e-6)
+
+    def test_entropy_score_matches_previous_implementation(self):
+        mouse = [
+            {'x': 10 + 7 * i + (i % 3) * 4, 'y': 20 + 3 * i - (i % 4) * 5, 'timestamp': 1000 + 16 * i + (i % 5) * 3}
+            for i in range(12)
+        ]
+        mouse[6]['timestamp'] = mouse[5]['timestamp']
+        keystrokes = [{'timestamp': t} for t in (0, 120, 310, 390, 700)]
+        engine = ScoringEngine()
+
+        # Scores of the per-request implementation this extractor replaced
+        self.assertAlmostEqual(
+            engine._calculate_entropy_score({'mouse_movements': mouse, 'keystroke_timings': keystrokes}),
+            0.13147826407356927, places=6,
+        )
+        self.assertAlmostEqual(engine._calculate_entropy_score({'mouse_movements': mouse}), 0.12246894867652752, places=6)
+        self.assertEqual(engine._calculate_entropy_score({'mouse_movements': mouse[:4]}), 0.5)
+
+
+class RequestBudgetTests(ChallengeFlowTestCase):
+    def _budgets(self, url_name, **budget):
+        budgets = dict(settings.REQUEST_BUDGETS)
+        budgets[url_name] = budget
+        return self.settings(REQUEST_BUDGETS=budgets)
+
+    def test_oversized_body_is_rejected_before_parsing(self):
+        rejected = metrics.get_counters().get('request_budget_rejected', 0)
+
+        with self._budgets('submit-challenge', MAX_BODY_BYTES=100):
+            with self.assertNumQueries(0):
+                response = self.client.post(
+                    '/api/submit-challenge/', data=b'{' + b' ' * 200 + b'}',
+                    content_type='application/json'
+                )
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(metrics.get_counters()['request_budget_rejected'], rejected + 1)
+
+    def test_too_many_stream_events_are_rejected(self):
+        session_id = self._init_session()
+        body = {
+            'session_id': str(session_id),
+            'challenge_type': 'drag-align',
+            'response_data': {},
+            'behavior_data': {'mouse_movements': [{'x': 1, 'y': 1, 'timestamp': i} for i in range(3)]},
+        }
+
+        with self._budgets('submit-challenge', MAX_BODY_BYTES=10000, MAX_STREAM_EVENTS=2):
+            response = self.client.post('/api/submit-challenge/', body, format='json')
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_over_limit_clients_are_rejected_before_the_body_is_read(self):
+        rejected = metrics.get_counters().get('request_budget_rejected', 0)
+
+        with self._budgets('submit-challenge', MAX_BODY_BYTES=100), \
+                self.settings(ADMISSION_CONTROL={**settings.ADMISSION_CONTROL, 'IP_RATE': (0.001, 1)}):
+            statuses = [
+                self.client.post(
+                    '/api/submit-challenge/', data=b'{' + b' ' * 200 + b'}', content_type='application/json'
+                ).status_code
+                for _ in range(2)
+            ]
+
+        self.assertEqual(statuses, [413, 429])
+        self.assertEqual(metrics.get_counters()['request_budget_rejected'], rejected + 1)
+
+    def test_oversized_init_session_body_is_not_searched_for_a_fingerprint(self):
+        body = json.dumps({'fingerprint_id': 'test-fingerprint-123', 'padding': ' ' * 200}).encode()
+
+        with self._budgets('init-session', MAX_BODY_BYTES=100), \
+                mock.patch.object(AdmissionControlMiddleware, 'FINGERPRINT_ID_RE') as fingerprint_re:
+            response = self.client.post('/api/init-session/', data=body, content_type='application/json')
+
+        self.assertEqual(response.status_code, 413)
+        fingerprint_re.search.assert_not_called()
+
+    def test_requests_within_budget_are_parsed(self):
+        with self._budgets('init-session', MAX_BODY_BYTES=1000):
+            self._init_session()
+
+
+class BehaviorDataValidationTests(ChallengeFlowTestCase):
+    # Streams in any other form than a list of events
+    INVALID_STREAMS = [
+        {'mouse_movements': {'x': 'abc'}},
+        {'mouse_movements': {'x': [1, 2, 3], 'y': [1], 'timestamp': [1, 2]}},
+        {'mouse_movements': 5},
+        {'keystroke_timings': 5},
+        {'mouse_movements': None},
+    ]
+
+    def test_invalid_streams_are_rejected_before_the_challenge_is_used(self):
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+
+        for behavior_data in self.INVALID_STREAMS:
+            with self.subTest(behavior_data=behavior_data):
+                response = self.client.post('/api/submit-challenge/', {
+                    'session_id': str(session_id),
+                    'challenge_type': challenge['type'],
+                    'response_data': {},
+                    'behavior_data': behavior_data,
+                    'time_taken_ms': 5000,
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('behavior_data', response.data)
+
+        # The challenge can still be answered
+        self.assertEqual(self._submit(session_id, challenge['type']).status_code, 200)
+
+    def test_invalid_streams_are_rejected_by_passive_checks(self):
+        session_id = self._init_session()
+
+        for behavior_data in self.INVALID_STREAMS:
+            with self.subTest(behavior_data=behavior_data):
+                response = self.client.post('/api/check-session/', {
+                    'session_id': str(session_id), 'behavior_data': behavior_data,
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+                response = self.client.post('/api/init-session/', {
+                    'fingerprint_id': 'test-fingerprint-123', 'behavior_data': behavior_data,
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertIsNone(UserSession.objects.get(id=session_id).trust_score)
+
+
+class FrictionlessPassTests(ChallengeFlowTestCase):
+    BEHAVIOR = {
+        'mouse_movements': [
+            {'x': (i * 37) % 400, 'y': (i * 53) % 300, 'timestamp': i * (16 + i % 7)} for i in range(40)
+        ],
+        'keystroke_timings': [],
+    }
+
+    def _check(self, session_id, behavior_data):
+        return self.client.post('/api/check-session/', {
+            'session_id': str(session_id),
+            'behavior_data': behavior_data,
+        }, format='json')
+
+    def test_confident_session_passes_without_challenge(self):
+        session_id = self._init_session()
+
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.01):
+            response = self._check(session_id, self.BEHAVIOR)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['challenge_required'])
+        self.assertTrue(response.data['passed'])
+        self.assertEqual(UserSession.objects.get(id=session_id).trust_score, response.data['trust_score'])
+        self.assertFalse(ChallengeLog.objects.exists())
+
+    def test_init_session_can_pass_immediately(self):
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.01):
+            response = self.client.post('/api/init-session/', {
+                'fingerprint_id': 'test-fingerprint-123',
+                'fingerprint': {'browser': 'Chrome', 'os': 'Windows', 'headless': False, 'entropy_score': 0.9},
+                'behavior_data': self.BEHAVIOR,
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.data['challenge_required'])
+
+    def test_unconfident_session_requires_challenge(self):
+        session_id = self._init_session()
+
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=1.1):
+            response = self._check(session_id, self.BEHAVIOR)
+
+        self.assertTrue(response.data['challenge_required'])
+        self.assertIsNone(UserSession.objects.get(id=session_id).trust_score)
+
+    def test_failed_session_keeps_its_score(self):
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        failed = self._submit(session_id, challenge['type'])
+        self.assertFalse(failed.data['passed'])
+
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.01):
+            response = self._check(session_id, self.BEHAVIOR)
+
+        self.assertTrue(response.data['challenge_required'])
+        self.assertEqual(UserSession.objects.get(id=session_id).trust_score, failed.data['trust_score'])
+
+    def test_session_gets_one_passive_check(self):
+        session_id = self._init_session()
+
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=1.1):
+            self.assertTrue(self._check(session_id, self.BEHAVIOR).data['challenge_required'])
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.01):
+            self.assertTrue(self._check(session_id, self.BEHAVIOR).data['challenge_required'])
+
+        self.assertIsNone(UserSession.objects.get(id=session_id).trust_score)
+
+    def test_replayed_passive_trace_requires_challenge(self):
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.01):
+            first = self._check(self._init_session(), self.BEHAVIOR)
+        self.assertFalse(first.data['challenge_required'])
+
+        session_id = self._init_session()
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=first.data['trust_score'] - 0.01):
+            response = self._check(session_id, self.BEHAVIOR)
+
+        self.assertTrue(response.data['challenge_required'])
+        self.assertIsNone(UserSession.objects.get(id=session_id).trust_score)
+
+    def test_too_little_behavior_requires_challenge(self):
+        session_id = self._init_session()
+
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.0):
+            response = self._check(session_id, {'mouse_movements': self.BEHAVIOR['mouse_movements'][:5]})
+
+        self.assertTrue(response.data['challenge_required'])
+
+    def test_headless_browser_requires_challenge(self):
+        response = self.client.post('/api/init-session/', {
+            'fingerprint_id': 'headless-fingerprint',
+            'fingerprint': {'browser': 'Chrome', 'os': 'Linux', 'headless': True, 'entropy_score': 1.0},
+        }, format='json')
+
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.01):
+            response = self._check(response.data['session_id'], self.BEHAVIOR)
+
+        self.assertTrue(response.data['challenge_required'])
+
+
+class ChallengeLogArchiveTests(ChallengeFlowTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.archive = ChallengeLogArchive(root=root, block_rows=2)
+
+    def _log(self, session_id, days_ago):
+        log = ChallengeLog.objects.create(
+            session_id=session_id, challenge_type='drag-align', challenge_data={'shapes': []},
+            response_data={'positions': {}}, passed=True, time_taken_ms=4000,
+        )
+        ChallengeLog.objects.filter(id=log.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return log
+
+    def test_old_logs_move_to_archive(self):
+        sessions = [self._init_session() for _ in range(3)]
+        old = [self._log(session_id, days_ago) for session_id in sessions for days_ago in (40, 41)]
+        recent = self._log(sessions[0], 1)
+
+        archived = sum(archive_challenge_logs(older_than_days=30, batch_size=4, archive=self.archive))
+
+        self.assertEqual(archived, len(old))
+        self.assertEqual(list(ChallengeLog.objects.values_list('id', flat=True)), [recent.id])
+        self.assertEqual(len(self.archive.days()), 2)
+        # Both days were sealed by the run
+        self.assertEqual(list(self.archive.root.glob('*.pending')), [])
+
+        logs = self.archive.get_session_logs(sessions[1])
+        self.assertEqual([log['id'] for log in logs], [old[3].id, old[2].id])
+        self.assertEqual(logs[0]['response_data'], {'positions': {}})
+        self.assertEqual(logs[0]['session_id'], str(sessions[1]))
+
+    def test_rows_archived_twice_are_returned_once(self):
+        session_id = self._init_session()
+        self._log(session_id, 40)
+        rows = list(ChallengeLog.objects.values())
+        day = rows[0]['created_at'].date().isoformat()
+
+        self.archive.append(day, rows)
+        self.archive.append(day, rows)
+
+        self.assertEqual(len(self.archive.get_session_logs(session_id)), 1)
+
+    def test_days_are_sorted_when_sealed(self):
+        # Appended in descending order, with ids that end in NUL bytes or
+        # only differ from one by a trailing byte
+        session_ids = [uuid.UUID(bytes=bytes([n]) + bytes(15)) for n in (3, 2, 1)]
+        session_ids.insert(1, uuid.UUID(bytes=bytes([2]) + bytes(14) + b'\1'))
+        now = timezone.now()
+        day = now.date().isoformat()
+        index_path = self.archive.root / f"{day}.idx"
+
+        def append(i, session_id):
+            self.archive.append(day, [
+                {'id': i * 10 + j, 'session_id': session_id, 'challenge_type': 'drag-align', 'challenge_data': {},
+                 'response_data': {}, 'passed': True, 'time_taken_ms': 4000, 'created_at': now}
+                for j in range(3)
+            ])
+
+        def assert_found():
+            for i, session_id in enumerate(session_ids):
+                logs = self.archive.get_session_logs(session_id)
+                self.assertEqual([log['id'] for log in logs], [i * 10, i * 10 + 1, i * 10 + 2])
+            self.assertEqual(self.archive.get_session_logs(uuid.UUID(bytes=bytes(16))), [])
+
+        append(0, session_ids[0])
+        append(1, session_ids[1])
+        self.archive.seal(day)
+        sealed = index_path.read_bytes()
+
+        # Later appends leave the sorted index alone until the next seal,
+        # and are found in the meantime
+        append(2, session_ids[2])
+        append(3, session_ids[3])
+        self.assertEqual(index_path.read_bytes(), sealed)
+        self.assertEqual(self.archive.days(), [day])
+        assert_found()
+
+        self.archive.seal(day)
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+        # Each session's three rows span two blocks
+        self.assertEqual(len(index), 2 * len(session_ids))
+        self.assertEqual(index['session_id'].tolist(), sorted(index['session_id'].tolist()))
+        self.assertFalse((self.archive.root / f"{day}.pending").exists())
+        assert_found()
+
+    def test_dry_run_keeps_rows(self):
+        self._log(self._init_session(), 40)
+
+        self.assertEqual(list(archive_challenge_logs(older_than_days=30, archive=self.archive, dry_run=True)), [1])
+        self.assertEqual(ChallengeLog.objects.count(), 1)
+        self.assertEqual(self.archive.days(), [])
+
+
+class ChallengeLogCodecTests(ChallengeFlowTestCase):
+    def test_round_trip(self):
+        payload = {
+            'mouse_movements': [{'x': i * 3, 'y': 300 - i, 'timestamp': 1620000000000 + i * 16} for i in range(50)],
+            'scroll': [{'dy': i / 3} for i in range(10)],
+            'flags': [{'a': True}, {'a': False}, {'a': True}, {'a': True}],
+            'looks_like_marker': {'$ref': 'not-a-ref'},
+            'text': 'x' * 200,
+        }
+
+        with self.settings(CHALLENGE_LOG_CODEC={'COMPRESSION': 'zlib', 'MIN_COMPRESS_BYTES': 0,
+                                                'CONTENT_MIN_LENGTH': 48}):
+            encoded = encode_payload(payload)
+
+        self.assertEqual(decode_payload(encoded), payload)
+        self.assertLess(len(encoded), len(json.dumps(payload)) / 4)
+
+    def test_event_stream_is_stored_as_columns(self):
+        raw = json.dumps([{'x': i, 'y': i * 2, 'timestamp': 1000 + i * 16} for i in range(20)]).encode()
+        stream = decode_event_array(raw, ('x', 'y', 'timestamp'), capacity=100)
+
+        self.assertEqual(decode_payload(encode_payload({'mouse_movements': stream})),
+                         {'mouse_movements': json.loads(raw)})
+
+    def test_large_event_stream_values_round_trip(self):
+        columns = {'x': [1e300, 5, 9.3e18, 7], 'y': [0, 1, 2, 3], 'timestamp': [2.0 ** 53, 1, 2, 3]}
+        stream = EventStream.from_columns(columns, ('x', 'y', 'timestamp'))
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            encoded = encode_payload({'mouse_movements': stream})
+        events = decode_payload(encoded)['mouse_movements']
+
+        for field, values in columns.items():
+            self.assertEqual([event[field] for event in events], values)
+
+    def test_submit_stores_behavior_and_deduplicates_challenge_text(self):
+        for _ in range(2):
+            session_id = self._init_session()
+            store = get_challenge_store()
+            challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+            stored = store.get(f"challenge_{session_id}")
+            stored['instruction'] = 'Select the text that was written by a human, please:'
+            store.set(f"challenge_{session_id}", stored, timeout=60)
+            self.client.post('/api/submit-challenge/', {
+                'session_id': str(session_id),
+                'challenge_type': challenge['type'],
+                'response_data': {'selected_id': 'text-1'},
+                'behavior_data': {'mouse_movements': [{'x': i, 'y': i, 'timestamp': i * 16} for i in range(30)]},
+                'time_taken_ms': 5000,
+            }, format='json')
+
+        logs = list(ChallengeLog.objects.all())
+        self.assertEqual(len(logs), 2)
+        self.assertEqual(logs[1].challenge_data['instruction'], 'Select the text that was written by a human, please:')
+        self.assertEqual(logs[1].response_data['selected_id'], 'text-1')
+        self.assertNotIn('time_taken_ms', logs[1].response_data)
+        self.assertEqual(logs[1].response_data['behavior_data']['mouse_movements'][29],
+                         {'x': 29, 'y': 29, 'timestamp': 464})
+        self.assertEqual(ChallengeContent.objects.filter(
+            content='Select the text that was written by a human, please:').count(), 1)
+
+
+@skipIf(pa is None, 'pyarrow is not installed')
+class ChallengeLogExportTests(ChallengeFlowTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def _log(self, session_id, challenge_type):
+        return ChallengeLog.objects.create(
+            session_id=session_id, challenge_type=challenge_type, challenge_data={'type': challenge_type},
+            response_data={'selected_id': 'text-1', 'behavior_data': {
+                'mouse_movements': [{'x': i, 'y': i * 2, 'timestamp': i * 16} for i in range(10)],
+            }},
+            passed=True, time_taken_ms=4000,
+        )
+
+    def _exported(self):
+        import pyarrow.dataset as ds
+        return ds.dataset(self.root, format='parquet', partitioning='hive').to_table().sort_by('id').to_pylist()
+
+    def test_export_is_incremental_and_partitioned(self):
+        session_id = self._init_session()
+        first = [self._log(session_id, 'reverse-turing'), self._log(session_id, 'drag-align')]
+        exporter = ChallengeLogExporter(root=self.root, batch_size=1, settle_seconds=0)
+
+        self.assertEqual(sum(rows for rows, _ in exporter.export()), 2)
+        rows = self._exported()
+        self.assertEqual([row['id'] for row in rows], [log.id for log in first])
+        self.assertEqual(rows[0]['challenge_type'], 'reverse-turing')
+        self.assertEqual(rows[0]['fingerprint_id'], 'test-fingerprint-123')
+        self.assertEqual(rows[0]['mouse_y'], [i * 2.0 for i in range(10)])
+        self.assertEqual(json.loads(rows[0]['response_data']), {'selected_id': 'text-1'})
+
+        self.assertEqual(list(exporter.export()), [])
+        latest = self._log(session_id, 'drag-align')
+        self.assertEqual(sum(rows for rows, _ in exporter.export()), 1)
+        self.assertEqual([row['id'] for row in self._exported()], [log.id for log in first] + [latest.id])
+
+
+class ReplicaRoutingTests(ChallengeFlowTestCase):
+    REPLICA = {'ALIAS': 'replica', 'PIN_SECONDS': 5}
+
+    def test_reads_inside_use_replica_go_to_replica(self):
+        router = PrimaryReplicaRouter()
+
+        with self.settings(DATABASE_REPLICA=self.REPLICA):
+            with use_replica() as enabled:
+                self.assertTrue(enabled)
+                self.assertEqual(router.db_for_read(UserSession), 'replica')
+                self.assertEqual(router.db_for_write(UserSession), 'default')
+            self.assertIsNone(router.db_for_read(UserSession))
+
+    def test_no_replica_configured(self):
+        with self.settings(DATABASE_REPLICA={'ALIAS': None, 'PIN_SECONDS': 5}):
+            with use_replica() as enabled:
+                self.assertFalse(enabled)
+                self.assertIsNone(PrimaryReplicaRouter().db_for_read(UserSession))
+
+    def test_recently_written_session_reads_from_primary(self):
+        with self.settings(DATABASE_REPLICA=self.REPLICA):
+            session_id = self._init_session()
+            other_id = '550e8400-e29b-41d4-a716-446655440000'
+
+            with use_replica(session_ids=[other_id]) as enabled:
+                self.assertTrue(enabled)
+            with use_replica(session_ids=[other_id, session_id]) as enabled:
+                self.assertFalse(enabled)
+
+            # Served by the primary, so the new session is found
+            response = self.client.get(f'/api/trust-score/{session_id}/')
+            self.assertEqual(response.status_code, 200)
+
+
+class FingerprintReputationTests(ChallengeFlowTestCase):
+    def test_attempts_are_aggregated_with_upserts(self):
+        record_attempt('fp-1', 0.9, True)
+        record_attempt('fp-1', 0.3, False)
+        record_attempt('fp-2', 0.5, False)
+
+        reputation = FingerprintReputation.objects.get(fingerprint_id='fp-1')
+        self.assertEqual((reputation.attempts, reputation.passes), (2, 1))
+        self.assertAlmostEqual(reputation.mean_score, 0.6)
+        self.assertEqual(FingerprintReputation.objects.count(), 2)
+
+    def test_lookups_are_cached(self):
+        record_attempt('fp-1', 0.9, True)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_reputation('fp-1')['attempts'], 1)
+            self.assertEqual(get_reputation('fp-1')['attempts'], 1)
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_reputation('unknown'))
+            self.assertIsNone(get_reputation('unknown'))
+
+    def test_submit_records_attempt_and_uses_prior(self):
+        for _ in range(3):
+            record_attempt('test-fingerprint-123', 0.0, False)
+
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        response = self._submit(session_id, challenge['type'])
+
+        reputation = FingerprintReputation.objects.get(fingerprint_id='test-fingerprint-123')
+        self.assertEqual(reputation.attempts, 4)
+        # Three earlier scores of 0 pull the trust score down by PRIOR_WEIGHT,
+        # while the aggregate records the score before the prior
+        self.assertAlmostEqual(response.data['trust_score'], 0.8 * reputation.score_sum)
+
+    def test_prior_needs_enough_attempts(self):
+        engine = ScoringEngine()
+        self.assertEqual(engine.apply_reputation_prior(0.5, None), 0.5)
+        self.assertEqual(engine.apply_reputation_prior(0.5, {'attempts': 2, 'mean_score': 1.0}), 0.5)
+        self.assertAlmostEqual(engine.apply_reputation_prior(0.5, {'attempts': 3, 'mean_score': 1.0}), 0.6)
+
+
+class IPReputationTests(ChallengeFlowTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(reload_ip_index)
+        self.source = os.path.join(directory, 'ranges.txt')
+        self.index_path = os.path.join(directory, 'ip_reputation.idx')
+
+        settings_override = override_settings(IP_REPUTATION={
+            'SOURCES': [self.source], 'INDEX_PATH': self.index_path, 'RELOAD_INTERVAL': 30, 'RISK_WEIGHT': 0.3,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _build(self, text):
+        with open(self.source, 'w') as f:
+            f.write(text)
+        result = build_index([self.source], self.index_path)
+        reload_ip_index()
+        return result
+
+    def test_overlapping_ranges_keep_highest_risk(self):
+        self._build(
+            "# hosting\n"
+            "10.0.0.0/8, 0.25\n"
+            "10.1.0.0/16, 0.75, vpn\n"
+            "10.1.2.3-10.1.2.9, 0.5\n"
+            "2001:db8::/32, 0.5\n"
+        )
+
+        self.assertEqual(get_ip_risk('10.200.0.1'), 0.25)
+        self.assertEqual(get_ip_risk('10.1.2.5'), 0.75)
+        self.assertEqual(get_ip_risk('11.0.0.0'), 0.0)
+        self.assertEqual(get_ip_risk('2001:db8:ffff::1'), 0.5)
+        self.assertEqual(get_ip_risk('2001:db9::1'), 0.0)
+        self.assertEqual(get_ip_risk('::ffff:10.1.0.1'), 0.75)
+        self.assertEqual(get_ip_risk('not an address'), 0.0)
+
+    def test_rebuilt_index_is_swapped_in(self):
+        self.assertEqual(get_ip_risk('203.0.113.7'), 0.0)
+
+        self.assertEqual(self._build("203.0.113.0/24, 0.5\n"), (1, 0))
+        self.assertEqual(get_ip_risk('203.0.113.7'), 0.5)
+
+        self._build("203.0.113.0/25, 0.5\n203.0.113.128/25, 0.5\n")
+        self.assertEqual(get_ip_index()._v4_starts.tolist(), [3405803776])
+        self.assertEqual(get_ip_risk('198.51.100.1'), 0.0)
+
+    def test_risky_network_lowers_trust_score(self):
+        self._build("127.0.0.0/8, 1.0\n")
+
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        response = self._submit(session_id, challenge['type'])
+
+        # The same score as FingerprintReputationTests, less RISK_WEIGHT
+        reputation = FingerprintReputation.objects.get(fingerprint_id='test-fingerprint-123')
+        self.assertGreater(reputation.score_sum, 0.3)
+        self.assertAlmostEqual(response.data['trust_score'], reputation.score_sum - 0.3)
+
+    def test_forwarded_for_cannot_claim_a_clean_address(self):
+        self._build("198.51.100.0/24, 1.0\n")
+        fingerprint = {'fingerprint_id': 'test-fingerprint-123'}
+
+        with self.settings(TRUSTED_PROXY_COUNT=1):
+            # A datacenter client behind the proxy, naming a clean address first
+            spoofed = self.client.post('/api/init-session/', fingerprint, format='json',
+                                       HTTP_X_FORWARDED_FOR='203.0.113.7, 198.51.100.20', REMOTE_ADDR='10.0.0.1')
+        # No trusted proxy: the header is ignored
+        direct = self.client.post('/api/init-session/', fingerprint, format='json',
+                                  HTTP_X_FORWARDED_FOR='203.0.113.7', REMOTE_ADDR='198.51.100.21')
+
+        for response in (spoofed, direct):
+            self.assertEqual(get_session_metadata(response.data['session_id'])['ip_risk'], 1.0)
+
+
+class ReplayDetectionTests(ChallengeFlowTestCase):
+    def _trace(self, start=1620000000000, jitter=0):
+        return {
+            'mouse_movements': [
+                {'x': 100 + i * 7 + (jitter if i == 5 else 0), 'y': 200 + (i * i) % 13, 'timestamp': start + i * 17}
+                for i in range(30)
+            ],
+            'keystroke_timings': [{'timestamp': start + i * 130} for i in range(5)],
+        }
+
+    def test_replayed_trace_is_detected_within_window(self):
+        now = 1700000000
+        self.assertFalse(check_and_record_trace(self._trace(), now=now))
+        # Same recording, replayed later: timestamps are compared relative to the first event
+        self.assertTrue(check_and_record_trace(self._trace(start=1620000999000), now=now + 2000))
+        self.assertFalse(check_and_record_trace(self._trace(jitter=1), now=now + 2000))
+
+        # Four 15-minute generations: forgotten once an hour has passed
+        # without it being seen
+        self.assertFalse(check_and_record_trace(self._trace(), now=now + 5700))
+
+    def test_short_traces_are_ignored(self):
+        trace = {'mouse_movements': self._trace()['mouse_movements'][:5], 'keystroke_timings': []}
+
+        self.assertFalse(check_and_record_trace(trace))
+        self.assertFalse(check_and_record_trace(trace))
+
+    def test_replay_lowers_trust_score(self):
+        challenge = None
+        scores = []
+        for _ in range(2):
+            session_id = self._init_session()
+            if challenge is None:
+                self.client.get('/api/get-challenge/', {'session_id': session_id})
+                challenge = get_challenge_store().get(f"challenge_{session_id}")
+            else:
+                get_challenge_store().set(f"challenge_{session_id}", challenge, timeout=60)
+
+            response = self.client.post('/api/submit-challenge/', {
+                'session_id': str(session_id),
+                'challenge_type': challenge['type'],
+                'response_data': {},
+                'behavior_data': self._trace(),
+                'time_taken_ms': 5000,
+            }, format='json')
+            scores.append(response.data['trust_score'])
+
+        self.assertLess(scores[1], scores[0])
+        self.assertAlmostEqual(scores[1], max(0, scores[0] - 0.5))
+
+
+class TrajectorySimilarityTests(ChallengeFlowTestCase):
+    def _path(self, seed, jitter=0.0):
+        rng = np.random.default_rng(seed)
+        angles = np.cumsum(rng.normal(0, 0.3, 120))
+        x = np.cumsum(np.cos(angles) * 5) + 500
+        y = np.cumsum(np.sin(angles) * 5) + 400
+        timestamps = np.cumsum(rng.uniform(12, 20, 120))
+        if jitter:
+            noise = np.random.default_rng(seed + 1000).normal(0, jitter, (3, 120))
+            x, y, timestamps = x + noise[0], y + noise[1], timestamps + noise[2]
+        return [{'x': a, 'y': b, 'timestamp': t} for a, b, t in zip(x.tolist(), y.tolist(), timestamps.tolist())]
+
+    def test_jittered_path_is_close_and_others_are_not(self):
+        signature = path_signature(self._path(1))
+        shifted = [dict(event, x=event['x'] + 300, timestamp=event['timestamp'] + 9999) for event in self._path(1)]
+
+        self.assertEqual(path_signature(shifted), signature)
+        self.assertLessEqual((signature ^ path_signature(self._path(1, jitter=1.0))).bit_count(), 12)
+        self.assertGreater((signature ^ path_signature(self._path(2))).bit_count(), 40)
+        self.assertIsNone(path_signature(self._path(1)[:5]))
+
+    def test_index_counts_similar_paths_in_window(self):
+        index = TrajectoryIndex()
+        now = 1700000000
+        for seed in range(3):
+            index.add(path_signature(self._path(1, jitter=seed * 0.5)), now)
+        index.add(path_signature(self._path(2)), now)
+
+        signature = path_signature(self._path(1, jitter=0.8))
+        self.assertEqual(index.count_similar(signature, now + 60), 3)
+        self.assertEqual(index.count_similar(signature, now + 3 * 3600), 0)
+
+    def test_jittered_passive_traces_require_challenge(self):
+        def check(session_id, jitter):
+            return self.client.post('/api/check-session/', {
+                'session_id': str(session_id),
+                'behavior_data': {'mouse_movements': self._path(1, jitter=jitter), 'keystroke_timings': []},
+            }, format='json')
+
+        config = {**settings.TRAJECTORY_SIMILARITY, 'MIN_SIMILAR': 1}
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=0.01, TRAJECTORY_SIMILARITY=config):
+            first = check(self._init_session(), 0)
+        self.assertFalse(first.data['challenge_required'])
+
+        session_id = self._init_session()
+        with self.settings(FRICTIONLESS_PASS_THRESHOLD=first.data['trust_score'] - 0.02, TRAJECTORY_SIMILARITY=config):
+            response = check(session_id, 0.5)
+
+        self.assertTrue(response.data['challenge_required'])
+        self.assertIsNone(UserSession.objects.get(id=session_id).trust_score)
+
+    def test_submit_feeds_index_and_bulk_build_reads_logs(self):
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        self.client.post('/api/submit-challenge/', {
+            'session_id': str(session_id),
+            'challenge_type': challenge['type'],
+            'response_data': {},
+            'behavior_data': {'mouse_movements': self._path(3), 'keystroke_timings': []},
+            'time_taken_ms': 5000,
+        }, format='json')
+
+        signature = path_signature(self._path(3))
+        self.assertEqual(TrajectoryIndex().count_similar(signature), 1)
+
+        index = TrajectoryIndex(store=LocalChallengeStore())
+        batches = list(build_trajectory_index(index, timezone.now() - timedelta(hours=1), count=True))
+        log_id = ChallengeLog.objects.get().id
+        self.assertEqual(batches, [(1, [(log_id, 0)])])
+        self.assertEqual(index.count_similar(signature), 1)
+
+
+class SessionCleanupTests(ChallengeFlowTestCase):
+    def _age(self, session_id, **delta):
+        UserSession.objects.filter(id=session_id).update(created_at=timezone.now() - timedelta(**delta))
+
+    def test_expired_sessions_are_deleted_in_batches(self):
+        unscored = [self._init_session() for _ in range(3)]
+        for session_id in unscored:
+            self._age(session_id, hours=30)
+        recent = self._init_session()
+
+        archived = self._init_session()
+        UserSession.objects.filter(id=archived).update(trust_score=0.9)
+        self._age(archived, days=40)
+
+        # Old and scored, but its challenge log is not archived yet
+        logged = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': logged}).data['challenge']
+        self._submit(logged, challenge['type'])
+        self._age(logged, days=40)
+
+        record_attempt('stale-fingerprint', 0.5, True)
+        FingerprintReputation.objects.filter(fingerprint_id='stale-fingerprint').update(
+            last_seen=timezone.now() - timedelta(days=200)
+        )
+
+        self.assertEqual(
+            list(cleanup_sessions(dry_run=True)),
+            [('unscored sessions', 3), ('scored sessions', 1), ('reputation aggregates', 1)],
+        )
+        batches = list(cleanup_sessions(batch_size=2, sleep_seconds=0))
+
+        self.assertEqual(batches[:3], [('unscored sessions', 2), ('unscored sessions', 1), ('scored sessions', 1)])
+        self.assertEqual(sum(count for label, count in batches if label == 'reputation aggregates'), 1)
+        self.assertEqual(set(UserSession.objects.values_list('id', flat=True)), {recent, logged})
+        self.assertEqual(Fingerprint.objects.count(), 2)
+        self.assertEqual(
+            list(FingerprintReputation.objects.values_list('fingerprint_id', flat=True)), ['test-fingerprint-123']
+        )
+
+    def test_sessions_scored_after_selection_are_kept(self):
+        session_id = self._init_session()
+        self._age(session_id, hours=30)
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+
+        select = cleanup._session_batches
+
+        def select_then_submit(queryset, batch_size):
+            for session_ids in select(queryset, batch_size):
+                # Scored while its batch waits to be deleted
+                self._submit(session_id, challenge['type'])
+                yield session_ids
+
+        with mock.patch.object(cleanup, '_session_batches', select_then_submit):
+            batches = list(cleanup.cleanup_sessions(sleep_seconds=0))
+
+        self.assertIn(('unscored sessions', 0), batches)
+        self.assertTrue(UserSession.objects.filter(id=session_id, trust_score__isnull=False).exists())
+        self.assertEqual(Fingerprint.objects.filter(session_id=session_id).count(), 1)
+        self.assertEqual(ChallengeLog.objects.filter(session_id=session_id).count(), 1)
+
+
+class FeatureStoreTests(ChallengeFlowTestCase):
+    BEHAVIOR = {
+        'mouse_movements': FeatureExtractionTests.MOUSE,
+        'keystroke_timings': FeatureExtractionTests.KEYSTROKES,
+    }
+
+    def test_submit_stores_scoring_features(self):
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        self.client.post('/api/submit-challenge/', {
+            'session_id': str(session_id),
+            'challenge_type': challenge['type'],
+            'response_data': {},
+            'behavior_data': self.BEHAVIOR,
+            'time_taken_ms': 5000,
+        }, format='json')
+
+        log = ChallengeLog.objects.get()
+        self.assertEqual(log.feature_version, FEATURE_VERSION)
+        np.testing.assert_array_equal(unpack_features([bytes(log.features)])[0], extract_features(self.BEHAVIOR))
+
+    def test_backfill_only_recomputes_stale_logs(self):
+        session_id = self._init_session()
+        fields = {'session_id': session_id, 'challenge_type': 'drag-align', 'challenge_data': {'type': 'drag-align'},
+                  'response_data': {'behavior_data': self.BEHAVIOR}, 'passed': True, 'time_taken_ms': 4000}
+        missing = ChallengeLog.objects.create(**fields)
+        outdated = ChallengeLog.objects.create(**fields, features=pack_features(np.zeros(len(FEATURE_NAMES))),
+                                               feature_version=FEATURE_VERSION - 1)
+        current = ChallengeLog.objects.create(**fields, features=pack_features(np.ones(len(FEATURE_NAMES))),
+                                              feature_version=FEATURE_VERSION)
+
+        self.assertEqual(list(backfill_features(batch_size=1, sleep_seconds=0)), [1, 1])
+        self.assertEqual(list(backfill_features(sleep_seconds=0)), [])
+
+        stored = dict(ChallengeLog.objects.values_list('id', 'features'))
+        expected = extract_features(self.BEHAVIOR)
+        np.testing.assert_array_equal(unpack_features([bytes(stored[missing.id])])[0], expected)
+        np.testing.assert_array_equal(unpack_features([bytes(stored[outdated.id])])[0], expected)
+        np.testing.assert_array_equal(unpack_features([bytes(stored[current.id])])[0], np.ones(len(FEATURE_NAMES)))
+
+
+@skipIf(pa is None, 'pyarrow is not installed')
+class DatasetGenerationTests(ChallengeFlowTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Imported as a top-level module, as when run from scripts/
+        scripts = str(settings.BASE_DIR / 'scripts')
+        if scripts not in sys.path:
+            sys.path.append(scripts)
+        cls.generate_dataset = importlib.import_module('generate_dataset')
+
+    def setUp(self):
+        super().setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def _seed(self, count, features=True):
+        session_id = self._init_session()
+        logs = []
+        for i in range(count):
+            behavior_data = {
+                'mouse_movements': FeatureExtractionTests.MOUSE[:2 + i % 4],
+                'keystroke_timings': FeatureExtractionTests.KEYSTROKES,
+            }
+            vector = extract_features(behavior_data)
+            logs.append(ChallengeLog.objects.create(
+                session_id=session_id, challenge_type='drag-align', challenge_data={'type': 'drag-align'},
+                response_data={'behavior_data': behavior_data}, passed=i % 2 == 0, time_taken_ms=4000 + i,
+                features=pack_features(vector) if features else None,
+                feature_version=FEATURE_VERSION if features else None,
+            ))
+        return logs
+
+    def _expected_features(self, logs):
+        return np.array([
+            extract_features(ChallengeLog.objects.get(id=log.id).response_data['behavior_data']) for log in logs
+        ])
+
+    def test_extract_chunk_reads_stored_features(self):
+        logs = self._seed(5)
+
+        rows, = self.generate_dataset.iter_chunks(chunk_size=10)
+        # Rows are sent to spawned worker processes
+        rows = pickle.loads(pickle.dumps(rows))
+        table, recomputed = self.generate_dataset.extract_chunk(rows)
+
+        self.assertEqual(recomputed, [])
+        self.assertEqual(table.column('time_taken_ms').to_pylist(), [log.time_taken_ms for log in logs])
+        np.testing.assert_array_equal(
+            np.column_stack([table.column(name).to_numpy() for name in FEATURE_NAMES]),
+            self._expected_features(logs),
+        )
+
+    def test_generate_dataset_writes_every_log(self):
+        logs = self._seed(5)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            path = self.generate_dataset.generate_dataset(chunk_size=2, workers=1, output_dir=self.output_dir)
+
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        self.assertEqual(table.schema.metadata[b'feature_version'], str(FEATURE_VERSION).encode())
+        self.assertEqual(table.column('passed').to_pylist(), [log.passed for log in logs])
+        np.testing.assert_array_equal(
+            np.column_stack([table.column(name).to_numpy() for name in FEATURE_NAMES]),
+            self._expected_features(logs),
+        )
+
+
+    def test_stale_logs_are_recomputed_by_workers_and_stored(self):
+        logs = self._seed(5, features=False)
+
+        rows, = self.generate_dataset.iter_chunks(chunk_size=10)
+        self.assertTrue(all(type(row['response_raw']) is bytes for row in rows))
+        with contextlib.redirect_stdout(io.StringIO()):
+            path = self.generate_dataset.generate_dataset(chunk_size=2, workers=1, output_dir=self.output_dir)
+
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        expected = self._expected_features(logs)
+        np.testing.assert_array_equal(np.column_stack([table.column(name).to_numpy() for name in FEATURE_NAMES]), expected)
+        stored = ChallengeLog.objects.filter(feature_version=FEATURE_VERSION).order_by('id').values_list('features', flat=True)
+        np.testing.assert_array_equal(unpack_features([bytes(blob) for blob in stored]), expected)
+
+    def test_chunks_are_paged_by_id_so_features_can_be_stored_between_them(self):
+        logs = self._seed(5, features=False)
+
+        chunks = self.generate_dataset.iter_chunks(chunk_size=2)
+        seen = []
+        while True:
+            # Each chunk is read by a query of its own, so no cursor is left
+            # open while the backfill writes to the same connection
+            with CaptureQueriesContext(connection) as queries:
+                chunk = next(chunks, None)
+            self.assertEqual(len(queries.captured_queries), 1)
+            if chunk is None:
+                break
+            seen.extend(row['id'] for row in chunk)
+            save_features([(row['id'], np.zeros(len(FEATURE_NAMES))) for row in chunk])
+
+        self.assertEqual(seen, [log.id for log in logs])
+        self.assertEqual(ChallengeLog.objects.filter(feature_version=FEATURE_VERSION).count(), len(logs))
+
+
+class ModelRegistryTests(ChallengeFlowTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MODEL_REGISTRY={
+            'ROOT': os.path.join(self.root, 'models'), 'RELOAD_INTERVAL': 30, 'MODEL_WEIGHT': 0.5,
+            'SHADOW_LOG_ROOT': os.path.join(self.root, 'shadow'), 'SHADOW_QUEUE_SIZE': 10,
+        })
+        settings_override.enable()
+        self.addCleanup(load_models)
+        self.addCleanup(settings_override.disable)
+        load_models()
+        self.registry = ModelRegistry()
+
+    def _register(self, human_when_fast):
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame(rng.normal(size=(200, len(MODEL_COLUMNS))), columns=MODEL_COLUMNS)
+        X['time_taken_ms'] = rng.uniform(0, 10000, 200)
+        y = (X['time_taken_ms'] < 5000) == human_when_fast
+        pipeline = Pipeline([
+            ('imputer', SimpleImputer()), ('scaler', StandardScaler()), ('classifier', LogisticRegression()),
+        ]).fit(X, y)
+        return self.registry.register(pipeline, MODEL_COLUMNS, mode='test')
+
+    def test_published_version_is_swapped_in_without_restart(self):
+        first, second = self._register(True), self._register(False)
+        self.assertEqual(self.registry.versions(), sorted([first, second]))
+        self.assertIsNone(get_model('live'))
+
+        self.registry.publish('live', first)
+        load_models()
+        model = get_model('live')
+        self.assertEqual(model.version, first)
+
+        # Picked up at the next check, while the old model keeps working
+        self.registry.publish('live', second)
+        self.assertIs(get_model('live'), model)
+        load_models()
+        self.assertEqual(get_model('live').version, second)
+        features = np.zeros((1, len(FEATURE_NAMES)), dtype=np.float32)
+        self.assertGreater(model.predict(features, [1000], [None])[0], get_model('live').predict(features, [1000], [None])[0])
+
+        with self.assertRaises(ValueError):
+            self.registry.publish('live', 'missing')
+
+    def test_new_versions_are_loaded_off_the_request_thread(self):
+        first, second = self._register(True), self._register(False)
+        self.registry.publish('live', first)
+        load_models()
+        model = get_model('live')
+        self.registry.publish('live', second)
+
+        release = threading.Event()
+        load = ModelRegistry.load
+
+        def slow_load(registry, version):
+            release.wait(10)
+            return load(registry, version)
+
+        with mock.patch.object(ModelRegistry, 'load', autospec=True, side_effect=slow_load):
+            reload_models()
+            # Requests keep the old model while the new one loads
+            self.assertIs(get_model('live'), model)
+            self.assertIs(get_model('live'), model)
+            release.set()
+            for thread in threading.enumerate():
+                if thread.name == 'model-loader-live':
+                    thread.join()
+        self.assertEqual(get_model('live').version, second)
+
+    def test_shadow_model_is_compared_off_the_response_path(self):
+        self.registry.publish('live', self._register(True))
+        self.registry.publish('shadow', self._register(False))
+        load_models()
+        # Earlier scores of 0 pull both scores down through the reputation prior
+        for _ in range(3):
+            record_attempt('test-fingerprint-123', 0.0, False)
+
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        response = self._submit(session_id, challenge['type'])
+        get_shadow_scorer().join()
+
+        (versions, records), = read_shadow_logs().items()
+        live, shadow = get_model('live'), get_model('shadow')
+        self.assertEqual(versions, (live.version, shadow.version))
+        self.assertEqual(records['log_id'].tolist(), [ChallengeLog.objects.get().id])
+        self.assertAlmostEqual(float(records['live_score'][0]), response.data['trust_score'], places=5)
+        self.assertEqual(bool(records['live_passed'][0]), response.data['passed'])
+
+        # The shadow model replaces the live one in the challenge score, which
+        # the reputation recorded before the prior; the prior applies alike
+        engine = ScoringEngine()
+        features = unpack_features([bytes(ChallengeLog.objects.get().features)])
+        challenge_score = FingerprintReputation.objects.get(fingerprint_id='test-fingerprint-123').score_sum
+        heuristic_score = 2 * challenge_score - live.predict(features, [5000], [0.85])[0]
+        shadow_score = 0.8 * engine.apply_model_score(heuristic_score, shadow.predict(features, [5000], [0.85])[0])
+        self.assertAlmostEqual(float(records['shadow_score'][0]), shadow_score, places=5)
+        self.assertEqual(bool(records['shadow_passed'][0]), engine.is_challenge_passed(shadow_score))
+        self.assertNotEqual(records['live_score'][0], records['shadow_score'][0])
+
+
+class BacktestTests(ChallengeFlowTestCase):
+    def test_replay_reproduces_logged_decisions_and_applies_candidate(self):
+        session_id = self._init_session()
+        challenge = self.client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        self._submit(session_id, challenge['type'])
+        # Logged before feature vectors were stored
+        ChallengeLog.objects.create(
+            session_id=session_id, challenge_type='reverse-turing',
+            challenge_data={'type': 'reverse-turing', 'answer': 'b'},
+            response_data={'selected_id': 'b', 'behavior_data': FeatureStoreTests.BEHAVIOR},
+            passed=True, time_taken_ms=8000,
+        )
+
+        *_, (replayed, recomputed, totals) = run_backtest(
+            ScorerConfig(fail_threshold=0), baseline=ScorerConfig(), cohorts=['browser'], workers=1
+        )
+
+        self.assertEqual((replayed, recomputed), (2, 1))
+        self.assertEqual(set(totals['challenge_type']), {challenge['type'], 'reverse-turing'})
+        counts = dict(zip(COUNTS, totals['browser']['Chrome']))
+        self.assertEqual(counts['attempts'], 2)
+        self.assertEqual(counts['baseline_passed'], counts['logged_passed'])
+        self.assertEqual(counts['candidate_passed'], 2)
+        self.assertEqual(counts['newly_passed'], 2 - counts['baseline_passed'])
+        self.assertEqual(counts['newly_failed'], 0)
 
-# Create your tests here.
+        with self.assertRaises(ValueError):
+            ScorerConfig(weights={'speed': 1.0})
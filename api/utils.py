@@ -0,0 +1,30 @@
+import ipaddress
+
+from django.conf import settings
+
+
+def _ip_or_none(value):
+    try:
+        return str(ipaddress.ip_address(value.strip()))
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_client_ip(request):
+    """
+    Return the client IP address.
+
+    Behind ``TRUSTED_PROXY_COUNT`` reverse proxies this is the X-Forwarded-For
+    hop appended by the outermost one, i.e. the right-most hop that no
+    trusted proxy vouches for; hops to its left are whatever the client sent
+    and are never used. Without trusted proxies, or when that hop is missing
+    or not an IP address, REMOTE_ADDR is used.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if proxies > 0:
+        hops = request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if len(hops) >= proxies:
+            ip_address = _ip_or_none(hops[-proxies])
+            if ip_address is not None:
+                return ip_address
+    return request.META.get('REMOTE_ADDR')
@@ -1,4 +1,6 @@
+import numpy as np
 from rest_framework import status
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
@@ -7,23 +9,65 @@ from django.conf import settings
 from api.models import UserSession, ChallengeLog
 from api.serializers import (
     UserSessionSerializer, ChallengeLogSerializer, TrustScoreSerializer,
-    ChallengeRequestSerializer, ChallengeResponseSerializer
+    ChallengeRequestSerializer, ChallengeResponseSerializer, BatchTrustScoreRequestSerializer,
+    SessionCheckSerializer
 )
+from api.challenge_logic.features import FEATURE_VERSION, extract_features, pack_features
 from api.challenge_logic.generator import ChallengeGenerator
 from api.challenge_logic.scoring import ScoringEngine
+from api.challenge_store import get_challenge_store
+from api.model_registry import apply_live_model
+from api.parsers import BehaviorJSONParser
+from api.replay import check_and_record_trace
+from api.reputation import record_attempt
+from api.routers import pin_session, use_replica
+from api.session_cache import cache_session, consume_passive_check, get_session_metadata
+from api.shadow import get_shadow_scorer
+from api.similarity import record_trajectory
+from api.utils import get_client_ip
+
+
+def frictionless_pass(session_id, session_metadata, behavior_data):
+    """
+    Score a session on passive signals and record the trust score if it is
+    confident enough to skip the challenge.
+
+    A session is scored on passive behavior once, and only before it has a
+    trust score, so a failed challenge cannot be overwritten by retrying
+    made-up passive traces.
+
+    Returns:
+        float: The passive trust score if the session passes, otherwise None
+    """
+    scoring_engine = ScoringEngine()
+    passive_score = scoring_engine.calculate_passive_score(session_metadata, behavior_data)
+    if passive_score is None or not consume_passive_check(session_id):
+        return None
+    # A recorded human trace, replayed as is or jittered, must not pass any
+    # number of sessions
+    passive_score = scoring_engine.apply_replay_penalty(passive_score, check_and_record_trace(behavior_data))
+    passive_score = scoring_engine.apply_similarity_penalty(passive_score, record_trajectory(behavior_data))
+    if not scoring_engine.is_frictionless_pass(passive_score):
+        return None
+
+    if not UserSession.objects.filter(id=session_id, trust_score__isnull=True).update(trust_score=passive_score):
+        return None
+    pin_session(session_id)
+    record_attempt(session_metadata['fingerprint_id'], passive_score, True)
+    return passive_score
 
 
 class InitSessionView(APIView):
     """
     Initialize a new user session with fingerprint data.
+
+    Sessions that also send passive behavior_data can pass without a challenge.
     """
+    parser_classes = [BehaviorJSONParser, FormParser, MultiPartParser]
+
     def post(self, request):
         # Get client IP address
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip_address = x_forwarded_for.split(',')[0]
-        else:
-            ip_address = request.META.get('REMOTE_ADDR')
+        ip_address = get_client_ip(request)
 
         # Add IP to request data
         data = request.data.copy()
@@ -32,14 +76,66 @@ class InitSessionView(APIView):
         serializer = UserSessionSerializer(data=data)
         if serializer.is_valid():
             session = serializer.save()
-            return Response({
+            session_metadata = cache_session(session)
+            pin_session(session.id)
+
+            response_data = {
                 'session_id': session.id,
-                'message': 'Session initialized successfully'
-            }, status=status.HTTP_201_CREATED)
+                'message': 'Session initialized successfully',
+                'challenge_required': True
+            }
+
+            behavior_data = serializer.validated_data.get('behavior_data')
+            if behavior_data is not None:
+                trust_score = frictionless_pass(session.id, session_metadata, behavior_data)
+                if trust_score is not None:
+                    response_data.update({
+                        'challenge_required': False,
+                        'trust_score': trust_score,
+                        'passed': True
+                    })
+
+            return Response(response_data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CheckSessionView(APIView):
+    """
+    Lightweight pre-challenge check: pass the session on passive behavior
+    alone, or tell the client a challenge is required.
+    """
+    parser_classes = [BehaviorJSONParser]
+
+    def post(self, request):
+        serializer = SessionCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        session_id = serializer.validated_data['session_id']
+
+        session_metadata = get_session_metadata(session_id)
+        if session_metadata is None:
+            return Response({
+                'error': 'Session not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        trust_score = frictionless_pass(
+            session_id, session_metadata, serializer.validated_data['behavior_data']
+        )
+        if trust_score is None:
+            return Response({
+                'challenge_required': True,
+                'passed': False
+            }, status=status.HTTP_200_OK)
+
+        return Response({
+            'challenge_required': False,
+            'trust_score': trust_score,
+            'passed': True
+        }, status=status.HTTP_200_OK)
+
+
 class GetChallengeView(APIView):
     """
     Get a random challenge for the user.
@@ -51,10 +147,8 @@ class GetChallengeView(APIView):
 
         session_id = serializer.validated_data['session_id']
 
-        # Check if session exists
-        try:
-            session = UserSession.objects.get(id=session_id)
-        except UserSession.DoesNotExist:
+        # Check if session exists (served from cache on the happy path)
+        if get_session_metadata(session_id) is None:
             return Response({
                 'error': 'Session not found'
             }, status=status.HTTP_404_NOT_FOUND)
@@ -69,12 +163,10 @@ class GetChallengeView(APIView):
         # Remove answers before sending to client
         client_challenge = generator.prepare_challenge_for_client(challenge_data)
 
-        # Store challenge data in session or cache for later verification
-        # In a production system, you'd want to store this securely
-        # For simplicity, we'll store it in the session object's cache
-        from django.core.cache import cache
-        cache_key = f"challenge_{session_id}"
-        cache.set(cache_key, challenge_with_answers, timeout=3600)  # 1 hour timeout
+        # Store challenge data in the shared challenge store for later verification
+        get_challenge_store().set(
+            f"challenge_{session_id}", challenge_with_answers, timeout=settings.CHALLENGE_TIMEOUT
+        )
 
         return Response({
             'challenge': client_challenge
@@ -85,6 +177,8 @@ class SubmitChallengeView(APIView):
     """
     Submit a challenge response and calculate trust score.
     """
+    parser_classes = [BehaviorJSONParser]
+
     def post(self, request):
         serializer = ChallengeResponseSerializer(data=request.data)
         if not serializer.is_valid():
@@ -106,18 +200,16 @@ class SubmitChallengeView(APIView):
         # Add time_taken_ms to response_data for scoring
         response_data['time_taken_ms'] = time_taken_ms
 
-        # Get session
-        try:
-            session = UserSession.objects.get(id=session_id)
-        except UserSession.DoesNotExist:
+        # Check if session exists (served from cache on the happy path)
+        session_metadata = get_session_metadata(session_id)
+        if session_metadata is None:
             return Response({
                 'error': 'Session not found'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        # Retrieve original challenge data with answers
-        from django.core.cache import cache
-        cache_key = f"challenge_{session_id}"
-        challenge_data = cache.get(cache_key)
+        # Retrieve and remove the original challenge in one atomic step, so a
+        # challenge can only be submitted once even under concurrent requests
+        challenge_data = get_challenge_store().consume(f"challenge_{session_id}")
 
         if not challenge_data:
             return Response({
@@ -130,32 +222,60 @@ class SubmitChallengeView(APIView):
                 'error': 'Challenge type mismatch'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Calculate trust score
+        # Calculate trust score, blending in the live model if one is
+        # published, then using the fingerprint's history as a prior, and
+        # penalties for a risky network or a replayed (exactly, or with
+        # jitter) behavior trace
+        features = extract_features(behavior_data)
         scoring_engine = ScoringEngine()
-        trust_score = scoring_engine.calculate_trust_score(
-            challenge_data, response_data, behavior_data
+        heuristic_score = scoring_engine.calculate_trust_score(
+            challenge_data, response_data, behavior_data, features=features
+        )
+        challenge_score, live_version, live_seconds = apply_live_model(
+            scoring_engine, heuristic_score, features, time_taken_ms, session_metadata.get('entropy_score')
         )
+        adjustments = {
+            'reputation': session_metadata.get('reputation'),
+            'ip_risk': session_metadata.get('ip_risk'),
+            'replayed': check_and_record_trace(behavior_data),
+            'similar_paths': record_trajectory(behavior_data),
+        }
+        trust_score = scoring_engine.adjust_trust_score(challenge_score, **adjustments)
 
         # Determine if challenge passed
         passed = scoring_engine.is_challenge_passed(trust_score)
 
-        # Log the challenge attempt
+        # Log the challenge attempt by FK id, without loading the session row.
+        # time_taken_ms has its own column; the behavior streams are stored
+        # column-wise by the compact field encoding, and the feature vector
+        # used for scoring is kept for training datasets.
+        logged_response = {key: value for key, value in response_data.items() if key != 'time_taken_ms'}
+        logged_response['behavior_data'] = behavior_data
         challenge_log = ChallengeLog.objects.create(
-            session=session,
+            session_id=session_id,
             challenge_type=challenge_type,
             challenge_data=challenge_data,
-            response_data=response_data,
+            response_data=logged_response,
             passed=passed,
-            time_taken_ms=time_taken_ms
+            time_taken_ms=time_taken_ms,
+            features=pack_features(features),
+            feature_version=FEATURE_VERSION
         )
 
         # Update session trust score
         # If multiple challenges, we could average or use the most recent
-        session.trust_score = trust_score
-        session.save()
+        UserSession.objects.filter(id=session_id).update(trust_score=trust_score)
+        pin_session(session_id)
 
-        # Clear the challenge from cache
-        cache.delete(cache_key)
+        # The reputation keeps the score before the prior, so a fingerprint's
+        # history does not feed back into itself
+        record_attempt(session_metadata['fingerprint_id'], challenge_score, passed)
+
+        # Compared with a candidate model in the background, if one is published
+        get_shadow_scorer().submit(
+            challenge_log.id, heuristic_score, trust_score, passed, live_version, live_seconds,
+            adjustments, features, time_taken_ms, session_metadata.get('entropy_score')
+        )
 
         return Response({
             'trust_score': trust_score,
@@ -168,7 +288,9 @@ class TrustScoreView(APIView):
     Get the trust score for a session.
     """
     def get(self, request, session_id):
-        session = get_object_or_404(UserSession, id=session_id)
+        # Polled often; served by the read replica unless just written
+        with use_replica(session_ids=[session_id]):
+            session = get_object_or_404(UserSession, id=session_id)
 
         # If no trust score yet, return a default
         if session.trust_score is None:
@@ -186,4 +308,50 @@ class TrustScoreView(APIView):
             'session_id': session_id,
             'trust_score': session.trust_score,
             'passed': passed
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+class BatchTrustScoreView(APIView):
+    """
+    Get the trust scores for many sessions in a single request.
+    """
+    def post(self, request):
+        serializer = BatchTrustScoreRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Keep the caller's order but look each session up only once
+        session_ids = list(dict.fromkeys(serializer.validated_data['session_ids']))
+
+        # One query for the whole batch, on the read replica unless one of
+        # the sessions was just written
+        with use_replica(session_ids=session_ids):
+            scores = dict(
+                UserSession.objects.filter(id__in=session_ids).values_list('id', 'trust_score')
+            )
+
+        found_ids = [session_id for session_id in session_ids if session_id in scores]
+        not_found = [session_id for session_id in session_ids if session_id not in scores]
+
+        # Sessions without a trust score yet get the same neutral default as
+        # TrustScoreView and never pass
+        has_score = [scores[session_id] is not None for session_id in found_ids]
+        trust_scores = [
+            scores[session_id] if scored else 0.5
+            for session_id, scored in zip(found_ids, has_score)
+        ]
+        passed = ScoringEngine().are_challenges_passed(trust_scores) & np.asarray(has_score, dtype=bool)
+
+        results = [
+            {
+                'session_id': session_id,
+                'trust_score': trust_score,
+                'passed': bool(session_passed)
+            }
+            for session_id, trust_score, session_passed in zip(found_ids, trust_scores, passed)
+        ]
+
+        return Response({
+            'results': results,
+            'not_found': not_found
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,100 @@
+import gc
+import io
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_challenges():
+    from api.challenge_logic.generator import ChallengeGenerator
+
+    generator = ChallengeGenerator()
+    generator.prepare_corpora()
+    for challenge_type in generator.CHALLENGE_TYPES:
+        generator.prepare_challenge_for_client(generator.generate_challenge(challenge_type))
+
+
+def _warm_scoring():
+    from api.challenge_logic.generator import ChallengeGenerator
+    from api.challenge_logic.scoring import ScoringEngine
+    from api.parsers import BehaviorJSONParser
+
+    # Run a synthetic submission through the submit-path parser and scorer so
+    # numpy, orjson and the regexes are initialised before the first request
+    body = json.dumps({
+        'behavior_data': {
+            'mouse_movements': [
+                {'x': i * 7 % 400, 'y': i * 13 % 300, 'timestamp': i * 16} for i in range(64)
+            ],
+            'keystroke_timings': [{'timestamp': i * 120} for i in range(8)],
+        },
+    }).encode()
+    behavior_data = BehaviorJSONParser().parse(io.BytesIO(body))['behavior_data']
+
+    scoring_engine = ScoringEngine()
+    challenge_data = ChallengeGenerator().generate_challenge('reverse-turing')
+    trust_score = scoring_engine.calculate_trust_score(
+        challenge_data, {'selected_id': 'text-1', 'time_taken_ms': 5000}, behavior_data
+    )
+    scoring_engine.is_challenge_passed(trust_score)
+    scoring_engine.are_challenges_passed([trust_score])
+
+
+def _warm_ip_reputation():
+    from api.ip_reputation import get_ip_index, get_ip_risk
+
+    # Map the index in the parent so forked workers share the mapping
+    get_ip_index()
+    get_ip_risk('127.0.0.1')
+
+
+def _warm_models():
+    from api.model_registry import load_models
+
+    # Load published models in the parent so forked workers share them
+    load_models()
+
+
+def warm_up():
+    """
+    Load and initialise everything the request path needs, ahead of time.
+
+    Meant to run once in the parent process before workers are forked
+    (gunicorn ``preload_app``), so the work and the memory it allocates are
+    shared copy-on-write by every worker. Also runs the dotted-path callables
+    listed in ``WARMUP_HOOKS``.
+
+    Returns:
+        dict: Seconds spent in each warm-up step
+    """
+    # Importing the URLconf pulls in every view and its dependencies
+    import_string(settings.ROOT_URLCONF + '.urlpatterns')
+
+    timings = {}
+    steps = [
+        ('challenges', _warm_challenges), ('scoring', _warm_scoring),
+        ('ip_reputation', _warm_ip_reputation), ('models', _warm_models),
+    ]
+    steps += [(path, import_string(path)) for path in settings.WARMUP_HOOKS]
+
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+
+    # Never share database sockets with forked workers
+    connections.close_all()
+
+    # Move everything allocated so far out of the collector's reach, so that
+    # garbage collection in the workers does not touch (and copy) these pages
+    gc.collect()
+    gc.freeze()
+
+    logger.info("Warm-up finished: %s", ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in timings.items()))
+    return timings
@@ -1,6 +1,9 @@
 /**
  * Humanauth Behavior Tracker
  * Tracks user behavior for entropy calculation and bot detection.
+ *
+ * Only raw events are sent; the server computes all behavior features
+ * (api/challenge_logic/features.py), so scoring and model training agree.
  */
 
 class BehaviorTracker {
@@ -163,68 +166,6 @@ class BehaviorTracker {
         });
     }
 
-    /**
-     * Calculate entropy score based on collected behavior data
-     */
-    calculateEntropyScore() {
-        // This is a simplified entropy calculation
-        // In a real implementation, this would be more sophisticated
-        
-        let score = 0.5; // Default neutral score
-        
-        // Mouse movement entropy
-        if (this.mouseMovements.length > 10) {
-            // Calculate variance in mouse movement speed and direction
-            const speeds = [];
-            const angles = [];
-            
-            for (let i = 1; i < this.mouseMovements.length; i++) {
-                const prev = this.mouseMovements[i-1];
-                const curr = this.mouseMovements[i];
-                
-                const dx = curr.x - prev.x;
-                const dy = curr.y - prev.y;
-                const dt = curr.timestamp - prev.timestamp;
-                
-                if (dt > 0) {
-                    const speed = Math.sqrt(dx*dx + dy*dy) / dt;
-                    speeds.push(speed);
-                    
-                    const angle = Math.atan2(dy, dx);
-                    angles.push(angle);
-                }
-            }
-            
-            // Calculate variance
-            if (speeds.length > 5) {
-                const avgSpeed = speeds.reduce((sum, val) => sum + val, 0) / speeds.length;
-                const speedVariance = speeds.reduce((sum, val) => sum + Math.pow(val - avgSpeed, 2), 0) / speeds.length;
-                
-                // Higher variance is more human-like (up to a point)
-                const speedScore = Math.min(1.0, speedVariance / 5000);
-                
-                // Direction changes
-                let directionChanges = 0;
-                for (let i = 1; i < angles.length; i++) {
-                    const angleDiff = Math.abs(angles[i] - angles[i-1]);
-                    if (angleDiff > 0.3) { // About 17 degrees
-                        directionChanges++;
-                    }
-                }
-                
-                const directionChangeRate = directionChanges / angles.length;
-                
-                // Direction changes should be in a "human" range
-                const directionScore = 1.0 - Math.abs(directionChangeRate - 0.3) * 2;
-                
-                // Combine scores
-                score = 0.7 * speedScore + 0.3 * Math.max(0, Math.min(1, directionScore));
-            }
-        }
-        
-        return score;
-    }
-
     /**
      * Get behavior data for submission
      */
@@ -234,8 +175,7 @@ class BehaviorTracker {
             keystroke_timings: this.keystrokes,
             scroll_events: this.scrollEvents,
             touch_events: this.touchEvents,
-            total_tracking_time_ms: Date.now() - this.startTime,
-            entropy_score: this.calculateEntropyScore()
+            total_tracking_time_ms: Date.now() - this.startTime
         };
     }
 }
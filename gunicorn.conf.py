@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for humanauth.
+
+Usage:
+    gunicorn -c gunicorn.conf.py humanauth.wsgi
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Load the application once in the master process and warm it up there
+# (see api.warmup), so workers fork with imports, challenge assets and
+# scorers already initialised and share that memory copy-on-write.
+preload_app = True
+os.environ.setdefault('HUMANAUTH_PREWARM', 'True')
@@ -19,6 +19,11 @@ django_asgi_app = get_asgi_application()
 
 # Import websocket routing after Django setup to avoid import issues
 from humanauth.routing import websocket_urlpatterns
+from django.conf import settings
+
+if settings.PREWARM:
+    from api.warmup import warm_up
+    warm_up()
 
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
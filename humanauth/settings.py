@@ -62,6 +62,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Over-limit clients are turned away before their body is read
+    'api.middleware.AdmissionControlMiddleware',
+    'api.middleware.RequestBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'humanauth.urls'
@@ -108,6 +111,31 @@ else:
         }
     }
 
+# Optional read replica for read-only endpoints and analytics commands: a
+# PostgreSQL standby when DB_REPLICA_HOST is set, or a second SQLite file
+# (DB_REPLICA_NAME) for local testing. Reads of a session stay on the
+# primary for PIN_SECONDS after the session was written.
+if os.environ.get('DB_REPLICA_HOST') and os.environ.get('DATABASE_URL'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ.get('DB_REPLICA_HOST'),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif os.environ.get('DB_REPLICA_NAME') and not os.environ.get('DATABASE_URL'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DB_REPLICA_NAME'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+
+DATABASE_REPLICA = {
+    'ALIAS': 'replica' if 'replica' in DATABASES else None,
+    'PIN_SECONDS': int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5)),
+}
+
 # Cache configuration
 CACHES = {
     'default': {
@@ -116,6 +144,57 @@ CACHES = {
     }
 }
 
+# Shared challenge-state store. Redis is used whenever REDIS_HOST is set so
+# that every worker process sees the same challenges; the local store only
+# works for a single process (tests, runserver).
+if os.environ.get('REDIS_HOST'):
+    CHALLENGE_STORE = {
+        'BACKEND': 'api.challenge_store.RedisChallengeStore',
+        'OPTIONS': {
+            'host': os.environ.get('REDIS_HOST'),
+            'port': int(os.environ.get('REDIS_PORT', 6379)),
+            'db': int(os.environ.get('REDIS_DB', 0)),
+            'password': os.environ.get('REDIS_PASSWORD') or None,
+            'max_connections': int(os.environ.get('REDIS_MAX_CONNECTIONS', 50)),
+        },
+    }
+else:
+    CHALLENGE_STORE = {
+        'BACKEND': 'api.challenge_store.LocalChallengeStore',
+    }
+
+# How long (in seconds) an issued challenge can be submitted
+CHALLENGE_TIMEOUT = int(os.environ.get('CHALLENGE_TIMEOUT', 3600))
+
+# Number of reverse proxies in front of the application that append the
+# address they received a request from to X-Forwarded-For. The client IP is
+# the hop added by the outermost of them; anything left of it is set by the
+# client and ignored. With 0 the header is ignored and REMOTE_ADDR is used.
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+
+# Token-bucket admission control for the challenge endpoints. Rates are
+# (tokens per second, burst capacity); buckets are kept in CHALLENGE_STORE.
+ADMISSION_CONTROL = {
+    'ENABLED': os.environ.get('ADMISSION_CONTROL_ENABLED', 'True') == 'True',
+    'ENDPOINTS': ['init-session', 'check-session', 'get-challenge', 'submit-challenge'],
+    'IP_RATE': (1.0, 30),
+    'SUBNET_RATE': (10.0, 300),
+    'FINGERPRINT_RATE': (0.5, 15),
+    'IPV4_SUBNET_PREFIX': 24,
+    'IPV6_SUBNET_PREFIX': 64,
+}
+
+# Passive trust score at or above which a session passes without a
+# challenge (risk-based frictionless pass). Set above 1 to always challenge.
+FRICTIONLESS_PASS_THRESHOLD = float(os.environ.get('FRICTIONLESS_PASS_THRESHOLD', 0.85))
+
+# Maximum number of session ids accepted by one batch trust-score request
+BATCH_TRUST_SCORE_MAX_SESSIONS = int(os.environ.get('BATCH_TRUST_SCORE_MAX_SESSIONS', 500))
+
+# How long (in seconds) session metadata stays cached after init-session.
+# The challenge endpoints only hit the database when this entry has expired.
+SESSION_METADATA_TIMEOUT = int(os.environ.get('SESSION_METADATA_TIMEOUT', 3600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -163,6 +242,167 @@ CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
 ]
 
+# Per-fingerprint challenge history used as a prior when scoring. Fingerprints
+# with at least MIN_ATTEMPTS attempts move the trust score PRIOR_WEIGHT of
+# the way towards their mean score. Lookups are cached per process.
+FINGERPRINT_REPUTATION = {
+    'PRIOR_WEIGHT': 0.2,
+    'MIN_ATTEMPTS': 3,
+    'CACHE_TTL': 60,
+    'CACHE_MAX_ENTRIES': 10000,
+}
+
+# Replay detection: submitted behavior traces go into rotating Bloom filters
+# in CHALLENGE_STORE covering the last WINDOW_SECONDS; a repeated trace loses
+# PENALTY from its trust score. With BITS per generation (2 MB) and HASHES,
+# false positives stay under 1 in 2000 up to a million traces per generation.
+REPLAY_DETECTION = {
+    'ENABLED': os.environ.get('REPLAY_DETECTION_ENABLED', 'True') == 'True',
+    'WINDOW_SECONDS': 3600,
+    'GENERATIONS': 4,
+    'BITS': 2 ** 24,
+    'HASHES': 7,
+    'MIN_MOUSE_EVENTS': 10,
+    'PENALTY': 0.5,
+}
+
+# Near-duplicate mouse paths: SimHash signatures of submitted paths are kept
+# in CHALLENGE_STORE bucket lists (BANDS per signature, per SLOT_SECONDS slot,
+# at most MAX_BUCKET each). A path with MIN_SIMILAR or more paths within
+# MAX_DISTANCE bits in the last WINDOW_SECONDS loses PENALTY from its score.
+TRAJECTORY_SIMILARITY = {
+    'ENABLED': os.environ.get('TRAJECTORY_SIMILARITY_ENABLED', 'True') == 'True',
+    'WINDOW_SECONDS': 3600,
+    'SLOT_SECONDS': 900,
+    'BANDS': 8,
+    'BAND_BITS': 8,
+    'MAX_BUCKET': 16,
+    'MAX_DISTANCE': 12,
+    'MIN_MOUSE_EVENTS': 10,
+    'MIN_SIMILAR': 10,
+    'PENALTY': 0.2,
+}
+
+# IP range reputation (hosting/VPN/proxy networks). `manage.py
+# build_ip_reputation` compiles the range files in SOURCES into INDEX_PATH,
+# which workers map and re-check every RELOAD_INTERVAL seconds. A session's
+# IP risk lowers its trust score by up to RISK_WEIGHT.
+IP_REPUTATION = {
+    'SOURCES': [os.path.join(BASE_DIR, 'data', 'ip_ranges')],
+    'INDEX_PATH': os.environ.get('IP_REPUTATION_INDEX', os.path.join(BASE_DIR, 'data', 'ip_reputation.idx')),
+    'RELOAD_INTERVAL': 30,
+    'RISK_WEIGHT': 0.3,
+}
+
+# Maximum number of events per behavior_data stream on submit. Larger
+# submissions are rejected by REQUEST_BUDGETS before parsing
+BEHAVIOR_STREAM_MAX_EVENTS = int(os.environ.get('BEHAVIOR_STREAM_MAX_EVENTS', 20000))
+
+# Per-endpoint request budgets, keyed by URL name. Requests over budget are
+# rejected with a 413 before their body is parsed.
+REQUEST_BUDGETS = {
+    'init-session': {
+        'MAX_BODY_BYTES': int(os.environ.get('INIT_SESSION_MAX_BODY_BYTES', 256 * 1024)),
+        'MAX_STREAM_EVENTS': BEHAVIOR_STREAM_MAX_EVENTS,
+    },
+    'check-session': {
+        'MAX_BODY_BYTES': int(os.environ.get('CHECK_SESSION_MAX_BODY_BYTES', 256 * 1024)),
+        'MAX_STREAM_EVENTS': BEHAVIOR_STREAM_MAX_EVENTS,
+    },
+    'submit-challenge': {
+        'MAX_BODY_BYTES': int(os.environ.get('SUBMIT_CHALLENGE_MAX_BODY_BYTES', 2 * 1024 * 1024)),
+        'MAX_STREAM_EVENTS': BEHAVIOR_STREAM_MAX_EVENTS,
+    },
+    'trust-scores': {
+        'MAX_BODY_BYTES': int(os.environ.get('TRUST_SCORES_MAX_BODY_BYTES', 64 * 1024)),
+    },
+}
+
+# Django REST Framework
+REST_FRAMEWORK = {
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Storage encoding of ChallengeLog.challenge_data/response_data (see api.codec).
+# COMPRESSION is 'zlib', 'zstd' (requires the zstandard package) or 'none';
+# strings of CONTENT_MIN_LENGTH characters or more in challenge_data are
+# stored once in the ChallengeContent table.
+CHALLENGE_LOG_CODEC = {
+    'COMPRESSION': os.environ.get('CHALLENGE_LOG_COMPRESSION', 'zlib'),
+    'MIN_COMPRESS_BYTES': 128,
+    'CONTENT_MIN_LENGTH': 48,
+}
+
+# Retention for ChallengeLog: rows older than RETENTION_DAYS are moved into
+# per-day compressed segment files under ROOT by `manage.py archive_challenge_logs`
+CHALLENGE_LOG_ARCHIVE = {
+    'ROOT': os.environ.get('CHALLENGE_LOG_ARCHIVE_ROOT', os.path.join(BASE_DIR, 'archive', 'challenge_logs')),
+    'RETENTION_DAYS': int(os.environ.get('CHALLENGE_LOG_RETENTION_DAYS', 30)),
+    'BATCH_SIZE': 5000,
+    'BLOCK_ROWS': 256,
+}
+
+# Expiry of UserSession rows (and their fingerprints) by `manage.py
+# cleanup_sessions`: sessions that never got a trust score after
+# UNSCORED_HOURS, scored sessions after SCORED_DAYS once their challenge logs
+# are archived, and reputation aggregates of fingerprints not seen for
+# REPUTATION_DAYS. Deletes run in batches of BATCH_SIZE rows, SLEEP_SECONDS apart.
+SESSION_CLEANUP = {
+    'UNSCORED_HOURS': int(os.environ.get('SESSION_UNSCORED_HOURS', 24)),
+    'SCORED_DAYS': int(os.environ.get('SESSION_SCORED_DAYS', 31)),
+    'REPUTATION_DAYS': int(os.environ.get('FINGERPRINT_REPUTATION_DAYS', 180)),
+    'BATCH_SIZE': 1000,
+    'SLEEP_SECONDS': 0.1,
+}
+
+# Backfill of the behavior feature vectors stored with challenge logs, for
+# logs from before they were stored or computed by an older extractor
+# version (`manage.py backfill_features`, and scripts/generate_dataset.py).
+FEATURE_BACKFILL = {
+    'BATCH_SIZE': 2000,
+    'SLEEP_SECONDS': 0.05,
+}
+
+# Versioned trust score models (see api.model_registry), registered by
+# scripts/scoring_model.py and published with `manage.py model_registry`.
+# Workers re-read the published versions every RELOAD_INTERVAL seconds. The
+# live model's human probability makes up MODEL_WEIGHT of the challenge
+# score; the shadow model is scored in a background thread (at most
+# SHADOW_QUEUE_SIZE attempts waiting) and compared with the live scorer in
+# logs under SHADOW_LOG_ROOT.
+MODEL_REGISTRY = {
+    'ROOT': os.environ.get('MODEL_REGISTRY_ROOT', os.path.join(BASE_DIR, 'models')),
+    'RELOAD_INTERVAL': 30,
+    'MODEL_WEIGHT': 0.5,
+    'SHADOW_LOG_ROOT': os.environ.get('SHADOW_LOG_ROOT', os.path.join(BASE_DIR, 'logs', 'shadow')),
+    'SHADOW_QUEUE_SIZE': 1000,
+}
+
+# Incremental columnar export of challenge history for analytics, written by
+# `manage.py export_challenge_logs` (requires pyarrow). Logs younger than
+# SETTLE_SECONDS are picked up by the next run.
+CHALLENGE_LOG_EXPORT = {
+    'ROOT': os.environ.get('CHALLENGE_LOG_EXPORT_ROOT', os.path.join(BASE_DIR, 'exports', 'challenge_logs')),
+    'BATCH_SIZE': 5000,
+    'SETTLE_SECONDS': 60,
+    'COMPRESSION': 'zstd',
+}
+
+# Warm-up before serving (see api.warmup). Enable when the application is
+# preloaded in a parent process, e.g. by gunicorn.conf.py.
+PREWARM = os.environ.get('HUMANAUTH_PREWARM', 'False') == 'True'
+
+# Extra dotted-path callables run by the warm-up
+WARMUP_HOOKS = []
+
 # Channels configuration
 ASGI_APPLICATION = 'humanauth.asgi.application'
 
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.PREWARM:
+    from api.warmup import warm_up
+    warm_up()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark behavior feature extraction on synthetic traces.
+
+Times extract_features() one trace at a time, as online scoring calls it,
+and extract_features_batch() in chunks, as dataset generation calls it.
+
+    python scripts/bench_features.py --traces 20000 --events 200
+"""
+import os
+import sys
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to the path so we can import Django settings
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
+
+import django
+django.setup()
+
+from api.challenge_logic.behavior import EventStream
+from api.challenge_logic.features import FEATURE_NAMES, extract_features, extract_features_batch
+
+
+def random_traces(count, events, seed=0):
+    """
+    Build behavior_data dicts with random-walk mouse paths and key presses,
+    as EventStreams like the request parser produces.
+    """
+    rng = np.random.default_rng(seed)
+    traces = []
+    for _ in range(count):
+        n = rng.integers(events // 2, events * 3 // 2)
+        mouse = EventStream(('x', 'y', 'timestamp'), n)
+        mouse.extend(np.column_stack((
+            np.cumsum(rng.normal(0, 5, n)),
+            np.cumsum(rng.normal(0, 5, n)),
+            np.cumsum(rng.integers(0, 30, n)),
+        )))
+        keys = EventStream(('timestamp',), n // 10)
+        keys.extend(np.cumsum(rng.integers(50, 400, n // 10)).reshape(-1, 1).astype(np.float64))
+        traces.append({'mouse_movements': mouse, 'keystroke_timings': keys})
+    return traces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--traces', type=int, default=5000, help='Number of traces')
+    parser.add_argument('--events', type=int, default=200, help='Average mouse events per trace')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Traces per batch')
+    args = parser.parse_args()
+
+    traces = random_traces(args.traces, args.events)
+    events = sum(len(trace['mouse_movements']) for trace in traces)
+    print(f"{len(traces)} traces, {events} mouse events, {len(FEATURE_NAMES)} features")
+
+    start = time.perf_counter()
+    for trace in traces:
+        extract_features(trace)
+    elapsed = time.perf_counter() - start
+    print(f"One at a time: {elapsed * 1000:.0f} ms, {elapsed / len(traces) * 1e6:.0f} us per trace")
+
+    start = time.perf_counter()
+    for offset in range(0, len(traces), args.batch_size):
+        extract_features_batch(traces[offset:offset + args.batch_size])
+    elapsed = time.perf_counter() - start
+    print(f"Batches of {args.batch_size}: {elapsed * 1000:.0f} ms, {len(traces) / elapsed:.0f} traces/s, "
+          f"{events / elapsed / 1e6:.1f}M events/s")
+
+
+if __name__ == "__main__":
+    main()
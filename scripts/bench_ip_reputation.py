@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Benchmark IP reputation lookups against a compiled range index.
+
+Builds an index from random IPv4 and IPv6 ranges in a temporary directory,
+then times get_ip_risk() for addresses inside and outside the ranges.
+
+    python scripts/bench_ip_reputation.py --ranges 100000
+"""
+import os
+import sys
+import argparse
+import ipaddress
+import random
+import tempfile
+import time
+from pathlib import Path
+
+# Add the project root to the path so we can import Django settings
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
+
+import django
+django.setup()
+
+from django.test.utils import override_settings
+
+from api.ip_reputation import build_index, get_ip_risk, reload_ip_index
+
+
+def write_ranges(path, count):
+    """
+    Write count random ranges, a tenth of them IPv6, to a source file.
+    """
+    with open(path, 'w') as f:
+        for _ in range(count):
+            risk = round(random.random(), 2)
+            if random.random() < 0.9:
+                prefix = random.randint(16, 28)
+                address = ipaddress.IPv4Address(random.getrandbits(32))
+                f.write(f"{ipaddress.ip_network(f'{address}/{prefix}', strict=False)}, {risk}\n")
+            else:
+                prefix = random.randint(32, 56)
+                address = ipaddress.IPv6Address(random.getrandbits(128))
+                f.write(f"{ipaddress.ip_network(f'{address}/{prefix}', strict=False)}, {risk}\n")
+
+
+def random_addresses(count):
+    addresses = [str(ipaddress.IPv4Address(random.getrandbits(32))) for _ in range(count)]
+    addresses += [str(ipaddress.IPv6Address(random.getrandbits(128))) for _ in range(count // 10)]
+    random.shuffle(addresses)
+    return addresses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ranges', type=int, default=10000, help='Number of source ranges')
+    parser.add_argument('--lookups', type=int, default=200000, help='Number of addresses to look up')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'ranges.txt')
+        index_path = os.path.join(directory, 'ip_reputation.idx')
+        write_ranges(source, args.ranges)
+
+        start = time.perf_counter()
+        v4, v6 = build_index([source], index_path)
+        print(f"Built {v4} IPv4 and {v6} IPv6 intervals from {args.ranges} ranges "
+              f"in {time.perf_counter() - start:.2f}s ({os.path.getsize(index_path) / 1024:.0f} KB)")
+
+        with override_settings(IP_REPUTATION={'SOURCES': [source], 'INDEX_PATH': index_path,
+                                              'RELOAD_INTERVAL': 30, 'RISK_WEIGHT': 0.3}):
+            reload_ip_index()
+            addresses = random_addresses(args.lookups)
+            get_ip_risk(addresses[0])
+
+            start = time.perf_counter()
+            hits = sum(1 for address in addresses if get_ip_risk(address))
+            elapsed = time.perf_counter() - start
+
+        print(f"{len(addresses)} lookups in {elapsed * 1000:.1f} ms: "
+              f"{elapsed / len(addresses) * 1e9:.0f} ns per lookup, {hits} in a listed range")
+        reload_ip_index()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Benchmark request parsing and validation time for submit-challenge bodies.
+
+Compares DRF's stdlib JSONParser + JSONField against the api app's
+FastJSONParser + JSONObjectField for increasingly large behavior_data, and
+the submit-path BehaviorJSONParser that decodes event arrays into columns.
+"""
+import os
+import sys
+import io
+import json
+import random
+import time
+from pathlib import Path
+
+# Add the project root to the path so we can import Django settings
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
+
+import django
+django.setup()
+
+from rest_framework import serializers
+from rest_framework.parsers import JSONParser
+
+from api.parsers import BehaviorJSONParser, FastJSONParser, orjson
+from api.serializers import ChallengeResponseSerializer
+
+
+class StdlibChallengeResponseSerializer(serializers.Serializer):
+    session_id = serializers.UUIDField()
+    challenge_type = serializers.CharField()
+    response_data = serializers.JSONField()
+    behavior_data = serializers.JSONField()
+    time_taken_ms = serializers.IntegerField(required=False)
+
+
+def build_payload(num_events):
+    """
+    Build a submit-challenge body with num_events mouse movements.
+    """
+    start = 1620000000000
+    mouse_movements = [
+        {'x': random.randint(0, 1920), 'y': random.randint(0, 1080), 'timestamp': start + i * 16}
+        for i in range(num_events)
+    ]
+    keystroke_timings = [{'timestamp': start + i * 120} for i in range(num_events // 20)]
+    body = {
+        'session_id': '550e8400-e29b-41d4-a716-446655440000',
+        'challenge_type': 'drag-align',
+        'response_data': {'positions': {'shape-0': {'x': 250, 'y': 200}}},
+        'behavior_data': {
+            'mouse_movements': mouse_movements,
+            'keystroke_timings': keystroke_timings,
+            'scroll_events': [],
+            'touch_events': [],
+            'total_tracking_time_ms': num_events * 16,
+            'entropy_score': 0.5,
+        },
+        'time_taken_ms': 5000,
+    }
+    return json.dumps(body).encode()
+
+
+def time_it(func, repeat):
+    """
+    Return the best wall-clock time of func over repeat runs, in milliseconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_benchmark(sizes=(100, 1000, 10000, 50000), repeat=5):
+    print(f"orjson available: {orjson is not None}")
+    print(f"{'events':>8} {'KB':>8} {'parse std':>10} {'parse fast':>11} {'parse stream':>13} "
+          f"{'valid std':>10} {'valid fast':>11}  (ms, best of {repeat})")
+
+    for size in sizes:
+        raw = build_payload(size)
+        parsed = json.loads(raw)
+
+        parse_std = time_it(lambda: JSONParser().parse(io.BytesIO(raw)), repeat)
+        parse_fast = time_it(lambda: FastJSONParser().parse(io.BytesIO(raw)), repeat)
+        parse_stream = time_it(lambda: BehaviorJSONParser().parse(io.BytesIO(raw)), repeat)
+        valid_std = time_it(
+            lambda: StdlibChallengeResponseSerializer(data=parsed).is_valid(raise_exception=True), repeat
+        )
+        valid_fast = time_it(
+            lambda: ChallengeResponseSerializer(data=parsed).is_valid(raise_exception=True), repeat
+        )
+
+        print(f"{size:>8} {len(raw) / 1024:>8.1f} {parse_std:>10.2f} {parse_fast:>11.2f} {parse_stream:>13.2f} "
+              f"{valid_std:>10.2f} {valid_fast:>11.2f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+Benchmark the read queries that run against ChallengeLog and UserSession.
+
+Seeds a throwaway test database with synthetic sessions and challenge logs
+spread over the last --days days, then times each query and prints its plan,
+first with the query indexes from migration 0002 dropped and then with them
+in place.
+
+    python scripts/bench_queries.py --sessions 1000000 --logs-per-session 2
+"""
+import os
+import sys
+import argparse
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+# Add the project root to the path so we can import Django settings
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+
+from api.challenge_logic.generator import ChallengeGenerator
+from api.models import ChallengeLog, UserSession
+
+
+@contextmanager
+def explicit_created_at(*models):
+    """
+    Let bulk_create keep the created_at values we set instead of now().
+    """
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def seed(num_sessions, logs_per_session, days, batch_size=10000):
+    """
+    Insert num_sessions sessions with logs_per_session challenge logs each.
+
+    Returns:
+        dict: A fingerprint id and an IP address that exist in the data
+    """
+    now = timezone.now()
+    span = days * 86400
+    fingerprints = [uuid.uuid4().hex for _ in range(max(1, num_sessions // 5))]
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(max(1, num_sessions // 20))]
+
+    with explicit_created_at(UserSession, ChallengeLog):
+        for offset in range(0, num_sessions, batch_size):
+            sessions = []
+            logs = []
+            for _ in range(min(batch_size, num_sessions - offset)):
+                created_at = now - timedelta(seconds=random.randint(0, span))
+                # About a third of sessions never finish a challenge
+                scored = random.random() > 0.3
+                session = UserSession(
+                    id=uuid.uuid4(),
+                    fingerprint_id=random.choice(fingerprints),
+                    ip_address=random.choice(ips),
+                    trust_score=random.random() if scored else None,
+                    created_at=created_at,
+                )
+                sessions.append(session)
+
+                for i in range(logs_per_session if scored else 0):
+                    logs.append(ChallengeLog(
+                        session_id=session.id,
+                        challenge_type=random.choice(ChallengeGenerator.CHALLENGE_TYPES),
+                        challenge_data={},
+                        response_data={},
+                        # Most attempts pass; failures are the minority
+                        passed=random.random() > 0.2,
+                        time_taken_ms=random.randint(1000, 20000),
+                        created_at=created_at + timedelta(seconds=30 * i),
+                    ))
+
+            with transaction.atomic():
+                UserSession.objects.bulk_create(sessions)
+                ChallengeLog.objects.bulk_create(logs)
+
+    return {'fingerprint_id': fingerprints[0], 'ip_address': ips[0]}
+
+
+def build_queries(sample):
+    """
+    Return (name, callable) pairs for the queries the indexes are meant for.
+    """
+    now = timezone.now()
+    last_day = now - timedelta(days=1)
+    expired = now - timedelta(days=7)
+
+    return [
+        ('logs in last day', lambda: ChallengeLog.objects.filter(created_at__gte=last_day).count()),
+        ('logs per type, last day', lambda: ChallengeLog.objects.filter(
+            challenge_type='drag-align', created_at__gte=last_day).count()),
+        ('failed logs, last day', lambda: ChallengeLog.objects.filter(
+            passed=False, created_at__gte=last_day).count()),
+        ('sessions for fingerprint', lambda: list(UserSession.objects.filter(
+            fingerprint_id=sample['fingerprint_id']).order_by('-created_at').values('id')[:20])),
+        ('sessions for IP', lambda: list(UserSession.objects.filter(
+            ip_address=sample['ip_address']).order_by('-created_at').values('id')[:20])),
+        ('expired unscored sessions', lambda: list(UserSession.objects.filter(
+            trust_score__isnull=True, created_at__lt=expired).order_by('created_at').values('id')[:1000])),
+    ]
+
+
+def query_plan(func):
+    """
+    Return the database's plan for the last query func runs.
+    """
+    captured = []
+
+    def capture(execute, sql, params, many, context):
+        captured.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(capture):
+        func()
+    sql, params = captured[-1]
+
+    explain = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f"{explain} {sql}", params)
+        return ' / '.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def time_it(func, repeat):
+    """
+    Return the best wall-clock time of func over repeat runs, in milliseconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def set_indexes(enabled):
+    """
+    Create or drop the Meta indexes of ChallengeLog and UserSession.
+    """
+    with connection.schema_editor() as editor:
+        for model in (ChallengeLog, UserSession):
+            for index in model._meta.indexes:
+                if enabled:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def run_benchmark(num_sessions, logs_per_session, days, repeat):
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+    start = time.perf_counter()
+    sample = seed(num_sessions, logs_per_session, days)
+    print(f"Seeded {UserSession.objects.count()} sessions and {ChallengeLog.objects.count()} "
+          f"challenge logs in {time.perf_counter() - start:.1f}s ({connection.vendor})")
+
+    queries = build_queries(sample)
+    results = {}
+    for label, enabled in (('without indexes', False), ('with indexes', True)):
+        set_indexes(enabled)
+        print(f"\n{label}:")
+        for name, func in queries:
+            elapsed = time_it(func, repeat)
+            results.setdefault(name, []).append(elapsed)
+            print(f"  {name:<28} {elapsed:9.2f}ms   {query_plan(func)}")
+
+    print(f"\n{'query':<28} {'before':>10} {'after':>10} {'speedup':>8}  (ms, best of {repeat})")
+    for name, (before, after) in results.items():
+        print(f"{name:<28} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000000)
+    parser.add_argument('--logs-per-session', type=int, default=2)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run_benchmark(args.sessions, args.logs_per_session, args.days, args.repeat)
@@ -1,14 +1,29 @@
 #!/usr/bin/env python
 """
 Script to generate datasets for machine learning model training.
+
+Challenge logs are read from the database in chunks paged by id, joined with
+their session and fingerprint in the same query. Behavior features are read from
+the vectors stored with each log at submit time; logs without a vector of the
+current extractor version have theirs computed in a pool of worker processes
+and stored back (unless --no-backfill), so the next run can read them. Each
+chunk is appended to the output file as it completes, so memory use does not
+grow with the number of logs.
+
+    python scripts/generate_dataset.py --chunk-size 20000 --workers 8
 """
 import os
 import sys
-import json
-import random
-import pandas as pd
+import argparse
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # Add the project root to the path so we can import Django settings
 sys.path.append(str(Path(__file__).resolve().parent.parent))
@@ -17,126 +32,205 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
 import django
 django.setup()
 
-from api.models import UserSession, ChallengeLog
+from django.conf import settings
+
+from api.challenge_logic.features import FEATURE_NAMES, FEATURE_VERSION
+from api.feature_store import log_features, save_features, stale_response_raw
+from api.models import ChallengeLog
+from api.routers import use_replica
+
+
+# Log fields read by the query; the session and fingerprint are joined in
+LOG_FIELDS = {
+    'id': 'id',
+    'session_id': 'session_id',
+    'challenge_type': 'challenge_type',
+    'passed': 'passed',
+    'time_taken_ms': 'time_taken_ms',
+    'created_at': 'created_at',
+    'trust_score': 'session__trust_score',
+    'browser': 'session__fingerprint__browser',
+    'os': 'session__fingerprint__os',
+    'headless': 'session__fingerprint__headless',
+    'entropy_score': 'session__fingerprint__entropy_score',
+    'features': 'features',
+    'feature_version': 'feature_version',
+    'response_raw': 'response_raw',
+}
+
+# Behavior features come from the extractor shared with online scoring, so
+# training and serving see the same values
+SCHEMA = pa.schema(
+    [
+        ('session_id', pa.string()),
+        ('challenge_type', pa.string()),
+        ('passed', pa.bool_()),
+        ('time_taken_ms', pa.int32()),
+        ('trust_score', pa.float64()),
+        ('created_at', pa.string()),
+        ('browser', pa.string()),
+        ('os', pa.string()),
+        ('headless', pa.bool_()),
+        ('entropy_score', pa.float64()),
+    ] + [(name, pa.float32()) for name in FEATURE_NAMES],
+    metadata={'feature_version': str(FEATURE_VERSION)},
+)
+
+
+def extract_chunk(rows):
+    """
+    Compute the dataset columns for a chunk of log rows.
+
+    Runs in a worker process. Stored feature vectors are used as they are;
+    stale ones are recomputed in one vectorized batch and returned, as
+    (log id, vector) pairs, for the caller to store.
+    """
+    features, recomputed = log_features(rows)
+
+    columns = {
+        'session_id': [str(row['session_id']) for row in rows],
+        'challenge_type': [row['challenge_type'] for row in rows],
+        'passed': [row['passed'] for row in rows],
+        'time_taken_ms': [row['time_taken_ms'] for row in rows],
+        'trust_score': [0.5 if row['trust_score'] is None else row['trust_score'] for row in rows],
+        'created_at': [row['created_at'].isoformat() for row in rows],
+        'browser': [row['browser'] for row in rows],
+        'os': [row['os'] for row in rows],
+        'headless': [row['headless'] for row in rows],
+        'entropy_score': [row['entropy_score'] for row in rows],
+    }
+    for index, name in enumerate(FEATURE_NAMES):
+        columns[name] = features[:, index]
+
+    return pa.table(columns, schema=SCHEMA), [(rows[index]['id'], vector) for index, vector in recomputed]
+
+
+def iter_chunks(chunk_size):
+    """
+    Yield lists of log rows, in id order, one query per chunk.
+
+    The session and fingerprint come from the same query through a join.
+    response_data is only read for logs without a current feature vector,
+    and undecoded, so workers can decode the behavior streams straight into
+    arrays. Chunks are paged by id rather than read from one open cursor,
+    so recomputed vectors can be stored between chunks on the same
+    connection (SQLite does not isolate queries on one connection).
+    """
+    queryset = (
+        ChallengeLog.objects.order_by('id')
+        .annotate(response_raw=stale_response_raw())
+        .values(*LOG_FIELDS.values())
+    )
+    last_id = 0
+    while True:
+        chunk = []
+        for row in queryset.filter(id__gt=last_id)[:chunk_size]:
+            row = {name: row[field] for name, field in LOG_FIELDS.items()}
+            # Some backends (PostgreSQL) return binary columns as memoryviews,
+            # which cannot be sent to worker processes
+            for name in ('features', 'response_raw'):
+                if row[name] is not None:
+                    row[name] = bytes(row[name])
+            chunk.append(row)
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]['id']
+
 
+class DatasetWriter:
+    """
+    Appends tables to a Parquet file (one row group each) or an Arrow IPC file.
+    """
+
+    def __init__(self, path, file_format):
+        self.path = path
+        if file_format == 'parquet':
+            self._writer = pq.ParquetWriter(path, SCHEMA, compression='zstd')
+        else:
+            self._writer = pa.ipc.new_file(path, SCHEMA)
+
+    def write(self, table):
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
 
-def generate_dataset():
+
+def generate_dataset(chunk_size=20000, workers=None, file_format='parquet', backfill=True, output_dir=None):
     """
     Generate a dataset from challenge logs for ML training.
+
+    With ``backfill``, feature vectors recomputed for stale logs are stored
+    on the logs.
+
+    Returns:
+        Path: The dataset file, or None if there are no challenge logs
     """
-    # Get all challenge logs
-    challenge_logs = ChallengeLog.objects.all().select_related('session')
-    
-    if not challenge_logs:
-        print("No challenge logs found in the database.")
-        return
-    
-    # Prepare data for DataFrame
-    data = []
-    for log in challenge_logs:
-        # Extract behavior data if available
-        behavior_data = log.response_data.get('behavior_data', {})
-        
-        # Basic features
-        row = {
-            'session_id': str(log.session.id),
-            'challenge_type': log.challenge_type,
-            'passed': log.passed,
-            'time_taken_ms': log.time_taken_ms,
-            'trust_score': log.session.trust_score or 0.5,
-            'created_at': log.created_at.isoformat(),
-        }
-        
-        # Add browser fingerprint data if available
-        try:
-            fingerprint = log.session.fingerprint
-            row.update({
-                'browser': fingerprint.browser,
-                'os': fingerprint.os,
-                'headless': fingerprint.headless,
-                'entropy_score': fingerprint.entropy_score,
-            })
-        except:
-            pass
-        
-        # Add mouse movement features if available
-        mouse_movements = behavior_data.get('mouse_movements', [])
-        if mouse_movements:
-            # Calculate movement statistics
-            speeds = []
-            angles = []
-            for i in range(1, len(mouse_movements)):
-                prev = mouse_movements[i-1]
-                curr = mouse_movements[i]
-                
-                dx = curr['x'] - prev['x']
-                dy = curr['y'] - prev['y']
-                dt = curr['timestamp'] - prev['timestamp']
-                
-                if dt > 0:
-                    speed = (dx**2 + dy**2)**0.5 / dt
-                    speeds.append(speed)
-                
-                # Calculate angle
-                import math
-                angle = math.atan2(dy, dx)
-                angles.append(angle)
-            
-            if speeds:
-                row.update({
-                    'mouse_speed_mean': sum(speeds) / len(speeds),
-                    'mouse_speed_std': pd.Series(speeds).std() if len(speeds) > 1 else 0,
-                    'mouse_speed_max': max(speeds),
-                    'mouse_movements_count': len(mouse_movements),
-                })
-            
-            if angles and len(angles) > 1:
-                # Calculate angle changes
-                angle_changes = []
-                for i in range(1, len(angles)):
-                    change = abs(angles[i] - angles[i-1])
-                    if change > math.pi:
-                        change = 2 * math.pi - change
-                    angle_changes.append(change)
-                
-                row.update({
-                    'mouse_angle_change_mean': sum(angle_changes) / len(angle_changes),
-                    'mouse_angle_change_std': pd.Series(angle_changes).std(),
-                    'mouse_angle_change_max': max(angle_changes),
-                })
-        
-        # Add keystroke features if available
-        keystroke_timings = behavior_data.get('keystroke_timings', [])
-        if keystroke_timings and len(keystroke_timings) > 1:
-            intervals = []
-            for i in range(1, len(keystroke_timings)):
-                interval = keystroke_timings[i]['timestamp'] - keystroke_timings[i-1]['timestamp']
-                intervals.append(interval)
-            
-            row.update({
-                'keystroke_interval_mean': sum(intervals) / len(intervals),
-                'keystroke_interval_std': pd.Series(intervals).std(),
-                'keystroke_count': len(keystroke_timings),
-            })
-        
-        data.append(row)
-    
-    # Create DataFrame
-    df = pd.DataFrame(data)
-    
-    # Save to CSV
-    output_dir = Path(settings.BASE_DIR) / 'scripts' / 'datasets'
+    output_dir = Path(output_dir or Path(settings.BASE_DIR) / 'scripts' / 'datasets')
     output_dir.mkdir(exist_ok=True, parents=True)
-    
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    output_file = output_dir / f"challenge_dataset_{timestamp}.csv"
-    
-    df.to_csv(output_file, index=False)
+    suffix = 'parquet' if file_format == 'parquet' else 'arrow'
+    output_file = output_dir / f"challenge_dataset_{timestamp}.{suffix}"
+    tmp_file = output_file.with_suffix('.tmp')
+
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    total = stale = 0
+    writer = DatasetWriter(tmp_file, file_format)
+
+    def write(future):
+        nonlocal total, stale
+        table, recomputed = future.result()
+        writer.write(table)
+        if backfill and recomputed:
+            save_features(recomputed)
+        total += table.num_rows
+        stale += len(recomputed)
+        print(f"  {total} records, {stale} with recomputed features ({total / (time.perf_counter() - start):.0f}/s)")
+
+    try:
+        # Spawned workers do not inherit the database connection; at most
+        # two chunks per worker are in flight, which bounds memory
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            pending = deque()
+            for chunk in iter_chunks(chunk_size):
+                pending.append(pool.submit(extract_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft())
+            while pending:
+                write(pending.popleft())
+    finally:
+        writer.close()
+
+    if not total:
+        tmp_file.unlink()
+        print("No challenge logs found in the database.")
+        return None
+
+    os.replace(tmp_file, output_file)
     print(f"Dataset saved to {output_file}")
-    print(f"Total records: {len(df)}")
+    print(f"Total records: {total} ({stale} with recomputed features{', stored' if backfill and stale else ''})")
+    return output_file
 
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description='Generate a training dataset from challenge logs.')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='Logs per chunk')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet', help='Output file format')
+    parser.add_argument('--no-backfill', action='store_true',
+                        help='Do not store feature vectors recomputed for stale logs')
+    args = parser.parse_args()
+
     print("Generating dataset from challenge logs...")
-    generate_dataset()
+    # Read from the replica when one is configured, to keep load off the primary
+    with use_replica():
+        generate_dataset(chunk_size=args.chunk_size, workers=args.workers, file_format=args.format,
+                         backfill=not args.no_backfill)
     print("Done!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,37 @@
 #!/usr/bin/env python
 """
 Prototype for a machine learning model to score user behavior.
+
+Three training modes:
+
+    full         load the dataset's model columns and fit a random forest
+    reservoir    stream the dataset, keep a stratified reservoir sample of at
+                 most --sample-size rows per class, and fit a random forest
+    incremental  stream the dataset --epochs times through an SGD logistic
+                 regression with partial_fit, never holding more than a batch
+
+The streaming modes hold out a stratified reservoir sample of --test-size of
+the rows for evaluation, so memory stays bounded whatever the dataset size.
+Random forests use every core. Each run reports training throughput and the
+process's peak memory, and registers the model as a new version in the model
+registry (api.model_registry), optionally publishing it with --publish.
+
+    python scripts/scoring_model.py --mode incremental --batch-size 100000
 """
 import os
 import sys
+import argparse
 import json
+import resource
+import time
 import numpy as np
 import pandas as pd
 from pathlib import Path
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, confusion_matrix
-from sklearn.preprocessing import StandardScaler
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, roc_auc_score
+from sklearn.preprocessing import FunctionTransformer, StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 
@@ -22,106 +42,400 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
 import django
 django.setup()
 
+from django.conf import settings
+
+from api.challenge_logic.features import FEATURE_VERSION
+from api.model_registry import MODEL_COLUMNS, ModelRegistry
+
+TARGET = 'passed'
+CLASSES = np.array([False, True])
+
+
+def _check_feature_version(metadata):
+    version = (metadata or {}).get(b'feature_version')
+    if version is not None and int(version) != FEATURE_VERSION:
+        raise ValueError(f"Dataset has feature version {int(version)}, expected {FEATURE_VERSION}")
+
+
+def load_dataset(dataset_path, columns=None):
+    """
+    Load a dataset written by generate_dataset.py as a DataFrame, optionally
+    only some of its columns.
+
+    Raises:
+        ValueError: If a Parquet or Arrow dataset was written with another
+        feature extractor version
+    """
+    suffix = Path(dataset_path).suffix
+    if suffix == '.csv':
+        return pd.read_csv(dataset_path, usecols=(lambda name: name in columns) if columns else None)
+
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(dataset_path)
+        _check_feature_version(schema.metadata)
+        columns = [name for name in columns if name in schema.names] if columns else None
+        return pq.read_table(dataset_path, columns=columns).to_pandas()
+
+    import pyarrow as pa
+    with pa.memory_map(str(dataset_path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    _check_feature_version(table.schema.metadata)
+    if columns:
+        table = table.select([name for name in columns if name in table.schema.names])
+    return table.to_pandas()
+
+
+def iter_dataset(dataset_path, batch_size, columns):
+    """
+    Yield a dataset in DataFrames of at most ``batch_size`` rows, reading
+    only ``columns`` (those the dataset has).
+    """
+    suffix = Path(dataset_path).suffix
+    if suffix == '.csv':
+        yield from pd.read_csv(dataset_path, chunksize=batch_size, usecols=lambda name: name in columns)
+        return
+
+    import pyarrow as pa
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(dataset_path)
+        schema = parquet_file.schema_arrow
+        _check_feature_version(schema.metadata)
+        batches = parquet_file.iter_batches(
+            batch_size=batch_size, columns=[name for name in columns if name in schema.names]
+        )
+        for batch in batches:
+            yield batch.to_pandas()
+        return
+
+    with pa.memory_map(str(dataset_path)) as source:
+        reader = pa.ipc.open_file(source)
+        _check_feature_version(reader.schema.metadata)
+        names = [name for name in columns if name in reader.schema.names]
+        for index in range(reader.num_record_batches):
+            table = pa.Table.from_batches([reader.get_batch(index)]).select(names)
+            for batch in table.to_batches(max_chunksize=batch_size):
+                yield batch.to_pandas()
+
+
+def _split_target(frame, feature_columns):
+    frame = frame.dropna(subset=[TARGET])
+    return frame[feature_columns].astype(np.float64), frame[TARGET].to_numpy(dtype=bool)
+
+
+class StratifiedReservoir:
+    """
+    Uniform random sample of at most ``capacity`` rows per class from a
+    stream of batches (Algorithm R, applied a batch at a time).
+    """
+
+    def __init__(self, capacity, columns, seed=42):
+        self.capacity = capacity
+        self.columns = list(columns)
+        self.rng = np.random.default_rng(seed)
+        self.rows = {label: np.empty((0, len(self.columns))) for label in CLASSES}
+        self.seen = dict.fromkeys(CLASSES, 0)
+
+    def add(self, X, y):
+        values = np.asarray(X, dtype=np.float64)
+        for label in CLASSES:
+            rows = values[y == label]
+            kept = self.rows[label]
+
+            # Fill up first
+            room = self.capacity - len(kept)
+            if room > 0:
+                kept = self.rows[label] = np.concatenate((kept, rows[:room]))
+                self.seen[label] += min(room, len(rows))
+                rows = rows[room:]
+            if not len(rows):
+                continue
+
+            # Row number t (1-based) replaces a random slot with probability
+            # capacity / t; later rows win, as if added one at a time
+            positions = self.seen[label] + 1 + np.arange(len(rows))
+            slots = (self.rng.random(len(rows)) * positions).astype(np.int64)
+            replace = slots < self.capacity
+            kept[slots[replace]] = rows[replace]
+            self.seen[label] += len(rows)
+
+    def sample(self):
+        """
+        Return the sampled rows as (X DataFrame, y array).
+        """
+        X = np.concatenate([self.rows[label] for label in CLASSES])
+        y = np.concatenate([np.full(len(self.rows[label]), label) for label in CLASSES])
+        return pd.DataFrame(X, columns=self.columns), y
 
-def train_scoring_model(dataset_path):
+
+def _peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _stream_with_holdout(dataset_path, batch_size, feature_columns, test_size, holdout):
+    """
+    Yield (X, y) training batches, diverting a random ``test_size`` share of
+    the rows into the ``holdout`` reservoir.
+    """
+    rng = np.random.default_rng(42)
+    for frame in iter_dataset(dataset_path, batch_size, feature_columns + [TARGET]):
+        X, y = _split_target(frame, feature_columns)
+        test = rng.random(len(y)) < test_size
+        if holdout is not None:
+            holdout.add(X[test], y[test])
+        yield X[~test], y[~test]
+
+
+def evaluate(pipeline, X_test, y_test, feature_columns):
+    """
+    Print the classification report, confusion matrix and feature ranking.
+
+    Returns:
+        dict: Metrics on the test rows, kept with the model in the registry
+    """
+    print("Evaluating model...")
+    y_pred = pipeline.predict(X_test)
+    metrics = {'test_rows': len(y_test), 'accuracy': float(accuracy_score(y_test, y_pred))}
+    if len(np.unique(y_test)) == 2:
+        metrics['roc_auc'] = float(roc_auc_score(y_test, pipeline.predict_proba(X_test)[:, 1]))
+
+    print("\nClassification Report:")
+    print(classification_report(y_test, y_pred))
+
+    print("\nConfusion Matrix:")
+    print(confusion_matrix(y_test, y_pred))
+
+    # Feature importance
+    classifier = pipeline['classifier']
+    if hasattr(classifier, 'feature_importances_'):
+        importances = classifier.feature_importances_
+    elif hasattr(classifier, 'coef_'):
+        # Inputs are standardized, so coefficient sizes are comparable
+        importances = np.abs(classifier.coef_[0])
+    else:
+        return metrics
+    indices = np.argsort(importances)[::-1]
+
+    print("\nFeature Ranking:")
+    for i, idx in enumerate(indices):
+        if i < len(feature_columns):
+            print(f"{i+1}. {feature_columns[idx]} ({importances[idx]:.4f})")
+    return metrics
+
+
+def save_model(pipeline, feature_columns, publish=None, **metadata):
+    """
+    Register the model as a new version in the model registry, with the
+    feature version and columns it was trained on, and optionally publish it
+    as 'live' or 'shadow'.
+    """
+    registry = ModelRegistry()
+    version = registry.register(pipeline, feature_columns, **metadata)
+    print(f"\nModel registered as version {version} in {registry.root}")
+    if publish:
+        registry.publish(publish, version)
+        print(f"Published as {publish}")
+    return version
+
+
+def _report_training(rows, elapsed):
+    rate = rows / elapsed if elapsed else 0
+    print(f"Trained on {rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s), "
+          f"peak memory {_peak_memory_mb():.0f} MB")
+
+
+def _forest_pipeline():
+    return Pipeline([
+        ('imputer', SimpleImputer(strategy='mean')),  # Handle missing values
+        ('scaler', StandardScaler()),  # Standardize features
+        # Trees are built in parallel on every core
+        ('classifier', RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1))
+    ])
+
+
+def _dataset_columns(dataset_path):
+    """
+    Return the model columns the dataset has.
+    """
+    frame = next(iter_dataset(dataset_path, 1, list(MODEL_COLUMNS)), None)
+    return [] if frame is None else [name for name in MODEL_COLUMNS if name in frame.columns]
+
+
+def train_scoring_model(dataset_path, publish=None):
     """
     Train a machine learning model to predict if a session is human or bot.
     """
-    # Load dataset
-    df = pd.read_csv(dataset_path)
-    
+    # Load only the columns the model uses
+    df = load_dataset(dataset_path, columns=list(MODEL_COLUMNS) + [TARGET])
+
     if df.empty:
         print("Dataset is empty.")
         return
-    
+
     print(f"Loaded dataset with {len(df)} records.")
-    
-    # Feature selection
-    feature_columns = [
-        'time_taken_ms', 'entropy_score', 
-        'mouse_speed_mean', 'mouse_speed_std', 'mouse_speed_max', 'mouse_movements_count',
-        'mouse_angle_change_mean', 'mouse_angle_change_std', 'mouse_angle_change_max',
-        'keystroke_interval_mean', 'keystroke_interval_std', 'keystroke_count'
-    ]
-    
-    # Filter to only include columns that exist in the dataset
-    feature_columns = [col for col in feature_columns if col in df.columns]
-    
+
+    # Feature selection: the model columns that exist in the dataset
+    feature_columns = [col for col in MODEL_COLUMNS if col in df.columns]
+
     if not feature_columns:
         print("No valid feature columns found in dataset.")
         return
-    
-    # Target variable
-    target = 'passed'
-    
+
     # Drop rows with missing target
-    df = df.dropna(subset=[target])
-    
+    df = df.dropna(subset=[TARGET])
+
     # Prepare features and target
     X = df[feature_columns]
-    y = df[target]
-    
+    y = df[TARGET]
+
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
-    
+
     # Create pipeline with preprocessing and model
-    pipeline = Pipeline([
-        ('imputer', SimpleImputer(strategy='mean')),  # Handle missing values
-        ('scaler', StandardScaler()),  # Standardize features
-        ('classifier', RandomForestClassifier(n_estimators=100, random_state=42))
-    ])
-    
+    pipeline = _forest_pipeline()
+
     # Train model
     print("Training model...")
+    start = time.perf_counter()
     pipeline.fit(X_train, y_train)
-    
-    # Evaluate model
-    print("Evaluating model...")
-    y_pred = pipeline.predict(X_test)
-    
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred))
-    
-    print("\nConfusion Matrix:")
-    print(confusion_matrix(y_test, y_pred))
-    
-    # Feature importance
-    if hasattr(pipeline['classifier'], 'feature_importances_'):
-        importances = pipeline['classifier'].feature_importances_
-        indices = np.argsort(importances)[::-1]
-        
-        print("\nFeature Ranking:")
-        for i, idx in enumerate(indices):
-            if i < len(feature_columns):
-                print(f"{i+1}. {feature_columns[idx]} ({importances[idx]:.4f})")
-    
-    # Save model
-    from joblib import dump
-    output_dir = Path(settings.BASE_DIR) / 'scripts' / 'models'
-    output_dir.mkdir(exist_ok=True, parents=True)
-    
-    model_path = output_dir / 'trust_score_model.joblib'
-    dump(pipeline, model_path)
-    print(f"\nModel saved to {model_path}")
+    _report_training(len(X_train), time.perf_counter() - start)
 
+    metrics = evaluate(pipeline, X_test, y_test, feature_columns)
+    save_model(pipeline, feature_columns, publish, mode='full', dataset=str(dataset_path),
+               training_rows=len(X_train), metrics=metrics)
+
+
+def train_subsampled_model(dataset_path, batch_size=100000, sample_size=500000, test_size=0.3, publish=None):
+    """
+    Train a random forest on a stratified reservoir sample of a dataset
+    streamed in batches, holding at most ``sample_size`` rows per class.
+    """
+    feature_columns = _dataset_columns(dataset_path)
+    if not feature_columns:
+        print("No valid feature columns found in dataset.")
+        return
+
+    print("Sampling dataset...")
+    start = time.perf_counter()
+    sample = StratifiedReservoir(sample_size, feature_columns)
+    holdout = StratifiedReservoir(max(1, int(sample_size * test_size)), feature_columns, seed=7)
+    rows = 0
+    for X, y in _stream_with_holdout(dataset_path, batch_size, feature_columns, test_size, holdout):
+        sample.add(X, y)
+        rows += len(y)
+    print(f"Read {rows} training rows in {time.perf_counter() - start:.1f}s; "
+          f"sampled {len(sample.rows[False])} failed and {len(sample.rows[True])} passed")
+
+    X_train, y_train = sample.sample()
+    X_test, y_test = holdout.sample()
+    if not len(y_train) or len(np.unique(y_train)) < 2:
+        print("Dataset needs both passed and failed attempts.")
+        return
+
+    print("Training model...")
+    pipeline = _forest_pipeline()
+    start = time.perf_counter()
+    pipeline.fit(X_train, y_train)
+    _report_training(len(y_train), time.perf_counter() - start)
+
+    metrics = evaluate(pipeline, X_test, y_test, feature_columns)
+    save_model(pipeline, feature_columns, publish, mode='reservoir', dataset=str(dataset_path),
+               training_rows=len(y_train), metrics=metrics)
+
+
+def train_incremental_model(dataset_path, batch_size=100000, epochs=3, test_size=0.3, holdout_size=500000,
+                            publish=None):
+    """
+    Train a logistic regression with SGD, streaming the dataset in batches.
+
+    A first pass fits the scaler (means and variances, ignoring missing
+    values); then each epoch streams the dataset again through partial_fit.
+    Missing values are imputed with the mean, which is 0 once scaled.
+    """
+    feature_columns = _dataset_columns(dataset_path)
+    if not feature_columns:
+        print("No valid feature columns found in dataset.")
+        return
+
+    print("Fitting scaler...")
+    scaler = StandardScaler()
+    holdout = StratifiedReservoir(holdout_size, feature_columns, seed=7)
+    for X, _ in _stream_with_holdout(dataset_path, batch_size, feature_columns, test_size, holdout):
+        if len(X):
+            scaler.partial_fit(X)
+
+    imputer = FunctionTransformer(np.nan_to_num)
+    classifier = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=42)
+
+    print("Training model...")
+    start = time.perf_counter()
+    rows = 0
+    for epoch in range(epochs):
+        # The same rows are held out every epoch; holdout=None skips
+        # sampling them again
+        for X, y in _stream_with_holdout(dataset_path, batch_size, feature_columns, test_size, None):
+            if not len(y):
+                continue
+            classifier.partial_fit(imputer.fit_transform(scaler.transform(X)), y, classes=CLASSES)
+            rows += len(y)
+        print(f"  epoch {epoch + 1}: {rows} rows ({rows / (time.perf_counter() - start):.0f}/s)")
+    _report_training(rows, time.perf_counter() - start)
+
+    if not rows:
+        print("Dataset is empty.")
+        return
+
+    pipeline = Pipeline([('scaler', scaler), ('imputer', imputer), ('classifier', classifier)])
+    X_test, y_test = holdout.sample()
+    metrics = evaluate(pipeline, X_test, y_test, feature_columns)
+    save_model(pipeline, feature_columns, publish, mode='incremental', dataset=str(dataset_path),
+               training_rows=rows, epochs=epochs, metrics=metrics)
+
+
+def latest_dataset():
+    """
+    Return the path of the most recent dataset, or None.
+    """
+    datasets_dir = Path(settings.BASE_DIR) / 'scripts' / 'datasets'
+    datasets = [path for path in datasets_dir.glob('challenge_dataset_*')
+                if path.suffix in ('.parquet', '.arrow', '.csv')]
+    if not datasets:
+        return None
+    return str(sorted(datasets, key=lambda path: path.stem)[-1])  # Most recent file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the trust score model on a challenge dataset.')
+    parser.add_argument('dataset', nargs='?', help='Dataset file (default: the most recent one)')
+    parser.add_argument('--mode', choices=['full', 'reservoir', 'incremental'], default='full',
+                        help='Training mode (see the module docstring)')
+    parser.add_argument('--batch-size', type=int, default=100000, help='Rows read per batch when streaming')
+    parser.add_argument('--sample-size', type=int, default=500000,
+                        help='Reservoir rows per class (incremental mode: held-out rows per class)')
+    parser.add_argument('--epochs', type=int, default=3, help='Passes over the dataset in incremental mode')
+    parser.add_argument('--test-size', type=float, default=0.3, help='Share of rows held out for evaluation')
+    parser.add_argument('--publish', choices=['live', 'shadow'], default=None,
+                        help='Publish the new model version under this alias')
+    args = parser.parse_args()
+
+    # Use the most recent dataset if none is given
+    dataset_path = args.dataset or latest_dataset()
+    if dataset_path is None:
+        print("No datasets found. Please generate a dataset first.")
+        sys.exit(1)
 
-if __name__ == "__main__":
-    # Check if dataset path is provided
-    if len(sys.argv) > 1:
-        dataset_path = sys.argv[1]
-    else:
-        # Use the most recent dataset if available
-        datasets_dir = Path(settings.BASE_DIR) / 'scripts' / 'datasets'
-        if datasets_dir.exists():
-            datasets = list(datasets_dir.glob('*.csv'))
-            if datasets:
-                dataset_path = str(sorted(datasets)[-1])  # Most recent file
-            else:
-                print("No datasets found. Please generate a dataset first.")
-                sys.exit(1)
-        else:
-            print("Datasets directory not found. Please generate a dataset first.")
-            sys.exit(1)
-    
     print(f"Using dataset: {dataset_path}")
-    train_scoring_model(dataset_path)
+    if args.mode == 'reservoir':
+        train_subsampled_model(dataset_path, args.batch_size, args.sample_size, args.test_size, args.publish)
+    elif args.mode == 'incremental':
+        train_incremental_model(dataset_path, args.batch_size, args.epochs, args.test_size, args.sample_size,
+                                args.publish)
+    else:
+        train_scoring_model(dataset_path, args.publish)
+
+
+if __name__ == "__main__":
+    main()
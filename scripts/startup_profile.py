@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Measure worker cold-start cost: import time, warm-up time and first-request latency.
+
+Each scenario runs in a fresh interpreter:
+  cold    - import the WSGI application and serve requests straight away
+  prewarm - run api.warmup.warm_up() first, as a preloaded gunicorn master does
+
+Requests are served by the Django test client against a throwaway test database.
+"""
+import os
+import sys
+import json
+import subprocess
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_child(mode):
+    """
+    Import the application, optionally warm it up, and time two request rounds.
+    """
+    start = time.perf_counter()
+    sys.path.append(str(PROJECT_ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings')
+    from humanauth.wsgi import application  # noqa: F401 - the import is what we time
+    import_seconds = time.perf_counter() - start
+
+    warmup_seconds = 0.0
+    if mode == 'prewarm':
+        from api.warmup import warm_up
+        start = time.perf_counter()
+        warm_up()
+        warmup_seconds = time.perf_counter() - start
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from rest_framework.test import APIClient
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+    def request_round():
+        client = APIClient()
+        timings = {}
+
+        start = time.perf_counter()
+        session_id = client.post('/api/init-session/', {'fingerprint_id': 'startup-profile'},
+                                 format='json').data['session_id']
+        timings['init-session'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        challenge = client.get('/api/get-challenge/', {'session_id': session_id}).data['challenge']
+        timings['get-challenge'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        client.post('/api/submit-challenge/', {
+            'session_id': str(session_id),
+            'challenge_type': challenge['type'],
+            'response_data': {},
+            'behavior_data': {
+                'mouse_movements': [{'x': i, 'y': i * 2 % 300, 'timestamp': i * 16} for i in range(200)],
+                'keystroke_timings': [{'timestamp': i * 120} for i in range(10)],
+            },
+        }, format='json')
+        timings['submit-challenge'] = time.perf_counter() - start
+        return timings
+
+    first = request_round()
+    second = request_round()
+    print(json.dumps({
+        'import': import_seconds,
+        'warmup': warmup_seconds,
+        'first': first,
+        'second': second,
+    }))
+
+
+def import_time_report(top=15):
+    """
+    Return the slowest cumulative imports of the WSGI application, from -X importtime.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'humanauth.settings'); "
+         "import humanauth.wsgi"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, env={**os.environ, 'HUMANAUTH_PREWARM': 'False'},
+    )
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line.split(':', 1)[1].split('|')]
+        rows.append((int(cumulative_us), int(self_us), name))
+
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    print("Slowest imports of humanauth.wsgi (cumulative ms, self ms):")
+    for cumulative_us, self_us, name in import_time_report():
+        print(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}")
+
+    for mode in ('cold', 'prewarm'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', mode],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+            env={**os.environ, 'HUMANAUTH_PREWARM': 'False', 'ADMISSION_CONTROL_ENABLED': 'False'},
+        ).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+
+        print(f"\n{mode}: import {report['import'] * 1000:.1f}ms, warm-up {report['warmup'] * 1000:.1f}ms")
+        for endpoint, first in report['first'].items():
+            print(f"  {endpoint:<18} first {first * 1000:7.2f}ms   "
+                  f"second {report['second'][endpoint] * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        run_child(sys.argv[2])
+    else:
+        main()